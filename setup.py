@@ -30,6 +30,7 @@ setup(name='taskr',
       packages=find_packages(),
       install_requires=[
           'six>=1.8.0',
+          'futures>=3.0.0; python_version < "3"',
       ],
       classifiers=[
           'Development Status :: 3 - Alpha',
@@ -14,12 +14,17 @@
 # limitations under the License.
 #
 from __future__ import unicode_literals, division, absolute_import, print_function
+import io
+import os
 import sys
 from .taskr import TaskManager, Task
 from .terminal import Console
 from .terminal import Color
 
 task = TaskManager()
-console = Console(sys.stdout)
+Console.task_manager = task
+_console_file = os.environ.get('TASKR_CONSOLE_FILE', None)
+console = Console(io.open(_console_file, 'a', encoding='utf-8') if _console_file else sys.stdout,
+                  buffered=bool(_console_file) or int(os.environ.get('TASKR_CONSOLE_BUFFERED', '0')) != 0)
 
 __all__ = [TaskManager.__name__, Task.__name__, Console.__name__, Color.__name__, 'task', 'console']
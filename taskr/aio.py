@@ -0,0 +1,136 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+asyncio support of tasks. (Python 3 only)
+"""
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import asyncio
+import concurrent.futures
+import functools
+import inspect
+
+
+def is_coroutine_function(callable_obj):
+    """
+    :type callable_obj: callable
+    :rtype: bool
+    """
+    if inspect.isfunction(callable_obj) or inspect.ismethod(callable_obj):
+        return asyncio.iscoroutinefunction(callable_obj)
+    return asyncio.iscoroutinefunction(getattr(callable_obj, '__call__', None))
+
+
+def running_loop():
+    """
+    :rtype: asyncio.AbstractEventLoop
+    """
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def run(coroutine):
+    """
+    Run the coroutine on a new event loop. If it's interrupted by Ctrl-C or a timeout, the coroutine is cancelled and
+    waited before the exception is raised again.
+    """
+    loop = asyncio.new_event_loop()
+    future = asyncio.ensure_future(coroutine, loop=loop)
+    try:
+        try:
+            return loop.run_until_complete(future)
+        except BaseException:
+            future.cancel()
+            try:
+                loop.run_until_complete(future)
+            except BaseException:
+                pass
+            raise
+    finally:
+        try:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            loop.close()
+
+
+def _run_sync(done, function):
+    """
+    Run a regular task on an executor thread and report it to `done`, which can still be cancelled until it starts.
+
+    :type done: concurrent.futures.Future
+    :type function: callable
+    """
+    if not done.set_running_or_notify_cancel():
+        return
+    try:
+        result = function()
+    except BaseException as e:
+        done.set_exception(e)
+    else:
+        done.set_result(result)
+
+
+async def gather(invocations):
+    """
+    Run tasks concurrently on the running loop. Regular tasks run on the default executor of the loop.
+    If one of them failed or the whole run is cancelled, the others are cancelled, and `cleanup_function` of each
+    failed or cancelled task is called. A regular task which already started can't be cancelled, so it's waited
+    before cleanup functions are called.
+
+    :param invocations: task objects, or (task object, args, kwargs) tuples
+    :type invocations: list[taskr.taskr.Task|(taskr.taskr.Task, tuple, dict)]
+    :return: results of tasks
+    :rtype: list
+    """
+    loop = asyncio.get_running_loop()
+    tasks = []
+    futures = []
+    outcomes = []
+    for invocation in invocations:
+        if isinstance(invocation, tuple):
+            task = invocation[0]
+            args = invocation[1] if len(invocation) > 1 else ()
+            kwargs = invocation[2] if len(invocation) > 2 else {}
+        else:
+            task, args, kwargs = invocation, (), {}
+        tasks.append(task)
+        if task.is_coroutine:
+            future = asyncio.ensure_future(task(*args, **kwargs))
+            outcomes.append(future)
+        else:
+            # Cancelling the future of `run_in_executor` doesn't stop a running thread, so track the thread by `done`.
+            done = concurrent.futures.Future()
+            loop.run_in_executor(None, _run_sync, done, functools.partial(task, *args, **kwargs))
+            future = asyncio.wrap_future(done)
+            outcomes.append(done)
+        futures.append(future)
+
+    try:
+        return await asyncio.gather(*futures)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        await asyncio.wait(futures)
+        running = [asyncio.wrap_future(outcome) for outcome in outcomes
+                   if isinstance(outcome, concurrent.futures.Future) and not outcome.done()]
+        if running:
+            await asyncio.wait(running)
+        for task, outcome in zip(tasks, outcomes):
+            if outcome.cancelled() or outcome.exception() is not None:
+                task.cleanup_function(task)
+        raise
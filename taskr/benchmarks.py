@@ -0,0 +1,434 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Benchmarks of the overhead of taskr itself.
+
+Run them by `python -m taskr.benchmarks --output before.json`, and compare two runs by
+`python -m taskr.benchmarks --compare before.json after.json`. Every result is seconds per operation, or bytes
+per task for memory benchmarks, so a bigger value is worse. Comparing exits with 1 if any benchmark is worse than the
+threshold.
+"""
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+from collections import OrderedDict
+from timeit import default_timer
+
+import six
+
+import taskr
+from taskr.contrib.system import run
+from taskr.taskr import TaskManager
+from taskr.terminal import Console, Progress
+
+_RESULT_FORMAT_VERSION = 1
+_package_root = os.path.dirname(os.path.dirname(os.path.abspath(taskr.__file__)))
+benchmarks = OrderedDict()
+""":type: OrderedDict[str, (callable, str)]"""
+
+
+def benchmark(name, unit='s'):
+    """
+    Register a function as a benchmark. The function takes the number of repeats and returns the value of each repeat.
+
+    :param unit: 's' for seconds per operation, or 'B' for bytes
+    :type name: str
+    :type unit: str
+    """
+    def decorator(func):
+        benchmarks[name] = (func, unit)
+        return func
+    return decorator
+
+
+def median(values):
+    """
+    >>> median([3, 1, 2])
+    2
+    >>> median([4, 1, 2, 3])
+    2.5
+
+    :type values: list[float]
+    :rtype: float
+    """
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+def _make_synthetic_function(idx):
+    def synthetic_task(source, destination, verbose=False, retries=3, label='default', *extra):
+        """
+        A synthetic task for benchmarks.
+
+        :param source: where to read
+        :param destination: where to write
+        :param verbose: show details
+        :param retries: number of retries
+        :param label: label of this run
+        :param extra: extra arguments
+        """
+    synthetic_task.__name__ = str('synthetic_task_{}'.format(idx))
+    return synthetic_task
+
+
+def _make_simple_function(idx):
+    def synthetic_task(source, destination, verbose=False, retries=3, label='default'):
+        """
+        A synthetic task whose arguments can be parsed without argparse.
+
+        :param source: where to read
+        :param destination: where to write
+        :param verbose: show details
+        :param retries: number of retries
+        :param label: label of this run
+        """
+    synthetic_task.__name__ = str('synthetic_task_{}'.format(idx))
+    return synthetic_task
+
+
+def synthetic_task_manager(task_count, simple=False):
+    """
+    :param simple: tasks have no varargs, so they're parsed without argparse in lazy mode
+    :type task_count: int
+    :type simple: bool
+    :rtype: TaskManager
+    """
+    manager = TaskManager()
+    manager.metadata_cache = None
+    make_function = _make_simple_function if simple else _make_synthetic_function
+    for idx in range(task_count):
+        manager(make_function(idx))
+    return manager
+
+
+def _time_dispatch(task_count, repeat, lazy, simple=False):
+    args = ['synthetic-task-0', 'src', 'dst', '--verbose', '--retries', '5']
+    samples = []
+    for _ in range(repeat):
+        manager = synthetic_task_manager(task_count, simple)
+        start = default_timer()
+        # noinspection PyProtectedMember
+        exit_code = manager._dispatch_for_exit_code(args, lazy=lazy)
+        samples.append(default_timer() - start)
+        assert exit_code == 0, 'Synthetic dispatch failed with {}'.format(exit_code)
+    return samples
+
+
+def _register_dispatch_benchmarks():
+    for task_count in (1, 100, 1000):
+        for lazy in (False, True):
+            name = 'dispatch{}_{}_tasks'.format('_lazy' if lazy else '', task_count)
+            benchmark(name)(lambda repeat, _count=task_count, _lazy=lazy: _time_dispatch(_count, repeat, _lazy))
+        benchmark('dispatch_lazy_simple_{}_tasks'.format(task_count))(
+            lambda repeat, _count=task_count: _time_dispatch(_count, repeat, lazy=True, simple=True))
+
+
+_register_dispatch_benchmarks()
+
+
+@benchmark('import_taskr')
+def import_taskr(repeat):
+    code = ('from timeit import default_timer; start = default_timer(); import taskr; '
+            'print(default_timer() - start)')
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [_package_root, env.get('PYTHONPATH', None)]))
+    return [float(subprocess.check_output([sys.executable, '-c', code], env=env).decode('utf-8'))
+            for _ in range(repeat)]
+
+
+@benchmark('setup_argparser_per_task')
+def setup_argparser_per_task(repeat, task_count=100):
+    samples = []
+    for _ in range(repeat):
+        manager = synthetic_task_manager(task_count)
+        tasks = list(manager.tasks)
+        for task in tasks:
+            task.metadata  # Parsing docstrings is measured separately
+        start = default_timer()
+        for task in tasks:
+            task.setup_argparser()
+        samples.append((default_timer() - start) / task_count)
+    return samples
+
+
+@benchmark('parse_doc_str_per_task')
+def parse_doc_str_per_task(repeat, task_count=100, loops=10):
+    tasks = list(synthetic_task_manager(task_count).tasks)
+    samples = []
+    for _ in range(repeat):
+        start = default_timer()
+        for _ in range(loops):
+            for task in tasks:
+                task.parse_doc_str()
+        samples.append((default_timer() - start) / (task_count * loops))
+    return samples
+
+
+@benchmark('console_show_per_message')
+def console_show_per_message(repeat, message_count=10000):
+    samples = []
+    for _ in range(repeat):
+        console = Console(io.StringIO())
+        start = default_timer()
+        for idx in range(message_count):
+            console.info('message {}'.format(idx))
+        samples.append((default_timer() - start) / message_count)
+    return samples
+
+
+@benchmark('console_show_buffered_per_message')
+def console_show_buffered_per_message(repeat, message_count=10000):
+    samples = []
+    for _ in range(repeat):
+        console = Console(io.StringIO(), buffered=True)
+        start = default_timer()
+        for idx in range(message_count):
+            console.info('message {}'.format(idx))
+        console.flush()
+        samples.append((default_timer() - start) / message_count)
+    return samples
+
+
+@benchmark('console_json_per_message')
+def console_json_per_message(repeat, message_count=10000):
+    samples = []
+    for _ in range(repeat):
+        console = Console(io.StringIO(), buffered=True, output_format='json')
+        start = default_timer()
+        for idx in range(message_count):
+            console.info('message {}'.format(idx))
+        console.flush()
+        samples.append((default_timer() - start) / message_count)
+    return samples
+
+
+@benchmark('console_suppressed_per_message')
+def console_suppressed_per_message(repeat, message_count=100000):
+    samples = []
+    for _ in range(repeat):
+        console = Console(io.StringIO(), min_level='warn')
+        start = default_timer()
+        for _ in range(message_count):
+            console.debug('message')
+        samples.append((default_timer() - start) / message_count)
+    return samples
+
+
+@benchmark('progress_update_per_iteration')
+def progress_update_per_iteration(repeat, iteration_count=1000000):
+    samples = []
+    for _ in range(repeat):
+        output = io.StringIO()
+        progress = Progress('benchmark', total=iteration_count, output=output, interval=0.1)
+        start = default_timer()
+        for _ in range(iteration_count):
+            progress.update()
+        progress.close()
+        samples.append((default_timer() - start) / iteration_count)
+    return samples
+
+
+def _traced_task_memory(task_count, setup_parsers=False, release_parsers=False):
+    """
+    :type task_count: int
+    :type setup_parsers: bool
+    :type release_parsers: bool
+    :return: bytes per task
+    :rtype: float
+    """
+    import tracemalloc
+    functions = [_make_synthetic_function(idx) for idx in range(task_count)]
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        manager = TaskManager()
+        manager.metadata_cache = None
+        for func in functions:
+            manager(func)
+        if setup_parsers:
+            # noinspection PyProtectedMember
+            manager._setup_argparsers(manager.tasks)
+        if release_parsers:
+            manager.release_parsers()
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (after - before) / task_count
+
+
+@benchmark('task_memory', unit='B')
+def task_memory(repeat, task_count=1000):
+    return [_traced_task_memory(task_count, setup_parsers=False) for _ in range(repeat)]
+
+
+@benchmark('task_memory_with_parser', unit='B')
+def task_memory_with_parser(repeat, task_count=1000):
+    return [_traced_task_memory(task_count, setup_parsers=True) for _ in range(repeat)]
+
+
+@benchmark('task_memory_after_release_parsers', unit='B')
+def task_memory_after_release_parsers(repeat, task_count=1000):
+    return [_traced_task_memory(task_count, setup_parsers=True, release_parsers=True) for _ in range(repeat)]
+
+
+@benchmark('gc_collect_1000_tasks')
+def gc_collect_1000_tasks(repeat, task_count=1000):
+    manager = synthetic_task_manager(task_count)
+    # noinspection PyProtectedMember
+    manager._setup_argparsers(manager.tasks)
+    samples = []
+    for _ in range(repeat):
+        start = default_timer()
+        gc.collect()
+        samples.append(default_timer() - start)
+    return samples
+
+
+@benchmark('system_run_spawn')
+def system_run_spawn(repeat, loops=10):
+    samples = []
+    for _ in range(repeat):
+        start = default_timer()
+        for _ in range(loops):
+            run('true')
+        samples.append((default_timer() - start) / loops)
+    return samples
+
+
+def run_benchmarks(names=None, repeat=5):
+    """
+    :param names: names of benchmarks to run. default is all of them
+    :type names: list[str]
+    :type repeat: int
+    :rtype: dict
+    """
+    results = OrderedDict()
+    for name, (func, unit) in benchmarks.items():
+        if names and name not in names:
+            continue
+        samples = func(repeat)
+        results[name] = OrderedDict([
+            ('unit', unit),
+            ('median', median(samples)),
+            ('min', min(samples)),
+            ('max', max(samples)),
+            ('samples', samples),
+        ])
+    return OrderedDict([
+        ('version', _RESULT_FORMAT_VERSION),
+        ('python', platform.python_version()),
+        ('implementation', platform.python_implementation()),
+        ('platform', platform.platform()),
+        ('repeat', repeat),
+        ('results', results),
+    ])
+
+
+def compare(old, new, threshold=0.1):
+    """
+    Compare medians of two runs.
+
+    >>> old = {'results': {'a': {'median': 1.0}, 'b': {'median': 1.0}, 'c': {'median': 1.0}}}
+    >>> new = {'results': {'a': {'median': 1.05}, 'b': {'median': 1.5}, 'd': {'median': 1.0}}}
+    >>> [(name, round(ratio, 2), regressed) for name, ratio, regressed in compare(old, new)]
+    [('a', 1.05, False), ('b', 1.5, True)]
+
+    :param threshold: a benchmark is regressed if it's slower than this ratio. e.g. 0.1 means 10% slower
+    :type old: dict
+    :type new: dict
+    :type threshold: float
+    :return: (name, ratio of new to old, regressed) of benchmarks in both runs
+    :rtype: list[(str, float, bool)]
+    """
+    comparison = []
+    for name in sorted(set(old['results']) & set(new['results'])):
+        old_value = old['results'][name]['median']
+        new_value = new['results'][name]['median']
+        ratio = new_value / old_value if old_value else float('inf') if new_value else 1.0
+        comparison.append((name, ratio, ratio > 1 + threshold))
+    return comparison
+
+
+def _format_value(value, unit='s'):
+    """
+    >>> _format_value(0.0000123)
+    '12.30us'
+    >>> _format_value(1.5)
+    '1.500s'
+    >>> _format_value(2048, 'B')
+    '2.00KiB'
+
+    :type value: float
+    :type unit: str
+    :rtype: str
+    """
+    if unit == 'B':
+        return '{:.2f}KiB'.format(value / 1024)
+    elif value >= 1:
+        return '{:.3f}s'.format(value)
+    elif value >= 0.001:
+        return '{:.2f}ms'.format(value * 1000)
+    return '{:.2f}us'.format(value * 1000000)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='python -m taskr.benchmarks', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='Number of samples of each benchmark')
+    parser.add_argument('-o', '--output', help='Write results to this file instead of stdout')
+    parser.add_argument('-b', '--benchmark', action='append', dest='names', choices=list(benchmarks),
+                        help='Run this benchmark only. It can be repeated')
+    parser.add_argument('-c', '--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two results')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                        help='Ratio of slowdown (or growth of memory) regarded as a regression when comparing')
+    options = parser.parse_args(args)
+
+    if options.compare:
+        old_path, new_path = options.compare
+        with io.open(old_path, encoding='utf-8') as f:
+            old = json.load(f)
+        with io.open(new_path, encoding='utf-8') as f:
+            new = json.load(f)
+        console = Console(sys.stdout)
+        comparison = compare(old, new, options.threshold)
+        for name, ratio, regressed in comparison:
+            unit = new['results'][name].get('unit', 's')
+            (console.error if regressed else console.info)('{}: {} -> {} ({:+.1f}%)'.format(
+                name, _format_value(old['results'][name]['median'], unit),
+                _format_value(new['results'][name]['median'], unit), (ratio - 1) * 100))
+        return 1 if any(regressed for _, _, regressed in comparison) else 0
+
+    content = json.dumps(run_benchmarks(options.names, options.repeat), indent=2)
+    if options.output:
+        with io.open(options.output, 'w', encoding='utf-8') as f:
+            f.write(six.text_type(content + '\n'))
+    else:
+        print(content)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,252 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import hashlib
+import os
+import sys
+import tempfile
+import types
+
+import six
+from six.moves import cPickle as pickle
+
+_METADATA_CACHE_VERSION = 2
+_plain_value_types = (type(None), bool, int, float) + six.string_types + (six.binary_type,) + six.integer_types
+
+
+def cache_dir(*components):
+    """
+    Directory for files cached by taskr. It's `$TASKR_CACHE_DIR` or `~/.cache/taskr`.
+
+    :type components: str
+    :rtype: str
+    """
+    root = os.environ.get('TASKR_CACHE_DIR', None) or os.path.join(os.path.expanduser('~'), '.cache', 'taskr')
+    return os.path.join(root, *components)
+
+
+def write_file_atomically(path, content):
+    """
+    :type path: str
+    :type content: bytes
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.taskr-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        getattr(os, 'replace', os.rename)(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def _is_plain_value(value):
+    """
+    >>> _is_plain_value((1, 'a', None))
+    True
+    >>> _is_plain_value(object())
+    False
+
+    :rtype: bool
+    """
+    if isinstance(value, _plain_value_types):
+        return True
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        return all(map(_is_plain_value, value))
+    elif isinstance(value, dict):
+        return all(map(_is_plain_value, value.keys())) and all(map(_is_plain_value, value.values()))
+    return False
+
+
+def _stable_repr(value):
+    """
+    Like `repr`, but functions and classes are represented by their names and dicts are sorted, so it's the same in
+    every process. Other objects which are represented by their addresses are not, so they never match.
+
+    >>> print(_stable_repr({'type': int, 'choices': ['a', 'b'], 'default': None}))
+    {'choices': ['a', 'b'], 'default': None, 'type': builtins.int}
+
+    :rtype: str
+    """
+    if isinstance(value, dict):
+        items = sorted((_stable_repr(key), _stable_repr(item)) for key, item in value.items())
+        return '{{{}}}'.format(', '.join('{}: {}'.format(key, item) for key, item in items))
+    elif isinstance(value, (list, tuple)):
+        template = '[{}]' if isinstance(value, list) else '({})'
+        return template.format(', '.join(map(_stable_repr, value)))
+    elif isinstance(value, (set, frozenset)):
+        return '{{{}}}'.format(', '.join(sorted(map(_stable_repr, value))))
+    elif isinstance(value, (type, types.FunctionType, types.BuiltinFunctionType)):
+        return '{}.{}'.format(value.__module__, getattr(value, '__qualname__', value.__name__))
+    return repr(value)
+
+
+def _file_stamp(path):
+    """
+    :return: mtime and size of the file, or `None` if it doesn't exist
+    :rtype: (float, int)
+    """
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+def _taskfile_path():
+    """
+    :return: path of the script which is run, where tasks are usually registered
+    :rtype: str
+    """
+    path = getattr(sys.modules.get('__main__', None), '__file__', None)
+    return os.path.abspath(path) if path else None
+
+
+class TaskMetadataCache(object):
+    """
+    On-disk cache of `Task.metadata`. There's one cache file for each module where tasks are defined. The file is
+    invalidated when the mtime or size of the module source file or the taskfile changes. Declarations of arguments
+    are compared too, since they may come from other modules.
+    """
+
+    def __init__(self, directory=None):
+        """
+        :type directory: str
+        """
+        self.directory = directory or cache_dir('metadata')
+        self.hits = 0
+        self.rebuilds = 0
+        self._modules = {}
+        """:type: dict[str, dict]"""
+
+    def __repr__(self):
+        return '<TaskMetadataCache: {} hits, {} rebuilds>'.format(self.hits, self.rebuilds)
+
+    @staticmethod
+    def _source_path(task):
+        """
+        :type task: taskr.taskr.Task
+        :rtype: str
+        """
+        module = sys.modules.get(getattr(task.callable, '__module__', None), None)
+        source_path = getattr(module, '__file__', None)
+        if not source_path:
+            return None
+        if source_path.endswith(('.pyc', '.pyo')):
+            source_path = source_path[:-1]
+        return os.path.abspath(source_path)
+
+    @staticmethod
+    def _task_key(task):
+        """
+        Declarations which are not part of the source of the callable but change its metadata.
+
+        :type task: taskr.taskr.Task
+        :rtype: tuple
+        """
+        manual_arguments = _stable_repr(list(task.manual_arguments.items()))
+        return (task.name, task.auto_create_short_arguments, task.pass_argparse_namespace,
+                hashlib.md5(manual_arguments.encode('utf-8')).hexdigest())
+
+    def _cache_path(self, source_path):
+        """
+        :type source_path: str
+        :rtype: str
+        """
+        return os.path.join(self.directory, hashlib.md5(source_path.encode('utf-8')).hexdigest() + '.pickle')
+
+    def _module(self, source_path):
+        """
+        :type source_path: str
+        :rtype: dict
+        """
+        if source_path not in self._modules:
+            source_stamp = _file_stamp(source_path)
+            stamp = None
+            if source_stamp:
+                stamp = (_METADATA_CACHE_VERSION, tuple(sys.version_info[:2]), source_stamp,
+                         _file_stamp(_taskfile_path()))
+
+            module = {'stamp': stamp, 'tasks': {}, 'dirty': False}
+            if stamp:
+                try:
+                    with open(self._cache_path(source_path), 'rb') as f:
+                        cached_module = pickle.load(f)
+                except Exception:
+                    pass
+                else:
+                    if isinstance(cached_module, dict) and cached_module.get('stamp') == stamp:
+                        module['tasks'] = cached_module['tasks']
+            self._modules[source_path] = module
+        return self._modules[source_path]
+
+    @staticmethod
+    def _is_cacheable(metadata):
+        """
+        Only plain default values are cached, since unpickled ones aren't identical to the ones in the source.
+
+        :type metadata: dict
+        :rtype: bool
+        """
+        if not all(map(_is_plain_value, metadata['kwargs'].values())):
+            return False
+        for _, _, arg_kwargs in metadata['arguments']:
+            if not _is_plain_value(arg_kwargs.get('default', None)):
+                return False
+        try:
+            pickle.dumps(metadata, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return False
+        return True
+
+    def metadata(self, task):
+        """
+        :type task: taskr.taskr.Task
+        :rtype: dict
+        """
+        source_path = self._source_path(task)
+        module = self._module(source_path) if source_path else None
+        if module and module['stamp']:
+            task_key = self._task_key(task)
+            cached_task = module['tasks'].get(task.name, None)
+            if cached_task and cached_task[0] == task_key:
+                self.hits += 1
+                task.metadata_from_cache = True
+                return cached_task[1]
+
+        self.rebuilds += 1
+        task.metadata_from_cache = False
+        metadata = task.build_metadata()
+        if module and module['stamp'] and self._is_cacheable(metadata):
+            module['tasks'][task.name] = (self._task_key(task), metadata)
+            module['dirty'] = True
+        return metadata
+
+    def save(self):
+        for source_path, module in self._modules.items():
+            if not module['dirty']:
+                continue
+            content = pickle.dumps({'stamp': module['stamp'], 'tasks': module['tasks']}, pickle.HIGHEST_PROTOCOL)
+            try:
+                write_file_atomically(self._cache_path(source_path), content)
+            except (IOError, OSError):
+                pass  # The cache is an optimization only
+            else:
+                module['dirty'] = False
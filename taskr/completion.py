@@ -0,0 +1,296 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Static bash and zsh completion scripts of a taskfile.
+
+Action names, aliases, option strings and choices are embedded in the script, so pressing TAB never starts Python.
+The script regenerates itself when the taskfile is newer than the script.
+
+    $ python -m taskr.completion bash taskfile.py --output ~/.taskfile-completion.bash
+    $ source ~/.taskfile-completion.bash
+"""
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import argparse
+import hashlib
+import io
+import os
+import re
+import runpy
+import sys
+from collections import OrderedDict
+
+import six
+from six.moves import shlex_quote
+
+_COMPLETION_FORMAT_VERSION = 2
+_stamp_pattern = re.compile(r'^# taskr-completion-stamp: (\S+)$', re.MULTILINE)
+SHELLS = ('bash', 'zsh')
+
+
+def _words(words):
+    """
+    Quote words for `compgen -W`. Words with whitespace cannot be completed by it, so they are dropped.
+
+    >>> print(_words(['--name', 'a b', "it's"]))
+    '--name it'"'"'s'
+
+    :type words: list[str]
+    :rtype: str
+    """
+    return shlex_quote(' '.join(word for word in words if not re.search(r'\s', word)))
+
+
+def _parser_index(parser):
+    """
+    :type parser: argparse.ArgumentParser
+    :return: words to complete, and choices of each option which takes a value (`None` if it has no choices)
+    :rtype: (list[str], OrderedDict[str, list[str]])
+    """
+    words = []
+    option_values = OrderedDict()
+    # noinspection PyProtectedMember
+    for action in parser._actions:
+        if isinstance(action, argparse._SubParsersAction):
+            continue
+        choices = [six.text_type(choice) for choice in action.choices] if action.choices else None
+        if action.option_strings:
+            words.extend(action.option_strings)
+            if action.nargs != 0:
+                for option_string in action.option_strings:
+                    option_values[option_string] = choices
+        elif choices:
+            words.extend(choices)
+    return words, option_values
+
+
+def completion_index(manager):
+    """
+    :type manager: taskr.taskr.TaskManager
+    :return: (names of the task, words to complete, choices of options) of each task
+    :rtype: list[(list[str], list[str], OrderedDict[str, list[str]])]
+    """
+    # noinspection PyProtectedMember
+    manager._setup_argparsers(manager.tasks)
+    index = []
+    for task in sorted(manager.tasks, key=lambda _task: _task.name):
+        words, option_values = _parser_index(task.parser)
+        index.append(([task.name] + list(task.aliases), words, option_values))
+    return index
+
+
+def _case_of_option_values(option_values, indent):
+    """
+    :type option_values: OrderedDict[str, list[str]]
+    :type indent: str
+    :rtype: list[str]
+    """
+    if not option_values:
+        return []
+    lines = ['{}case "$prev" in'.format(indent)]
+    for option_string, choices in option_values.items():
+        if choices:
+            lines.append('{}    {}) COMPREPLY=( $(compgen -W {} -- "$cur") ); return;;'.format(
+                indent, shlex_quote(option_string), _words(choices)))
+        else:
+            # Let the shell complete file names
+            lines.append('{}    {}) COMPREPLY=(); return;;'.format(indent, shlex_quote(option_string)))
+    lines.append('{}esac'.format(indent))
+    return lines
+
+
+def taskfile_stamp(taskfile, shell=None, prog_names=()):
+    """
+    :param shell: the script of another shell or other command names is different even if the taskfile is the same
+    :type taskfile: str
+    :type shell: str
+    :type prog_names: list[str]
+    :rtype: str
+    """
+    hash_obj = hashlib.md5('{}:{}:{}:{}:'.format(_COMPLETION_FORMAT_VERSION, os.path.abspath(taskfile), shell,
+                                                 ' '.join(prog_names)).encode('utf-8'))
+    with open(taskfile, 'rb') as f:
+        hash_obj.update(f.read())
+    return hash_obj.hexdigest()
+
+
+def completion_script(manager, shell, prog_names, taskfile=None, python=None):
+    """
+    :param shell: 'bash' or 'zsh'
+    :param prog_names: command names to complete. e.g. ['taskfile.py', './taskfile.py']
+    :param taskfile: path of the taskfile. The script regenerates itself when it's changed
+    :param python: interpreter to regenerate the script. default is the current one
+    :type manager: taskr.taskr.TaskManager
+    :type shell: str
+    :type prog_names: list[str]
+    :type taskfile: str
+    :type python: str
+    :rtype: str
+    """
+    if shell not in SHELLS:
+        raise ValueError('Unknown shell: {}. Should be one of {}'.format(shell, ', '.join(SHELLS)))
+    function_name = '_taskr_complete_' + re.sub(r'\W', '_', os.path.basename(prog_names[0]))
+    index = completion_index(manager)
+    global_words, global_option_values = _parser_index(manager.global_parser)
+    global_words = ['-h', '--help'] + global_words
+    action_names = [name for names, _, _ in index for name in names]
+
+    lines = ['# Completion of {} generated by taskr. Do not edit.'.format(' '.join(prog_names))]
+    if taskfile:
+        lines.append('# taskr-completion-stamp: {}'.format(taskfile_stamp(taskfile, shell, prog_names)))
+    if shell == 'zsh':
+        lines.extend(['autoload -U +X bashcompinit && bashcompinit',
+                      '{}_script="${{(%):-%x}}"'.format(function_name)])
+    else:
+        lines.append('{}_script="${{BASH_SOURCE[0]}}"'.format(function_name))
+    lines.extend([
+        '',
+        '{}() {{'.format(function_name),
+        '    [[ -n "${ZSH_VERSION-}" ]] && setopt local_options ksh_arrays',
+        '    local cur="${COMP_WORDS[COMP_CWORD]}" prev="${COMP_WORDS[COMP_CWORD-1]}" action="" word i',
+    ])
+    if taskfile:
+        script_path = '"${}_script"'.format(function_name)
+        regenerate_command = ' '.join(
+            [shlex_quote(arg) for arg in (python or sys.executable, '-m', 'taskr.completion', shell,
+                                          os.path.abspath(taskfile))] +
+            ['--output', script_path] +
+            [shlex_quote(arg) for prog_name in prog_names for arg in ('--prog', prog_name)])
+        lines.extend([
+            '    if [[ {} -nt {} ]]; then'.format(shlex_quote(os.path.abspath(taskfile)), script_path),
+            '        {} >/dev/null 2>&1 && source {} && {{ {} "$@"; return; }}'.format(
+                regenerate_command, script_path, function_name),
+            '    fi',
+        ])
+    lines.extend([
+        '    for ((i = 1; i < COMP_CWORD; i++)); do',
+        '        word="${COMP_WORDS[i]}"',
+        '        case "$word" in',
+    ])
+    if global_option_values:
+        lines.append('            {}) ((i++));;'.format('|'.join(map(shlex_quote, global_option_values))))
+    lines.extend([
+        '            -*) ;;',
+        '            *) action="$word"; break;;',
+        '        esac',
+        '    done',
+        '    if [[ -z "$action" ]]; then',
+    ])
+    lines.extend(_case_of_option_values(global_option_values, ' ' * 8))
+    lines.extend([
+        '        COMPREPLY=( $(compgen -W {} -- "$cur") )'.format(_words(action_names + global_words)),
+        '        return',
+        '    fi',
+        '    case "$action" in',
+    ])
+    for names, words, option_values in index:
+        lines.append('        {})'.format('|'.join(map(shlex_quote, names))))
+        lines.extend(_case_of_option_values(option_values, ' ' * 12))
+        lines.append('            COMPREPLY=( $(compgen -W {} -- "$cur") );;'.format(_words(words)))
+    lines.extend([
+        '    esac',
+        '}',
+        'complete -o default -F {} {}'.format(function_name, ' '.join(map(shlex_quote, prog_names))),
+        '',
+    ])
+    return '\n'.join(lines)
+
+
+def is_completion_script_current(shell, path, prog_names, taskfile):
+    """
+    Whether the script was generated from the same taskfile for the same shell and command names. A current script
+    is touched, so it's newer than the taskfile.
+
+    :type shell: str
+    :type path: str
+    :type prog_names: list[str]
+    :type taskfile: str
+    :rtype: bool
+    """
+    if not os.path.exists(path):
+        return False
+    with io.open(path, encoding='utf-8') as f:
+        stamp_match = _stamp_pattern.search(f.read())
+    if stamp_match and stamp_match.group(1) == taskfile_stamp(taskfile, shell, prog_names):
+        os.utime(path, None)
+        return True
+    return False
+
+
+def write_completion_script(manager, shell, path, prog_names, taskfile):
+    """
+    Write the script unless it's current. See `is_completion_script_current`.
+
+    :type manager: taskr.taskr.TaskManager
+    :type shell: str
+    :type path: str
+    :type prog_names: list[str]
+    :type taskfile: str
+    :return: whether the script is written
+    :rtype: bool
+    """
+    if is_completion_script_current(shell, path, prog_names, taskfile):
+        return False
+    content = completion_script(manager, shell, prog_names, taskfile)
+    with io.open(path, 'w', encoding='utf-8') as f:
+        f.write(six.text_type(content))
+    return True
+
+
+def load_task_manager(taskfile):
+    """
+    Run the taskfile without dispatching, and find its task manager. It's the first `TaskManager` in the taskfile,
+    or `taskr.task`.
+
+    :type taskfile: str
+    :rtype: taskr.taskr.TaskManager
+    """
+    from . import task
+    from .taskr import TaskManager
+    sys.path.insert(0, os.path.dirname(os.path.abspath(taskfile)))
+    namespace = runpy.run_path(taskfile, run_name='__taskr_completion__')
+    for value in namespace.values():
+        if isinstance(value, TaskManager):
+            return value
+    return task
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='python -m taskr.completion', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('shell', choices=SHELLS)
+    parser.add_argument('taskfile')
+    parser.add_argument('-p', '--prog', action='append', dest='prog_names',
+                        help='Command name to complete. It can be repeated. '
+                             'default is the name of the taskfile with and without "./"')
+    parser.add_argument('-o', '--output', help='Write the script to this file instead of stdout. It is not written '
+                                               'again if the taskfile is not changed')
+    options = parser.parse_args(args)
+
+    basename = os.path.basename(options.taskfile)
+    prog_names = options.prog_names or [basename, './' + basename]
+    if options.output and is_completion_script_current(options.shell, options.output, prog_names, options.taskfile):
+        return 0  # Don't run the taskfile, which may be slow to import
+    manager = load_task_manager(options.taskfile)
+    if options.output:
+        write_completion_script(manager, options.shell, options.output, prog_names, options.taskfile)
+    else:
+        sys.stdout.write(completion_script(manager, options.shell, prog_names, options.taskfile))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -16,10 +16,14 @@
 
 from __future__ import unicode_literals, division, absolute_import, print_function
 import math
+import os
 import shlex
 import six
+from timeit import default_timer
 from taskr import console as default_console, Color
+from taskr.cache import cache_dir
 from taskr.contrib.validators import integer_validator
+from taskr.terminal import install_path_completer
 
 
 def prompt_for_choice(choices, prompt=None, console=default_console, default=-1, input_kwargs=None):
@@ -67,28 +71,97 @@ def prompt_for_choice(choices, prompt=None, console=default_console, default=-1,
                          **input_kwargs)
 
 
-def shell(task, welcome_banner=None, prompt_text=None, prompt_color=None, prompt_symbol='>'):
-    if prompt_color:
+def _load_shell_history(history_path, history_length):
+    """
+    :type history_path: str
+    :type history_length: int
+    :return: the readline module if it's available
+    """
+    readline = install_path_completer()
+    if readline is None:
+        return None
+    readline.set_history_length(history_length)
+    if os.path.exists(history_path):
+        try:
+            readline.read_history_file(history_path)
+        except (IOError, OSError):
+            pass
+    return readline
+
+
+def _save_shell_history(readline, history_path):
+    if readline is None:
+        return
+    try:
+        history_dir = os.path.dirname(history_path)
+        if history_dir and not os.path.isdir(history_dir):
+            os.makedirs(history_dir)
+        readline.write_history_file(history_path)
+    except (IOError, OSError):
+        pass
+
+
+def shell(task, welcome_banner=None, prompt_text=None, prompt_color=None, prompt_symbol='>',
+          history_path=None, history_length=1000, show_latency=True, lazy=None, console=default_console):
+    """
+    Read commands and dispatch them by the task manager until Ctrl-C or Ctrl-D. Argparsers are built once, and the
+    executing task, exit code and arguments are reset for every command.
+
+    :param task: the task manager
+    :param history_path: file of the command history. default is `shell_history` under `$TASKR_CACHE_DIR`
+    :param history_length: number of commands kept in the history
+    :param show_latency: print the time and exit code of each command
+    :param lazy: only build argparsers of the selected tasks. default is `lazy_dispatch` of the manager
+    :type task: taskr.taskr.TaskManager
+    :type welcome_banner: str
+    :type prompt_text: str
+    :type prompt_color: int
+    :type prompt_symbol: str
+    :type history_path: str
+    :type history_length: int
+    :type show_latency: bool
+    :type lazy: bool
+    :type console: taskr.terminal.Console
+    """
+    if prompt_text and prompt_color:
         prompt_text = Color.str(prompt_text, foreground=prompt_color)
-    prompt = '{}{} '.format(prompt_text.strip()+' ' or '', prompt_symbol)
+    prompt = '{}{} '.format(prompt_text.strip() + ' ' if prompt_text else '', prompt_symbol)
     # noinspection PyShadowingBuiltins
     input = six.moves.input
 
+    lazy = task.lazy_dispatch if lazy is None else lazy
+    if not lazy:
+        # noinspection PyProtectedMember
+        task._setup_argparsers(task.tasks)
+    history_path = history_path or cache_dir('shell_history')
+    readline = _load_shell_history(history_path, history_length)
+
     if welcome_banner:
         print(welcome_banner)
     print('(Use ctrl+c to quit)')
-    while True:
-        try:
-            cmd = input(prompt)
-        except KeyboardInterrupt:
-            break
-        else:
+    try:
+        while True:
             try:
-                task.dispatch(shlex.split(cmd))
-            except SystemExit:
-                pass
-        finally:
+                cmd = input(prompt)
+            except (KeyboardInterrupt, EOFError):
+                break
+            try:
+                args = shlex.split(cmd)
+            except ValueError as e:
+                console.error(str(e))
+                continue
+            if not args:
+                continue
+
+            start = default_timer()
+            # noinspection PyProtectedMember
+            exit_code = task._dispatch_for_exit_code(args, lazy)
+            if show_latency:
+                console.info('{:.1f} ms, exit code {}'.format((default_timer() - start) * 1000, exit_code))
             print('')
+    finally:
+        print('')
+        _save_shell_history(readline, history_path)
 
 
 if __name__ == '__main__':
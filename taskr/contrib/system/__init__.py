@@ -17,8 +17,11 @@ from __future__ import unicode_literals, division, absolute_import, print_functi
 
 import os
 import shlex
+import signal
 import subprocess
 import sys
+import threading
+import time
 from contextlib import contextmanager
 
 import six
@@ -51,6 +54,80 @@ _run_global_settings = {
 }
 
 
+# Processes started by `run` and not finished yet, for each thread
+_running_processes = {}
+""":type: dict[int, set[subprocess.Popen]]"""
+_running_processes_lock = threading.Lock()
+# Whether `run` starts processes in their own sessions on each thread. (See `own_sessions`)
+_session_state = threading.local()
+
+
+def running_processes(thread_ident=None):
+    """
+    :param thread_ident: thread which started processes. default is all threads
+    :type thread_ident: int
+    :rtype: list[subprocess.Popen]
+    """
+    with _running_processes_lock:
+        if thread_ident is None:
+            return [popen for popens in _running_processes.values() for popen in popens]
+        return list(_running_processes.get(thread_ident, ()))
+
+
+@contextmanager
+def own_sessions():
+    """
+    Start processes by `run` on current thread in their own sessions in the block, so `terminate_processes` signals
+    their whole process groups, including commands started by a shell. Such processes are detached from the
+    controlling terminal, so it's only used while a task can be interrupted by a timeout.
+    """
+    previous_value = getattr(_session_state, 'enabled', False)
+    _session_state.enabled = True
+    try:
+        yield
+    finally:
+        _session_state.enabled = previous_value
+
+
+def _signal_process(popen, signal_number):
+    """
+    Send a signal to a process started by `run`, or to its process group if it's started in its own session.
+
+    :type popen: subprocess.Popen
+    :type signal_number: int
+    """
+    if popen.returncode is not None:
+        return  # Reaped already, so the process group may not exist anymore
+    try:
+        if getattr(popen, 'taskr_own_session', False):
+            os.killpg(popen.pid, signal_number)
+        else:
+            popen.send_signal(signal_number)
+    except OSError:
+        pass  # Finished already
+
+
+def terminate_processes(thread_ident=None, grace_period=5):
+    """
+    Terminate processes started by `run`, and kill them if they're still running after the grace period.
+    The whole process group of a process started in its own session is signaled. (See `own_sessions`)
+
+    :param thread_ident: thread which started processes. default is all threads
+    :param grace_period: seconds to wait before killing
+    :type thread_ident: int
+    :type grace_period: float
+    """
+    popens = running_processes(thread_ident)
+    for popen in popens:
+        _signal_process(popen, signal.SIGTERM)
+    deadline = time.time() + grace_period
+    for popen in popens:
+        while popen.poll() is None and time.time() < deadline:
+            time.sleep(0.05)
+        if popen.poll() is None:
+            _signal_process(popen, getattr(signal, 'SIGKILL', signal.SIGTERM))
+
+
 def _process_run_command_output(raw_output):
     if raw_output is None:
         return raw_output
@@ -98,12 +175,31 @@ def run(command, **kwargs):
     use_shell = '&&' in command or '||' in command or '|' in command or use_shell
     if print_command:
         print(command)
+    own_session = getattr(_session_state, 'enabled', False) and hasattr(os, 'setsid')
+    session_kwargs = {}
+    if own_session:
+        session_kwargs = {'start_new_session': True} if six.PY3 else {'preexec_fn': os.setsid}
     popen = subprocess.Popen(command if use_shell else shlex.split(command),
                              stdout=subprocess.PIPE if capture_output else None,
                              stderr=subprocess.PIPE if capture_output else None,
-                             shell=use_shell)
+                             shell=use_shell, **session_kwargs)
+    popen.taskr_own_session = own_session
 
-    stdout, stderr = popen.communicate()
+    thread_ident = threading.current_thread().ident
+    with _running_processes_lock:
+        _running_processes.setdefault(thread_ident, set()).add(popen)
+    try:
+        stdout, stderr = popen.communicate()
+    except BaseException:
+        if own_session:
+            # It doesn't receive Ctrl-C of the terminal in its own session, so don't leave it running.
+            _signal_process(popen, signal.SIGTERM)
+        raise
+    finally:
+        with _running_processes_lock:
+            _running_processes[thread_ident].discard(popen)
+            if not _running_processes[thread_ident]:
+                del _running_processes[thread_ident]
     return_code = popen.returncode
     if return_code != 0 and should_raise_when_fail:
         raise RunCommandError('Command execution returns {}'.format(return_code))
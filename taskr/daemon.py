@@ -0,0 +1,321 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Keep a task manager resident and serve invocations over a Unix domain socket.
+
+The client sends argv, environment variables and working directory, and passes its stdin, stdout and stderr as file
+descriptors, so the output of tasks goes to the terminal of the client directly. The server replies with the exit code.
+Ctrl-C of the client interrupts the task on the server. (Python 3 only, since it passes file descriptors by `sendmsg`)
+
+Start the server by `python taskfile.py --serve /tmp/taskfile.sock` and run tasks by
+`python -m taskr.daemon /tmp/taskfile.sock ACTION [ARGUMENTS...]`.
+"""
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import array
+import errno
+import json
+import os
+import signal
+import socket
+import stat
+import struct
+import sys
+import threading
+import time
+
+from six.moves import _thread
+
+from .terminal import flush_consoles
+
+_header_length_format = '!I'
+_exit_code_format = '!i'
+_interrupt_message = b'I'
+
+
+def _recv_exactly(conn, length):
+    """
+    :type conn: socket.socket
+    :type length: int
+    :rtype: bytes
+    """
+    chunks = []
+    while length > 0:
+        chunk = conn.recv(length)
+        if not chunk:
+            raise EOFError('Connection closed')
+        chunks.append(chunk)
+        length -= len(chunk)
+    return b''.join(chunks)
+
+
+def _send_request(conn, argv, environ, cwd, fds):
+    """
+    :type conn: socket.socket
+    :type argv: list[str]
+    :type environ: dict[str, str]
+    :type cwd: str
+    :type fds: list[int]
+    """
+    body = json.dumps({'argv': argv, 'environ': environ, 'cwd': cwd}).encode('utf-8')
+    header = struct.pack(_header_length_format, len(body))
+    conn.sendmsg([header], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))])
+    conn.sendall(body)
+
+
+def _recv_request(conn):
+    """
+    :type conn: socket.socket
+    :rtype: (dict, list[int])
+    """
+    fds = array.array('i')
+    header, ancillary_data, _, _ = conn.recvmsg(struct.calcsize(_header_length_format),
+                                                socket.CMSG_SPACE(3 * fds.itemsize))
+    for level, message_type, data in ancillary_data:
+        if level == socket.SOL_SOCKET and message_type == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+    if len(header) < struct.calcsize(_header_length_format):
+        header += _recv_exactly(conn, struct.calcsize(_header_length_format) - len(header))
+    body_length, = struct.unpack(_header_length_format, header)
+    return json.loads(_recv_exactly(conn, body_length).decode('utf-8')), list(fds)
+
+
+class _Invocation(object):
+    """
+    Run one request with stdio, working directory and environment variables of the client.
+    """
+
+    def __init__(self, manager, conn, lazy):
+        """
+        :type manager: taskr.taskr.TaskManager
+        :type conn: socket.socket
+        :type lazy: bool
+        """
+        self.manager = manager
+        self.conn = conn
+        self.lazy = lazy
+        self.finished = False
+        # Held while the main thread may be interrupted, so an interrupt never lands after the task finished
+        self._interrupt_lock = threading.Lock()
+
+    def _watch_client(self):
+        # Interrupt the task if the client is interrupted or gone.
+        try:
+            data = self.conn.recv(1)
+        except (OSError, socket.error):
+            data = b''
+        with self._interrupt_lock:
+            if not self.finished and (data == _interrupt_message or not data):
+                _thread.interrupt_main()
+
+    @staticmethod
+    def _flush_stdio():
+        flush_consoles()
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except (IOError, OSError):
+                pass
+
+    def run(self, request, fds, restore_process_state=True):
+        """
+        :type request: dict
+        :type fds: list[int]
+        :type restore_process_state: bool
+        :rtype: int
+        """
+        self._flush_stdio()
+        saved_fds = [os.dup(fd) for fd in range(3)] if restore_process_state else []
+        saved_cwd = os.getcwd()
+        saved_environ = dict(os.environ)
+
+        exit_code = 1
+        try:
+            for fd, client_fd in enumerate(fds[:3]):
+                os.dup2(client_fd, fd)
+            os.chdir(request['cwd'])
+            os.environ.clear()
+            os.environ.update(request['environ'])
+
+            watcher = threading.Thread(target=self._watch_client)
+            watcher.daemon = True
+            watcher.start()
+            try:
+                try:
+                    # noinspection PyProtectedMember
+                    exit_code = self.manager._dispatch_for_exit_code(request['argv'], self.lazy)
+                finally:
+                    with self._interrupt_lock:
+                        self.finished = True
+                    # An interrupt requested just before it's finished is raised by this Python code at the latest.
+                    time.sleep(0)
+            except KeyboardInterrupt:
+                exit_code = 130
+            except Exception:
+                # e.g. the client closed its stdout. The server should keep running.
+                exit_code = 1
+        finally:
+            self.finished = True
+            self._flush_stdio()
+            if restore_process_state:
+                for fd, saved_fd in enumerate(saved_fds):
+                    os.dup2(saved_fd, fd)
+                    os.close(saved_fd)
+                os.chdir(saved_cwd)
+                os.environ.clear()
+                os.environ.update(saved_environ)
+            for client_fd in fds:
+                os.close(client_fd)
+
+        try:
+            self.conn.sendall(struct.pack(_exit_code_format, exit_code))
+        except (OSError, socket.error):
+            pass
+        return exit_code
+
+
+def _reap_children():
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except OSError:
+            return
+        if pid == 0:
+            return
+
+
+def _remove_socket_file(socket_path):
+    """
+    Remove a socket file left by a previous server. Other files are never removed.
+
+    :type socket_path: str
+    """
+    try:
+        mode = os.lstat(socket_path).st_mode
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return
+        raise
+    if not stat.S_ISSOCK(mode):
+        raise OSError(errno.EEXIST, 'Not a socket. Refuse to replace it', socket_path)
+    os.remove(socket_path)
+
+
+def serve(manager, socket_path, fork_per_request=False, lazy=None):
+    """
+    Serve invocations until the server is interrupted. Invocations are served one by one in the server process,
+    or each of them is served by a forked child process if `fork_per_request` is set. A forked child cannot change
+    the state of the server, so it's safer for tasks which change global state.
+
+    :type manager: taskr.taskr.TaskManager
+    :type socket_path: str
+    :type fork_per_request: bool
+    :type lazy: bool
+    """
+    lazy = manager.lazy_dispatch if lazy is None else lazy
+    if not lazy:
+        # noinspection PyProtectedMember
+        manager._setup_argparsers(manager.tasks)
+
+    _remove_socket_file(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Create the socket accessible only by the owner, so it's never connectable by others even for a moment.
+    previous_umask = os.umask(0o177)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(previous_umask)
+    server.listen(16)
+    print('Serving on {} (pid {})'.format(socket_path, os.getpid()), file=sys.stderr)
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            try:
+                request, fds = _recv_request(conn)
+            except (EOFError, ValueError, OSError, socket.error):
+                conn.close()
+                continue
+
+            if not fork_per_request:
+                try:
+                    _Invocation(manager, conn, lazy).run(request, fds)
+                finally:
+                    conn.close()
+                continue
+
+            pid = os.fork()
+            if pid == 0:
+                exit_code = 1
+                try:
+                    server.close()
+                    signal.signal(signal.SIGINT, signal.default_int_handler)
+                    exit_code = _Invocation(manager, conn, lazy).run(request, fds, restore_process_state=False)
+                finally:
+                    os._exit(exit_code)
+            for fd in fds:
+                os.close(fd)
+            conn.close()
+            _reap_children()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        try:
+            _remove_socket_file(socket_path)
+        except OSError:
+            pass  # Replaced by another file. Leave it.
+
+
+def call(socket_path, argv, environ=None, cwd=None):
+    """
+    Run an invocation on the server. Ctrl-C is forwarded to the server.
+
+    :type socket_path: str
+    :type argv: list[str]
+    :type environ: dict[str, str]
+    :type cwd: str
+    :return: exit code of the invocation
+    :rtype: int
+    """
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.connect(socket_path)
+    try:
+        _send_request(conn, list(argv), dict(os.environ if environ is None else environ), cwd or os.getcwd(),
+                      [sys.stdin.fileno(), sys.stdout.fileno(), sys.stderr.fileno()])
+        while True:
+            try:
+                exit_code, = struct.unpack(_exit_code_format,
+                                           _recv_exactly(conn, struct.calcsize(_exit_code_format)))
+                return exit_code
+            except KeyboardInterrupt:
+                conn.sendall(_interrupt_message)
+            except EOFError:
+                return 1
+    finally:
+        conn.close()
+
+
+def main(args=None):
+    args = sys.argv[1:] if args is None else args
+    if len(args) == 0:
+        print('usage: python -m taskr.daemon SOCKET [ARGUMENTS...]', file=sys.stderr)
+        return 2
+    return call(args[0], args[1:])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,317 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import multiprocessing
+import sys
+from collections import OrderedDict
+from concurrent import futures
+
+import six
+
+from .terminal import flush_consoles
+
+# Managers used by worker processes. Worker processes are forked so they share the same tasks.
+_process_pool_managers = {}
+
+
+def _run_task_in_process(manager_id, task_name, output=None, global_options=None, run_id=None):
+    """
+    :type manager_id: int
+    :type task_name: str
+    :type output: taskr.multiplex.OutputMultiplexer
+    :type global_options: argparse.Namespace
+    :type run_id: str
+    """
+    manager = _process_pool_managers[manager_id]
+    # noinspection PyProtectedMember
+    task = manager._task_index()[task_name]
+    try:
+        _run_task(task, output=output, global_options=global_options, run_id=run_id)
+    finally:
+        # There's no way to call it in the parent process.
+        task.cleanup_function(task)
+
+
+def _dispatch_in_process(manager_id, args, lazy, output=None):
+    """
+    :type manager_id: int
+    :type args: list[str]
+    :type lazy: bool
+    :type output: taskr.multiplex.OutputMultiplexer
+    :rtype: (int, float)
+    """
+    manager = _process_pool_managers[manager_id]
+    try:
+        # noinspection PyProtectedMember
+        return manager._timed_dispatch(args, lazy, output)
+    finally:
+        flush_consoles()
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+def create_pool(manager, jobs, use_process_pool=False):
+    """
+    Pool of threads, or forked processes which share tasks of the manager.
+
+    :type manager: taskr.taskr.TaskManager
+    :type jobs: int
+    :type use_process_pool: bool
+    :rtype: concurrent.futures.Executor
+    """
+    if not use_process_pool:
+        return futures.ThreadPoolExecutor(max_workers=jobs)
+    _process_pool_managers[id(manager)] = manager
+    # Buffered output would be written again by forked processes
+    flush_consoles()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    if six.PY3:
+        return futures.ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('fork'))
+    return futures.ProcessPoolExecutor(max_workers=jobs)
+
+
+def submit_dispatch(pool, manager, args, lazy, use_process_pool=False, output=None):
+    """
+    :type pool: concurrent.futures.Executor
+    :type manager: taskr.taskr.TaskManager
+    :type args: list[str]
+    :type lazy: bool
+    :type use_process_pool: bool
+    :type output: taskr.multiplex.OutputMultiplexer
+    :return: future of the exit code and seconds of the invocation
+    :rtype: concurrent.futures.Future
+    """
+    if use_process_pool:
+        return pool.submit(_dispatch_in_process, id(manager), args, lazy, output)
+    # noinspection PyProtectedMember
+    return pool.submit(manager._timed_dispatch, args, lazy, output)
+
+
+def _run_task(task, namespace=None, output=None, global_options=None, arguments=None, run_id=None):
+    """
+    :type task: taskr.taskr.Task
+    :type namespace: argparse.Namespace
+    :param output: write output of the task to its own stream of this multiplexer
+    :param global_options: global options of the invocation. They're kept for each thread, so workers need them
+    :param arguments: arguments of tasks of the invocation, which are kept for each thread too
+    :param run_id: ID of the invocation, which is kept for each thread too
+    :type output: taskr.multiplex.OutputMultiplexer
+    :type global_options: argparse.Namespace
+    :type arguments: dict[taskr.taskr.Task, dict|argparse.Namespace]
+    :type run_id: str
+    """
+    manager = task.manager
+    if global_options is not None:
+        manager.global_options = global_options
+    if run_id is not None:
+        manager.run_id = run_id
+    if arguments:
+        # noinspection PyProtectedMember
+        manager._state.arguments.update(arguments)
+    # Arguments are kept for each thread, so they are converted here.
+    call_args, call_kwargs = task.call_arguments(namespace or task.default_namespace())
+    # The executing task is kept for each thread too, e.g. for JSON lines of consoles and cleanup on `exit`
+    # noinspection PyProtectedMember
+    previous_task, manager._executing_task = manager._executing_task, task
+    try:
+        if output is None:
+            manager.execute_task(task, call_args, call_kwargs)
+            return
+        with output.task_output(task.name):
+            manager.execute_task(task, call_args, call_kwargs)
+    finally:
+        manager._executing_task = previous_task
+
+
+class TaskGraph(object):
+    """
+    Tasks and their dependencies (`Task.dependencies`).
+    """
+
+    def __init__(self, manager, targets):
+        """
+        :type manager: taskr.taskr.TaskManager
+        :type targets: list[str|taskr.taskr.Task]
+        """
+        self.manager = manager
+        # noinspection PyProtectedMember
+        self._task_index = manager._task_index()
+        self.dependencies = OrderedDict()
+        """:type: OrderedDict[taskr.taskr.Task, list[taskr.taskr.Task]]"""
+
+        stack = list(reversed([self._resolve(target) for target in targets]))
+        while stack:
+            task = stack.pop()
+            if task in self.dependencies:
+                continue
+            self.dependencies[task] = [self._resolve(dependency) for dependency in task.dependencies]
+            stack.extend(reversed(self.dependencies[task]))
+
+        self.order = self._topological_order()
+        """:type: list[taskr.taskr.Task]"""
+
+    def _resolve(self, task):
+        """
+        :type task: str|taskr.taskr.Task
+        :rtype: taskr.taskr.Task
+        """
+        if isinstance(task, six.string_types):
+            if task not in self._task_index:
+                raise ValueError('Unknown task: {}'.format(task))
+            task = self._task_index[task]
+        return task.load()
+
+    def _topological_order(self):
+        """
+        :rtype: list[taskr.taskr.Task]
+        """
+        remaining = OrderedDict((task, set(dependencies)) for task, dependencies in self.dependencies.items())
+        order = []
+        while remaining:
+            ready = [task for task, dependencies in remaining.items() if not dependencies]
+            if not ready:
+                raise ValueError('Circular dependency between {}'.format(', '.join(map(str, remaining))))
+            for task in ready:
+                remaining.pop(task)
+                order.append(task)
+            for dependencies in remaining.values():
+                dependencies.difference_update(ready)
+        return order
+
+    def dependents(self):
+        """
+        :rtype: dict[taskr.taskr.Task, list[taskr.taskr.Task]]
+        """
+        result = {task: [] for task in self.dependencies}
+        for task, dependencies in self.dependencies.items():
+            for dependency in set(dependencies):
+                result[dependency].append(task)
+        return result
+
+
+class GraphExecutor(object):
+    """
+    Run a `TaskGraph` in topological order. Each task runs once even if many tasks depend on it.
+    After a task failed, no more tasks are started. Running tasks are waited and then the error is raised again.
+    `cleanup_function` of each started task is called when the run ends, or later by the caller. (It's called in the
+    worker process right after the task finished if `use_process_pool` is set.)
+    """
+
+    def __init__(self, manager, jobs=1, use_process_pool=False, output=None):
+        """
+        :type manager: taskr.taskr.TaskManager
+        :type jobs: int
+        :type use_process_pool: bool
+        :param output: give each task its own output stream
+        :type output: taskr.multiplex.OutputMultiplexer
+        """
+        self.manager = manager
+        self.jobs = max(jobs or 1, 1)
+        self.use_process_pool = use_process_pool
+        self.output = output
+        self._global_options = None
+        """:type: argparse.Namespace"""
+        self._arguments = {}
+        """:type: dict[taskr.taskr.Task, dict|argparse.Namespace]"""
+        self._run_id = None
+        """:type: str"""
+
+    def run(self, targets, deferred_cleanups=None):
+        """
+        :param deferred_cleanups: started tasks are appended to this list instead of calling their cleanup functions,
+                                  e.g. to keep resources of dependencies until the task which needs them finished
+        :type targets: list[str|taskr.taskr.Task]
+        :type deferred_cleanups: list[taskr.taskr.Task]
+        """
+        graph = TaskGraph(self.manager, targets)
+        # State of the invocation on this thread, which is installed on worker threads
+        self._global_options = self.manager.global_options
+        # noinspection PyProtectedMember
+        self._arguments = dict(self.manager._state.arguments)
+        self._run_id = self.manager.run_id
+        # Setup argparsers before running, so threads or forked workers won't do it concurrently.
+        # noinspection PyProtectedMember
+        self.manager._setup_argparsers(graph.order)
+        # Fail before running anything if some task cannot be invoked without arguments.
+        namespaces = {task: task.default_namespace() for task in graph.order}
+
+        started_tasks = []
+        try:
+            if self.jobs == 1:
+                for task in graph.order:
+                    started_tasks.append(task)
+                    _run_task(task, namespaces[task], self.output)
+            else:
+                self._run_concurrently(graph, namespaces, started_tasks)
+        finally:
+            if not self.use_process_pool or self.jobs == 1:
+                if deferred_cleanups is not None:
+                    deferred_cleanups.extend(started_tasks)
+                else:
+                    for task in reversed(started_tasks):
+                        task.cleanup_function(task)
+
+    def _submit(self, pool, task, namespace):
+        """
+        :type pool: concurrent.futures.Executor
+        :type task: taskr.taskr.Task
+        :type namespace: argparse.Namespace
+        :rtype: concurrent.futures.Future
+        """
+        if self.use_process_pool:
+            return pool.submit(_run_task_in_process, id(self.manager), task.name, self.output, self._global_options,
+                               self._run_id)
+        return pool.submit(_run_task, task, namespace, self.output, self._global_options, self._arguments,
+                           self._run_id)
+
+    def _run_concurrently(self, graph, namespaces, started_tasks):
+        """
+        :type graph: TaskGraph
+        :type namespaces: dict[taskr.taskr.Task, argparse.Namespace]
+        :type started_tasks: list[taskr.taskr.Task]
+        """
+        priority = {task: idx for idx, task in enumerate(graph.order)}
+        dependents = graph.dependents()
+        waiting = {task: set(dependencies) for task, dependencies in graph.dependencies.items()}
+        ready = [task for task in graph.order if not waiting[task]]
+        running = {}
+        error = None
+
+        with create_pool(self.manager, self.jobs, self.use_process_pool) as pool:
+            while ready or running:
+                while ready and error is None:
+                    task = ready.pop(0)
+                    started_tasks.append(task)
+                    running[self._submit(pool, task, namespaces[task])] = task
+                if not running:
+                    break
+
+                done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    if future.exception() is not None:
+                        error = error or future.exception()
+                        continue
+                    for dependent in dependents[task]:
+                        waiting[dependent].discard(task)
+                        if not waiting[dependent]:
+                            ready.append(dependent)
+                ready.sort(key=priority.get)
+
+        if error is not None:
+            raise error
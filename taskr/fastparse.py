@@ -0,0 +1,189 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Parse arguments of tasks with simple signatures without argparse.
+
+Most tasks only take positional strings and options with bool, int, float or string defaults. For them, building an
+argparser and parsing with it is most of the overhead of a short task, so a tokenizer compiled from the metadata of
+the task parses the arguments directly. It only accepts arguments which argparse parses in an obvious way. Anything
+else (help, errors, abbreviations, `--`, values starting with `-`, ...) is left to argparse, so the result is always
+the same as argparse.
+"""
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import six
+
+_supported_types = (None, int, float, str, six.text_type)
+_positional_keys = frozenset(['help', 'metavar'])
+_optional_keys = frozenset(['help', 'metavar', 'default', 'action', 'type'])
+_flag_values = {'store_true': True, 'store_false': False}
+
+
+class FastParser(object):
+    """
+    Tokenizer of arguments of a task. Use `compile_parser` to create it.
+    """
+
+    __slots__ = ('positionals', 'options', 'defaults')
+
+    def __init__(self, positionals, options, defaults):
+        """
+        :param positionals: destinations of positional arguments
+        :param options: (destination, value of a flag or `None` if it takes a value, type) of each option string
+        :param defaults: values of destinations which are not given
+        :type positionals: list[str]
+        :type options: dict[str, (str, bool, type)]
+        :type defaults: dict[str, object]
+        """
+        self.positionals = positionals
+        self.options = options
+        self.defaults = defaults
+
+    def __repr__(self):
+        return '<FastParser: {} positionals, {} options>'.format(len(self.positionals), len(self.options))
+
+    def parse_args(self, args):
+        """
+        >>> parser = compile_parser({'varargs': None, 'arguments': [
+        ...     ('*', ('source',), {}), ('*', ('-v', '--verbose'), {'default': False, 'action': 'store_true'}),
+        ...     ('*', ('-r', '--retries'), {'default': 3, 'type': int})]})
+        >>> sorted(parser.parse_args(['a', '-v', '--retries=5']).items())
+        [('retries', 5), ('source', 'a'), ('verbose', True)]
+        >>> sorted(parser.parse_args(['a']).items())
+        [('retries', 3), ('source', 'a'), ('verbose', False)]
+        >>> parser.parse_args(['a', '-r', 'many']) is None  # argparse shows the error
+        True
+
+        :type args: list[str]
+        :return: values of arguments, or `None` if it should be parsed by argparse
+        :rtype: dict[str, object]
+        """
+        values = {}
+        positional_values = []
+        options = self.options
+        idx = 0
+        arg_count = len(args)
+        while idx < arg_count:
+            arg = args[idx]
+            idx += 1
+            if not arg.startswith('-'):
+                positional_values.append(arg)
+                continue
+
+            option_string, separator, value = arg.partition('=')
+            option = options.get(option_string if separator and arg.startswith('--') else arg, None)
+            if option is None:
+                return None
+            dest, flag_value, type_func = option
+            if flag_value is not None:
+                if separator and arg not in options:
+                    return None
+                values[dest] = flag_value
+                continue
+            if not separator or arg in options:
+                if idx == arg_count or args[idx].startswith('-'):
+                    return None
+                value = args[idx]
+                idx += 1
+            try:
+                values[dest] = value if type_func is None else type_func(value)
+            except (TypeError, ValueError):
+                return None
+
+        if len(positional_values) != len(self.positionals):
+            return None
+        values.update(zip(self.positionals, positional_values))
+        for dest, default in self.defaults.items():
+            values.setdefault(dest, default)
+        return values
+
+
+def _option_dest(option_strings):
+    """
+    >>> print(_option_dest(('-d', '--dry-run')))
+    dry_run
+    >>> print(_option_dest(('-d',)))
+    d
+
+    :type option_strings: tuple[str]
+    :rtype: str
+    """
+    long_option_strings = [option_string for option_string in option_strings if option_string.startswith('--')]
+    return (long_option_strings or option_strings)[0].lstrip('-').replace('-', '_')
+
+
+def compile_parser(metadata):
+    """
+    Compile a tokenizer from `Task.metadata`. Argparse is still needed for arguments with other features, like
+    choices, nargs or custom actions.
+
+    >>> compile_parser({'varargs': None, 'arguments': [('*', ('source',), {'help': 'where to read'})]})
+    <FastParser: 1 positionals, 0 options>
+    >>> compile_parser({'varargs': None, 'arguments': [('*', ('mode',), {'choices': ['a', 'b']})]}) is None
+    True
+
+    :type metadata: dict
+    :return: the tokenizer, or `None` if the arguments are not supported
+    :rtype: FastParser
+    """
+    if metadata['varargs']:
+        return None
+
+    positionals = []
+    options = {'-h': None, '--help': None}  # Help is shown by argparse
+    defaults = {}
+    dests = set()
+    for _, arg_args, arg_kwargs in metadata['arguments']:
+        if not arg_args[0].startswith('-'):
+            if len(arg_args) != 1 or not _positional_keys.issuperset(arg_kwargs):
+                return None
+            dest = arg_args[0]
+            positionals.append(dest)
+        else:
+            if not _optional_keys.issuperset(arg_kwargs) or not all(arg.startswith('-') for arg in arg_args):
+                return None
+            action = arg_kwargs.get('action', None)
+            type_func = arg_kwargs.get('type', None)
+            if action is None:
+                if type_func not in _supported_types:
+                    return None
+                flag_value = None
+                default = arg_kwargs.get('default', None)
+                if type_func is not None and isinstance(default, six.string_types):
+                    # Argparse converts string defaults too
+                    try:
+                        default = type_func(default)
+                    except (TypeError, ValueError):
+                        return None
+            elif action in _flag_values and type_func is None:
+                flag_value = _flag_values[action]
+                default = arg_kwargs.get('default', not flag_value)
+            else:
+                return None
+
+            dest = _option_dest(arg_args)
+            for option_string in arg_args:
+                if option_string in options or len(option_string) < 2:
+                    # Argparse raises for conflicting option strings
+                    return None
+                options[option_string] = (dest, flag_value, type_func)
+            defaults[dest] = default
+        if dest in dests:
+            return None
+        dests.add(dest)
+
+    del options['-h'], options['--help']
+    return FastParser(positionals, options, defaults)
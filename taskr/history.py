@@ -0,0 +1,416 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+History of task runs in a SQLite database, and reports of it.
+
+Each finished task is recorded with its arguments, start and end time, exit code and peak RSS (only if the process runs
+one task) by hooks of a task manager. When a task which has succeeded before starts, its usual duration and ETA are
+printed. Set `TASKR_HISTORY=1` (or `TASKR_HISTORY_FILE`) to record tasks of `taskr.task`, and show the report by
+
+    $ python -m taskr.history
+"""
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+from .cache import cache_dir
+from .terminal import Console
+from .watchdog import TIMEOUT_EXIT_CODE, TaskTimeout
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS task_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    task TEXT NOT NULL,
+    arguments TEXT NOT NULL,
+    dependencies TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    ended_at REAL NOT NULL,
+    exit_code INTEGER NOT NULL,
+    -- Peak RSS of the process in bytes, only if the task is the only task run by the process. NULL otherwise
+    peak_rss INTEGER
+);
+CREATE INDEX IF NOT EXISTS task_runs_by_task ON task_runs (task, id);
+CREATE INDEX IF NOT EXISTS task_runs_by_run ON task_runs (run_id);
+"""
+_TREND_CHARACTERS = ' .:-=+*#'
+
+
+def percentile(values, ratio):
+    """
+    Percentile by linear interpolation between closest ranks.
+
+    >>> percentile([1, 2, 3, 4], 0.5)
+    2.5
+    >>> percentile([5.0], 0.95)
+    5.0
+
+    :type values: list[float]
+    :type ratio: float
+    :rtype: float
+    """
+    values = sorted(values)
+    position = (len(values) - 1) * ratio
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def format_seconds(seconds):
+    """
+    >>> [format_seconds(value) for value in (0.0123, 4.56, 245, 3725)]
+    ['12ms', '4.6s', '4m05s', '1h02m']
+
+    :type seconds: float
+    :rtype: str
+    """
+    if seconds < 1:
+        return '{:.0f}ms'.format(seconds * 1000)
+    elif seconds < 60:
+        return '{:.1f}s'.format(seconds)
+    elif seconds < 3600:
+        return '{:.0f}m{:02.0f}s'.format(*divmod(seconds, 60))
+    return '{:.0f}h{:02.0f}m'.format(*divmod(seconds // 60, 60))
+
+
+def trend_line(values):
+    """
+    Durations relative to the longest one, so small noise doesn't look like a trend.
+
+    >>> print(trend_line([0, 2, 4, 8]))
+     :=#
+
+    :type values: list[float]
+    :rtype: str
+    """
+    scale = (len(_TREND_CHARACTERS) - 1) / max(values) if max(values) > 0 else 0
+    return ''.join(_TREND_CHARACTERS[int(round(value * scale))] for value in values)
+
+
+def peak_rss():
+    """
+    :return: peak resident set size of this process or its waited children in bytes, or `None` if it's unknown
+    :rtype: int
+    """
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # It's in kilobytes except on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _exit_code(exception):
+    """
+    :type exception: BaseException
+    :rtype: int
+    """
+    if isinstance(exception, TaskTimeout):
+        return TIMEOUT_EXIT_CODE
+    elif isinstance(exception, SystemExit):
+        return exception.code if isinstance(exception.code, int) else 1
+    elif isinstance(exception, KeyboardInterrupt):
+        return 130
+    return 1
+
+
+class TaskHistory(object):
+    """
+    Runs of tasks in a SQLite database. Install it to a task manager by `install`.
+
+    A dispatched task and its dependencies share a run ID (see `TaskManager.run_id`), so the critical path of a run
+    can be found from the dependencies of its tasks.
+    """
+
+    def __init__(self, path=None, show_eta=True):
+        """
+        :param path: default is `history.sqlite3` in the cache directory
+        :param show_eta: print the usual duration and ETA of a task when it starts
+        :type path: str
+        :type show_eta: bool
+        """
+        self.path = path or cache_dir('history.sqlite3')
+        self.show_eta = show_eta
+        self._has_schema = False
+        # Peak RSS is of the whole process, so it's recorded only if the process runs one task.
+        self._started_tasks = 0
+        self._started_tasks_lock = threading.Lock()
+
+    def __repr__(self):
+        return '<TaskHistory: {}>'.format(self.path)
+
+    @classmethod
+    def from_environ(cls):
+        """
+        History configured by `TASKR_HISTORY_FILE` and `TASKR_HISTORY_ETA`.
+
+        :rtype: TaskHistory
+        """
+        return cls(path=os.environ.get('TASKR_HISTORY_FILE', None) or None,
+                   show_eta=int(os.environ.get('TASKR_HISTORY_ETA', '1')) != 0)
+
+    def install(self, manager):
+        """
+        :type manager: taskr.taskr.TaskManager
+        :rtype: TaskHistory
+        """
+        manager.add_hook('pre', lambda task, args, kwargs: self._task_started(task))
+        manager.add_hook('post', lambda task, result, seconds: self._task_finished(task, 0, seconds))
+        manager.add_hook('error', lambda task, exception, seconds: self._task_finished(task, _exit_code(exception),
+                                                                                       seconds))
+        manager.history = self
+        return self
+
+    def connect(self):
+        """
+        A new connection. Connections cannot be shared by threads or forked processes, so each operation has its own.
+
+        :rtype: sqlite3.Connection
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        connection = sqlite3.connect(self.path, timeout=30)
+        if not self._has_schema:
+            connection.executescript(_SCHEMA)
+            self._has_schema = True
+        return connection
+
+    def record(self, run_id, task_name, arguments, dependencies, started_at, ended_at, exit_code, rss=None):
+        """
+        :param run_id: ID of the dispatched invocation
+        :type run_id: str
+        :type task_name: str
+        :type arguments: dict
+        :type dependencies: list[str]
+        :param started_at: UNIX time
+        :param ended_at: UNIX time
+        :param rss: peak RSS of the process in bytes. It should be `None` unless the task is the only task of the
+                    process, since other tasks would be counted too
+        :type started_at: float
+        :type ended_at: float
+        :type exit_code: int
+        :type rss: int
+        """
+        with closing(self.connect()) as connection, connection:
+            connection.execute(
+                'INSERT INTO task_runs (run_id, task, arguments, dependencies, started_at, ended_at, exit_code, '
+                'peak_rss) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (run_id, task_name, json.dumps(arguments, sort_keys=True, default=repr), json.dumps(dependencies),
+                 started_at, ended_at, exit_code, rss))
+
+    def durations(self, task_name, limit=20, succeeded_only=True):
+        """
+        :type task_name: str
+        :param limit: number of the latest runs
+        :type limit: int
+        :type succeeded_only: bool
+        :return: durations of the latest runs in seconds, the oldest first
+        :rtype: list[float]
+        """
+        with closing(self.connect()) as connection:
+            rows = connection.execute(
+                'SELECT ended_at - started_at FROM task_runs WHERE task = ?{} ORDER BY id DESC LIMIT ?'.format(
+                    ' AND exit_code = 0' if succeeded_only else ''),
+                (task_name, limit)).fetchall()
+        return [seconds for seconds, in reversed(rows)]
+
+    def _task_started(self, task):
+        """
+        :type task: taskr.taskr.Task
+        """
+        with self._started_tasks_lock:
+            self._started_tasks += 1
+        if not self.show_eta:
+            return
+        try:
+            durations = self.durations(task.name)
+        except sqlite3.Error as e:
+            Console(sys.stderr).warn('History of {} is not available: {}'.format(task.name, e))
+            return
+        if durations:
+            usual_seconds = percentile(durations, 0.5)
+            eta = datetime.datetime.now() + datetime.timedelta(seconds=usual_seconds)
+            Console(sys.stderr).info('{}: usually takes {} (ETA {:%H:%M:%S})'.format(
+                task.name, format_seconds(usual_seconds), eta))
+
+    def _task_finished(self, task, exit_code, seconds):
+        """
+        :type task: taskr.taskr.Task
+        :type exit_code: int
+        :type seconds: float
+        """
+        arguments = task.arguments
+        if isinstance(arguments, argparse.Namespace):
+            arguments = {key: value for key, value in vars(arguments).items() if key != '__instance__'}
+        dependencies = [getattr(dependency, 'name', dependency) for dependency in task.dependencies]
+        ended_at = time.time()
+        with self._started_tasks_lock:
+            rss = peak_rss() if self._started_tasks == 1 else None
+        try:
+            self.record(task.manager.run_id, task.name, arguments, dependencies, ended_at - seconds, ended_at,
+                        exit_code, rss)
+        except sqlite3.Error as e:
+            # The task itself has finished, so don't fail it.
+            Console(sys.stderr).warn('Run of {} is not recorded: {}'.format(task.name, e))
+
+    def task_summaries(self, since=None, recent_runs=20):
+        """
+        :param since: only runs started after this UNIX time
+        :param recent_runs: number of the latest runs for trends
+        :type since: float
+        :type recent_runs: int
+        :return: runs, failures, p50 and p95 of durations of succeeded runs, and durations of recent succeeded runs
+                 of each task
+        :rtype: OrderedDict[str, dict]
+        """
+        with closing(self.connect()) as connection:
+            rows = connection.execute(
+                'SELECT task, ended_at - started_at, exit_code FROM task_runs WHERE started_at >= ? ORDER BY task, id',
+                (since or 0,)).fetchall()
+        summaries = OrderedDict()
+        for task_name, seconds, exit_code in rows:
+            summary = summaries.setdefault(task_name, {'runs': 0, 'failures': 0, 'durations': []})
+            summary['runs'] += 1
+            if exit_code == 0:
+                summary['durations'].append(seconds)
+            else:
+                summary['failures'] += 1
+        for summary in summaries.values():
+            durations = summary.pop('durations')
+            summary['p50'] = percentile(durations, 0.5) if durations else None
+            summary['p95'] = percentile(durations, 0.95) if durations else None
+            summary['recent'] = durations[-recent_runs:]
+        return summaries
+
+    def latest_run_id(self, min_tasks=2):
+        """
+        :param min_tasks: only runs with at least this number of tasks
+        :type min_tasks: int
+        :rtype: str
+        """
+        with closing(self.connect()) as connection:
+            row = connection.execute(
+                'SELECT run_id FROM task_runs GROUP BY run_id HAVING COUNT(*) >= ? ORDER BY MAX(id) DESC LIMIT 1',
+                (min_tasks,)).fetchone()
+        return row[0] if row else None
+
+    def critical_path(self, run_id):
+        """
+        Tasks which decided when the run finished. It starts from the task which finished last, and follows the
+        dependency which finished last before each task started.
+
+        :type run_id: str
+        :return: (task name, started_at, ended_at) of tasks on the path, the first one first
+        :rtype: list[(str, float, float)]
+        """
+        with closing(self.connect()) as connection:
+            rows = connection.execute(
+                'SELECT task, dependencies, started_at, ended_at FROM task_runs WHERE run_id = ? ORDER BY id',
+                (run_id,)).fetchall()
+        if not rows:
+            return []
+
+        path = []
+        row = max(rows, key=lambda _row: _row[3])
+        while row:
+            task_name, dependencies, started_at, ended_at = row
+            path.append((task_name, started_at, ended_at))
+            dependencies = set(json.loads(dependencies))
+            candidates = [_row for _row in rows if _row[0] in dependencies and _row[3] <= started_at]
+            row = max(candidates, key=lambda _row: _row[3]) if candidates else None
+        return list(reversed(path))
+
+
+def report(history, output=None, since=None, run_id=None):
+    """
+    Print durations and trends of tasks, and the critical path of the latest run with many tasks.
+
+    :type history: TaskHistory
+    :type output: io.TextIOBase
+    :param since: only runs started after this UNIX time
+    :param run_id: show the critical path of this run
+    :type since: float
+    :type run_id: str
+    """
+    output = output or sys.stdout
+    console = Console(output)
+    summaries = history.task_summaries(since=since)
+    if not summaries:
+        console.info('No runs are recorded in {}'.format(history.path))
+        return
+
+    name_width = max(len(name) for name in summaries)
+    console.highlight('{:<{}}  {:>5}  {:>5}  {:>7}  {:>7}  {:>6}  {}'.format(
+        'TASK', name_width, 'RUNS', 'FAIL', 'P50', 'P95', 'TREND', 'RECENT'))
+    for name, summary in summaries.items():
+        recent = summary['recent']
+        half = len(recent) // 2
+        change = '-'
+        if half and percentile(recent[:half], 0.5):
+            change = '{:+.0%}'.format(percentile(recent[half:], 0.5) / percentile(recent[:half], 0.5) - 1)
+        output.write('{:<{}}  {:>5}  {:>5}  {:>7}  {:>7}  {:>6}  {}\n'.format(
+            name, name_width, summary['runs'], summary['failures'],
+            format_seconds(summary['p50']) if recent else '-', format_seconds(summary['p95']) if recent else '-',
+            change, trend_line(recent) if recent else ''))
+
+    run_id = run_id or history.latest_run_id()
+    path = history.critical_path(run_id) if run_id else []
+    if path:
+        run_started_at = path[0][1]
+        output.write('\n')
+        console.highlight('Critical path of run {} ({:%Y-%m-%d %H:%M:%S}): {}'.format(
+            run_id, datetime.datetime.fromtimestamp(run_started_at), format_seconds(path[-1][2] - run_started_at)))
+        for task_name, started_at, ended_at in path:
+            output.write('  +{:>7}  {:<{}}  {}\n'.format(format_seconds(started_at - run_started_at), task_name,
+                                                          name_width, format_seconds(ended_at - started_at)))
+
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='python -m taskr.history', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-f', '--file', default=os.environ.get('TASKR_HISTORY_FILE', None) or None,
+                        help='The history database. default is history.sqlite3 in the cache directory')
+    parser.add_argument('-d', '--days', type=float, help='Only runs in these days')
+    parser.add_argument('-r', '--run', dest='run_id', help='Show the critical path of this run')
+    options = parser.parse_args(args)
+
+    history = TaskHistory(options.file)
+    if not os.path.exists(history.path):
+        Console(sys.stderr).error('{} does not exist'.format(history.path))
+        return 1
+    since = time.time() - options.days * 86400 if options.days else None
+    report(history, since=since, run_id=options.run_id)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Fan-out of an invocation over sets of values. `{key}` in arguments is replaced by the value of `key` of each set.
+"""
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import io
+import itertools
+import json
+import re
+import sys
+from collections import OrderedDict
+
+import six
+
+_template_pattern = re.compile(r'\{(\w+)\}')
+
+
+def parse_matrix_option(option):
+    """
+    >>> parse_matrix_option('host=web-1,web-2')
+    ('host', ['web-1', 'web-2'])
+
+    :param option: `KEY=VALUE1,VALUE2,...`
+    :type option: str
+    :rtype: (str, list[str])
+    """
+    key, separator, values = option.partition('=')
+    if not separator or not key:
+        raise ValueError('Matrix should be KEY=VALUE1,VALUE2,...: {}'.format(option))
+    return key, values.split(',')
+
+
+def parse_matrix_options(options):
+    """
+    Values of repeated keys are merged, so `--matrix host=a --matrix host=b` is same as `--matrix host=a,b`.
+
+    >>> list(parse_matrix_options(['host=a,b', 'port=80', 'host=b,c']).items())
+    [('host', ['a', 'b', 'c']), ('port', ['80'])]
+
+    :param options: `KEY=VALUE1,VALUE2,...` of each option
+    :type options: list[str]
+    :rtype: OrderedDict[str, list[str]]
+    """
+    matrix = OrderedDict()
+    for option in options:
+        key, values = parse_matrix_option(option)
+        key_values = matrix.setdefault(key, [])
+        key_values.extend(value for value in values if value not in key_values)
+    return matrix
+
+
+def load_matrix_file(path):
+    """
+    Load a JSON file, which is an object of value lists (their product is used) or a list of objects.
+    `-` means stdin.
+
+    :type path: str
+    :rtype: dict[str, list]|list[dict]
+    """
+    if path == '-':
+        return json.load(sys.stdin, object_pairs_hook=OrderedDict)
+    with io.open(path, encoding='utf-8') as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
+
+
+def _rows(matrix):
+    """
+    :type matrix: dict[str, list]|collections.Iterable[dict]
+    :rtype: list[OrderedDict]
+    """
+    if isinstance(matrix, dict):
+        keys = list(matrix)
+        return [OrderedDict(zip(keys, values)) for values in itertools.product(*(matrix[key] for key in keys))]
+    return [OrderedDict(row) for row in matrix]
+
+
+def expand_matrix(*matrices):
+    """
+    Product of matrices. Each matrix is an object of value lists (their product is used) or rows of values.
+
+    >>> for row in expand_matrix(OrderedDict([('host', ['a', 'b']), ('port', [80, 443])])):
+    ...     print(list(row.items()))
+    [('host', 'a'), ('port', 80)]
+    [('host', 'a'), ('port', 443)]
+    [('host', 'b'), ('port', 80)]
+    [('host', 'b'), ('port', 443)]
+    >>> [list(row.items()) for row in expand_matrix([{'region': 'us'}], {'env': ['prod']})]
+    [[('region', 'us'), ('env', 'prod')]]
+
+    :type matrices: list[dict[str, list]|collections.Iterable[dict]]
+    :rtype: list[OrderedDict]
+    """
+    rows = [OrderedDict()]
+    for matrix in matrices:
+        rows = [OrderedDict(itertools.chain(row.items(), matrix_row.items()))
+                for row in rows for matrix_row in _rows(matrix)]
+    return rows
+
+
+def template_keys(args):
+    """
+    >>> sorted(template_keys(['deploy', '{host}', '--port={port}']))
+    ['host', 'port']
+
+    :type args: list[str]
+    :rtype: set[str]
+    """
+    return {key for arg in args for key in _template_pattern.findall(arg)}
+
+
+def render_arguments(args, values):
+    """
+    Replace `{key}` in arguments. Braces of unknown keys are kept.
+
+    >>> render_arguments(['deploy', '{host}', '--port={port}', '{"json": 1}'], {'host': 'a', 'port': 80})
+    ['deploy', 'a', '--port=80', '{"json": 1}']
+
+    :type args: list[str]
+    :type values: dict
+    :rtype: list[str]
+    """
+    def replace(match):
+        key = match.group(1)
+        return six.text_type(values[key]) if key in values else match.group(0)
+    return [_template_pattern.sub(replace, arg) for arg in args]
@@ -0,0 +1,256 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import hashlib
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import six
+from six.moves import cPickle as pickle
+
+from .cache import cache_dir, write_file_atomically
+
+_missing = object()
+
+
+class TaskMemo(object):
+    """
+    Memoized return values of a task, keyed by its arguments. Values are kept in an in-process LRU and, if
+    `persistent` is set, in pickle files of a directory whose total size is limited.
+    """
+
+    def __init__(self, task, maxsize=128, ttl=None, persistent=False, directory=None, max_disk_size=64 * 1024 * 1024):
+        """
+        :param maxsize: number of values kept in memory. `None` means no limit
+        :param ttl: seconds before a value expires. `None` means never
+        :param persistent: keep values on disk, so they can be used by later runs
+        :param directory: where to keep values on disk. default is under `$TASKR_CACHE_DIR`
+        :param max_disk_size: total bytes of values on disk. least recently used ones are removed
+        :type task: taskr.taskr.Task
+        :type maxsize: int
+        :type ttl: float
+        :type persistent: bool
+        :type directory: str
+        :type max_disk_size: int
+        """
+        self.task = task
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.persistent = persistent
+        self.max_disk_size = max_disk_size
+        self._directory = directory
+        self.hits = 0
+        self.misses = 0
+
+        self._values = OrderedDict()
+        """:type: OrderedDict[str, (float, object)]"""
+        # Total bytes of values on disk, counted by the first write. Other processes may write the directory too, so
+        # it's counted again whenever it seems over the limit.
+        self._disk_size = None
+        """:type: int"""
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return '<TaskMemo of {}: {} hits, {} misses>'.format(self.task.name, self.hits, self.misses)
+
+    @property
+    def directory(self):
+        """
+        :rtype: str
+        """
+        if not self._directory:
+            task_id = '{}:{}'.format(getattr(self.task.callable, '__module__', ''), self.task.name)
+            self._directory = cache_dir('memo', hashlib.md5(task_id.encode('utf-8')).hexdigest())
+        return self._directory
+
+    def key(self, args, kwargs):
+        """
+        Arguments are bound to parameters of the callable first, so `f(1)` and `f(x=1)` share the same key.
+        It returns `None` if the arguments cannot be pickled.
+
+        :type args: tuple
+        :type kwargs: dict
+        :rtype: str
+        """
+        func = self.task.callable.__call__ if self.task.callable_is_object else self.task.callable
+        try:
+            call_args = inspect.getcallargs(func, *args, **kwargs)
+        except TypeError:
+            call_args = {'*': args, '**': kwargs}
+        if inspect.ismethod(func):
+            # Drop `self` of the bound method
+            call_args.pop((inspect.getfullargspec if six.PY3 else inspect.getargspec)(func).args[0], None)
+        try:
+            return hashlib.sha1(pickle.dumps(sorted(call_args.items()), 2)).hexdigest()
+        except Exception:
+            return None
+
+    def _expired(self, expires_at):
+        """
+        :type expires_at: float
+        :rtype: bool
+        """
+        return expires_at is not None and expires_at < time.time()
+
+    def _path(self, key):
+        """
+        :type key: str
+        :rtype: str
+        """
+        return os.path.join(self.directory, key + '.pickle')
+
+    def _get(self, key):
+        """
+        :type key: str
+        :rtype: object
+        """
+        if key in self._values:
+            expires_at, value = self._values.pop(key)
+            if not self._expired(expires_at):
+                self._values[key] = (expires_at, value)  # Most recently used
+                return value
+
+        if self.persistent:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    expires_at, value = pickle.load(f)
+            except Exception:
+                return _missing
+            if self._expired(expires_at):
+                self._remove_file(path)
+                return _missing
+            try:
+                os.utime(path, None)  # Most recently used
+            except OSError:
+                return _missing  # Removed by another process, or not writable
+            self._set_in_memory(key, expires_at, value)
+            return value
+        return _missing
+
+    def _set_in_memory(self, key, expires_at, value):
+        self._values.pop(key, None)
+        self._values[key] = (expires_at, value)
+        while self.maxsize is not None and len(self._values) > self.maxsize:
+            self._values.popitem(last=False)
+
+    def _set(self, key, value):
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        self._set_in_memory(key, expires_at, value)
+        if self.persistent:
+            try:
+                content = pickle.dumps((expires_at, value), pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                return  # Keep it in memory only
+            path = self._path(key)
+            if self._disk_size is None:
+                self._limit_disk_size()
+            replaced_size = self._file_size(path)
+            write_file_atomically(path, content)
+            self._disk_size += len(content) - replaced_size
+            if self._disk_size > self.max_disk_size:
+                self._limit_disk_size()
+
+    @staticmethod
+    def _file_size(path):
+        """
+        :type path: str
+        :return: size of the file, or 0 if it doesn't exist
+        :rtype: int
+        """
+        try:
+            return os.stat(path).st_size
+        except OSError:
+            return 0
+
+    def _remove_file(self, path):
+        size = self._file_size(path)
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        if self._disk_size is not None:
+            self._disk_size = max(self._disk_size - size, 0)
+
+    def _limit_disk_size(self):
+        """
+        Count values on disk, and remove least recently used ones until they fit in `max_disk_size`.
+        """
+        entries = []
+        for file_name in (os.listdir(self.directory) if os.path.isdir(self.directory) else ()):
+            if not file_name.endswith('.pickle'):
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        self._disk_size = sum(entry[1] for entry in entries)
+        for _, size, path in sorted(entries):
+            if self._disk_size <= self.max_disk_size:
+                break
+            self._remove_file(path)
+
+    def call(self, args, kwargs):
+        """
+        :type args: tuple
+        :type kwargs: dict
+        """
+        key = self.key(args, kwargs)
+        if key is None:
+            return self.task.invoke_callable(args, kwargs)
+
+        with self._lock:
+            value = self._get(key)
+        if value is not _missing:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = self.task.invoke_callable(args, kwargs)
+        with self._lock:
+            self._set(key, value)
+        return value
+
+    def invalidate(self, *args, **kwargs):
+        """
+        Forget the value of these arguments.
+        """
+        key = self.key(args, kwargs)
+        if key is None:
+            return
+        with self._lock:
+            self._values.pop(key, None)
+            if self.persistent:
+                self._remove_file(self._path(key))
+
+    def clear(self):
+        """
+        Forget all values.
+        """
+        with self._lock:
+            self._values.clear()
+            if self.persistent and os.path.isdir(self.directory):
+                for file_name in os.listdir(self.directory):
+                    if file_name.endswith('.pickle'):
+                        self._remove_file(os.path.join(self.directory, file_name))
+            self._disk_size = None
@@ -0,0 +1,335 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Runs, failures and duration histograms of tasks in OpenMetrics text format.
+
+Metrics are collected by hooks of a task manager. They're written to a file after each task (counts of earlier runs
+in the file are kept, so it works for short-lived processes), or served over HTTP by a background thread.
+Set `TASKR_METRICS_FILE` or `TASKR_METRICS_PORT` to collect metrics of `taskr.task`.
+"""
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import json
+import os
+import sys
+import threading
+
+import six
+from six.moves import BaseHTTPServer, socketserver
+
+from .cache import write_file_atomically
+from .terminal import Console
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape_label_value(value):
+    """
+    >>> print(_escape_label_value('a"b\\\\c'))
+    a\\"b\\\\c
+
+    :type value: str
+    :rtype: str
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound):
+    """
+    >>> _format_bound(0.5), _format_bound(10.0), _format_bound(float('inf'))
+    ('0.5', '10.0', '+Inf')
+
+    :type bound: float
+    :rtype: str
+    """
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+class TaskMetrics(object):
+    """
+    Runs, failures and durations of tasks. Install it to a task manager by `install`.
+    """
+
+    def __init__(self, path=None, buckets=DEFAULT_BUCKETS):
+        """
+        :param path: write metrics to this file after each task. It's OpenMetrics text, or Prometheus text if the
+                     path ends with `.prom` (for the textfile collector of node exporter)
+        :param buckets: upper bounds of duration histograms in seconds
+        :type path: str
+        :type buckets: list[float]
+        """
+        self.path = path
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self.server = None
+        """:type: BaseHTTPServer.HTTPServer"""
+        self._records = {}
+        """:type: dict[str, dict]"""
+        # Observations which are not written to the file yet
+        self._pending_records = {}
+        """:type: dict[str, dict]"""
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<TaskMetrics of {} tasks>'.format(len(self._records))
+
+    @classmethod
+    def from_environ(cls):
+        """
+        Metrics configured by `TASKR_METRICS_FILE`, `TASKR_METRICS_PORT` and `TASKR_METRICS_HOST`.
+
+        :rtype: TaskMetrics
+        """
+        metrics = cls(path=os.environ.get('TASKR_METRICS_FILE', None) or None)
+        port = os.environ.get('TASKR_METRICS_PORT', None)
+        if port:
+            metrics.serve_http(int(port), host=os.environ.get('TASKR_METRICS_HOST', '127.0.0.1'))
+        return metrics
+
+    def install(self, manager):
+        """
+        :type manager: taskr.taskr.TaskManager
+        :rtype: TaskMetrics
+        """
+        manager.add_hook('post', lambda task, result, seconds: self.observe(task.name, seconds))
+        manager.add_hook('error', lambda task, exception, seconds: self.observe(task.name, seconds, failed=True))
+        manager.metrics = self
+        return self
+
+    def _empty_record(self):
+        """
+        :rtype: dict
+        """
+        return {'runs': 0, 'failures': 0, 'sum': 0.0, 'buckets': [0] * len(self.buckets)}
+
+    def _add(self, records, task_name, runs, failures, seconds_sum, bucket_counts):
+        """
+        :type records: dict[str, dict]
+        :type task_name: str
+        :type runs: int
+        :type failures: int
+        :type seconds_sum: float
+        :type bucket_counts: list[int]
+        """
+        record = records.get(task_name, None)
+        if record is None or len(record['buckets']) != len(bucket_counts):
+            # Buckets are changed. Records of old buckets cannot be merged.
+            record = records[task_name] = self._empty_record()
+        record['runs'] += runs
+        record['failures'] += failures
+        record['sum'] += seconds_sum
+        record['buckets'] = [count + added for count, added in zip(record['buckets'], bucket_counts)]
+
+    def observe(self, task_name, seconds, failed=False):
+        """
+        :type task_name: str
+        :type seconds: float
+        :type failed: bool
+        """
+        bucket_counts = [0] * len(self.buckets)
+        bucket_counts[next(idx for idx, bound in enumerate(self.buckets) if seconds <= bound)] = 1
+        with self._lock:
+            for records in (self._records, self._pending_records):
+                self._add(records, task_name, 1, 1 if failed else 0, seconds, bucket_counts)
+        if self.path:
+            try:
+                self.write()
+            except (IOError, OSError) as e:
+                # Observations are kept, and written by the next successful write.
+                Console(sys.stderr).warn('Metrics are not written to {}: {}'.format(self.path, e))
+
+    def render(self, records=None, openmetrics=True):
+        """
+        :param records: default is records of this process
+        :param openmetrics: OpenMetrics text, or Prometheus text format 0.0.4
+        :type records: dict[str, dict]
+        :type openmetrics: bool
+        :rtype: str
+        """
+        if records is None:
+            with self._lock:
+                records = json.loads(json.dumps(self._records))
+        names = sorted(records)
+        labels = {name: 'task="{}"'.format(_escape_label_value(name)) for name in names}
+
+        lines = []
+        for metric, help_text, key in (('taskr_task_runs', 'Finished runs of the task.', 'runs'),
+                                       ('taskr_task_failures', 'Failed runs of the task.', 'failures')):
+            lines.append('# TYPE {} counter'.format(metric if openmetrics else metric + '_total'))
+            lines.append('# HELP {} {}'.format(metric if openmetrics else metric + '_total', help_text))
+            lines.extend('{}_total{{{}}} {}'.format(metric, labels[name], records[name][key]) for name in names)
+
+        metric = 'taskr_task_duration_seconds'
+        lines.append('# TYPE {} histogram'.format(metric))
+        lines.append('# HELP {} Duration of runs of the task.'.format(metric))
+        for name in names:
+            record = records[name]
+            cumulative_count = 0
+            for bound, count in zip(self.buckets, record['buckets']):
+                cumulative_count += count
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(metric, labels[name], _format_bound(bound),
+                                                                 cumulative_count))
+            lines.append('{}_sum{{{}}} {}'.format(metric, labels[name], repr(float(record['sum']))))
+            lines.append('{}_count{{{}}} {}'.format(metric, labels[name], record['runs']))
+        if openmetrics:
+            lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path=None):
+        """
+        Add observations since the last write to the records kept beside the file, and write all of them.
+        Processes writing the same file are serialized by a lock file.
+
+        :type path: str
+        """
+        path = path or self.path
+        with self._lock:
+            pending_records, self._pending_records = self._pending_records, {}
+
+        state_path = path + '.state.json'
+        state_written = False
+        try:
+            with open(path + '.lock', 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    with open(state_path, 'r') as f:
+                        records = json.load(f)
+                except (IOError, OSError, ValueError):
+                    records = {}
+                for name, record in pending_records.items():
+                    self._add(records, name, record['runs'], record['failures'], record['sum'], record['buckets'])
+                write_file_atomically(state_path, json.dumps(records, sort_keys=True).encode('utf-8'))
+                state_written = True
+                rendered = self.render(records, openmetrics=not path.endswith('.prom'))
+                write_file_atomically(path, rendered.encode('utf-8'))
+        except BaseException:
+            if not state_written:
+                # Keep the observations for the next write
+                with self._lock:
+                    for name, record in pending_records.items():
+                        self._add(self._pending_records, name, record['runs'], record['failures'], record['sum'],
+                                  record['buckets'])
+            raise
+
+    def serve_http(self, port, host='127.0.0.1'):
+        """
+        Serve metrics of this process at `http://HOST:PORT/metrics` on a background thread. The server of an address
+        is shared in the process, so metrics of all task managers serving on the same address are served together.
+
+        :param port: 0 means a new server on any free port. The server is `server` of this object
+        :type port: int
+        :type host: str
+        :rtype: BaseHTTPServer.HTTPServer
+        """
+        self.server = _shared_http_server(port, host).add_collector(self)
+        return self.server
+
+
+class _MetricsHTTPServer(object):
+    """
+    HTTP server of metrics shared by collectors in the process.
+    """
+
+    def __init__(self, port, host):
+        """
+        :type port: int
+        :type host: str
+        """
+        self.collectors = []
+        """:type: list[TaskMetrics]"""
+        self._lock = threading.Lock()
+        shared_server = self
+
+        class MetricsRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                openmetrics = 'application/openmetrics-text' in (self.headers.get('Accept', None) or '')
+                body = shared_server.render(openmetrics=openmetrics).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE)
+                self.send_header('Content-Length', six.text_type(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # Don't write to stderr of tasks
+
+        class MetricsServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        self.server = MetricsServer((host, port), MetricsRequestHandler)
+        thread = threading.Thread(target=self.server.serve_forever, name='taskr-metrics')
+        thread.daemon = True
+        thread.start()
+
+    def add_collector(self, metrics):
+        """
+        :type metrics: TaskMetrics
+        :rtype: BaseHTTPServer.HTTPServer
+        """
+        with self._lock:
+            if self.collectors and self.collectors[0].buckets != metrics.buckets:
+                raise ValueError('Metrics served on the same address should have the same buckets')
+            if metrics not in self.collectors:
+                self.collectors.append(metrics)
+        return self.server
+
+    def render(self, openmetrics=True):
+        """
+        :type openmetrics: bool
+        :rtype: str
+        """
+        with self._lock:
+            collectors = list(self.collectors)
+        records = {}
+        for metrics in collectors:
+            # noinspection PyProtectedMember
+            with metrics._lock:
+                for name, record in metrics._records.items():
+                    # noinspection PyProtectedMember
+                    metrics._add(records, name, record['runs'], record['failures'], record['sum'], record['buckets'])
+        return (collectors[0] if collectors else TaskMetrics()).render(records, openmetrics=openmetrics)
+
+
+# Servers of metrics by (host, port)
+_http_servers = {}
+""":type: dict[(str, int), _MetricsHTTPServer]"""
+_http_servers_lock = threading.Lock()
+
+
+def _shared_http_server(port, host):
+    """
+    :type port: int
+    :type host: str
+    :rtype: _MetricsHTTPServer
+    """
+    with _http_servers_lock:
+        shared_server = _http_servers.get((host, port), None)
+        if shared_server is None:
+            shared_server = _MetricsHTTPServer(port, host)
+            # Keyed by the bound port, so a server on any free port is reused only by its port
+            _http_servers[(host, shared_server.server.server_address[1])] = shared_server
+        return shared_server
@@ -0,0 +1,333 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Separate output of tasks running concurrently.
+
+Each task gets its own stream, and `sys.stdout`, `sys.stderr` and consoles of its thread write to it:
+
+* `prefix`: each line is written at once with the label of the task in color
+* `group`: output of a task is written together when the task finished
+* `file`: output of a task is written to a log file. The last lines are shown if the task failed
+
+Memory is bounded in every mode. Grouped output is spilled to a temporary file when it's large, and only the last
+lines of a log file are kept in memory.
+"""
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import codecs
+import io
+import os
+import re
+import sys
+import tempfile
+import threading
+import zlib
+from collections import deque
+from contextlib import contextmanager
+
+import six
+
+from .terminal import Color, Console, ThreadRoutedStream, redirect_thread_output
+
+MODES = ('prefix', 'group', 'file')
+_label_colors = (Color.CYAN, Color.GREEN, Color.YELLOW, Color.MAGENTA, Color.BLUE, Color.LIGHT_CYAN,
+                 Color.LIGHT_GREEN, Color.LIGHT_YELLOW, Color.LIGHT_MAGENTA, Color.LIGHT_BLUE)
+# A line longer than this is written in pieces in prefix mode
+_max_line_length = 64 * 1024
+
+
+def _text(data):
+    """
+    :type data: str|bytes
+    :rtype: str
+    """
+    return data.decode('utf-8', 'replace') if isinstance(data, six.binary_type) else data
+
+
+def log_file_name(label):
+    """
+    >>> print(log_file_name('deploy web-1 --region=us/east'))
+    deploy_web-1_--region_us_east.log
+
+    :type label: str
+    :rtype: str
+    """
+    return re.sub(r'[^\w.-]+', '_', label, flags=re.UNICODE).strip('_')[:100] + '.log'
+
+
+class TaskStream(object):
+    """
+    Output stream of a task. Complete lines are passed to `write_line`, and `close` is called when the task finished.
+    """
+
+    encoding = 'utf-8'
+
+    def __init__(self, label):
+        """
+        :type label: str
+        """
+        self.label = label
+        self.failed = False
+        self._partial_line = ''
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<{}: {}>'.format(self.__class__.__name__, self.label)
+
+    def write(self, data):
+        data = _text(data)
+        with self._lock:
+            lines = (self._partial_line + data).split('\n')
+            self._partial_line = lines.pop()
+            if len(self._partial_line) > _max_line_length:
+                lines.append(self._partial_line)
+                self._partial_line = ''
+            for line in lines:
+                self.write_line(line)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    @staticmethod
+    def isatty():
+        return False
+
+    def write_line(self, line):
+        """
+        :type line: str
+        """
+        raise NotImplementedError
+
+    def close(self):
+        with self._lock:
+            if self._partial_line:
+                self.write_line(self._partial_line)
+                self._partial_line = ''
+
+
+class PrefixedStream(TaskStream):
+    """
+    Write each line at once with the label of the task.
+    """
+
+    def __init__(self, label, output, lock, color=True):
+        """
+        :type label: str
+        :type output: io.TextIOBase
+        :type lock: threading.Lock
+        :type color: bool
+        """
+        super(PrefixedStream, self).__init__(label)
+        prefix = '[{}] '.format(label)
+        if color:
+            prefix = Color.str(prefix, _label_colors[zlib.crc32(label.encode('utf-8')) % len(_label_colors)])
+        self._prefix = prefix
+        self._output = output
+        self._output_lock = lock
+
+    def write_line(self, line):
+        with self._output_lock:
+            self._output.write('{}{}\n'.format(self._prefix, line))
+            self._output.flush()
+
+
+class GroupedStream(TaskStream):
+    """
+    Keep output of the task, and write it together when the task finished. It's kept in memory until it's larger than
+    `spool_size`, and then in a temporary file.
+    """
+
+    def __init__(self, label, output, lock, spool_size=1024 * 1024, color=True):
+        """
+        :type label: str
+        :type output: io.TextIOBase
+        :type lock: threading.Lock
+        :type spool_size: int
+        :type color: bool
+        """
+        super(GroupedStream, self).__init__(label)
+        self._output = output
+        self._output_lock = lock
+        self._color = color
+        self._spool = tempfile.SpooledTemporaryFile(max_size=spool_size, mode='w+b', prefix='taskr-output-')
+
+    def write(self, data):
+        # Lines don't matter, so it isn't split.
+        with self._lock:
+            self._spool.write(_text(data).encode('utf-8'))
+
+    def close(self):
+        with self._lock, self._output_lock:
+            console = Console(self._output, color=self._color)
+            (console.error if self.failed else console.highlight)(self.label, bar_width=80)
+            self._spool.seek(0)
+            decoder = codecs.getincrementaldecoder('utf-8')('replace')
+            for chunk in iter(lambda: self._spool.read(64 * 1024), b''):
+                self._output.write(decoder.decode(chunk))
+            self._output.write(decoder.decode(b'', final=True))
+            self._output.flush()
+            self._spool.close()
+
+
+class FileStream(TaskStream):
+    """
+    Write output of the task to a log file, and keep the last lines to show them if the task failed.
+    """
+
+    def __init__(self, label, path, output, lock, tail_lines=20, color=True):
+        """
+        :type label: str
+        :type path: str
+        :type output: io.TextIOBase
+        :type lock: threading.Lock
+        :type tail_lines: int
+        :type color: bool
+        """
+        super(FileStream, self).__init__(label)
+        self.path = path
+        self._file = io.open(path, 'w', encoding='utf-8')
+        self._tail = deque(maxlen=tail_lines)
+        self._output = output
+        self._output_lock = lock
+        self._color = color
+
+    def write_line(self, line):
+        self._file.write(line + '\n')
+        self._tail.append(line)
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        super(FileStream, self).close()
+        self._file.close()
+        with self._output_lock:
+            console = Console(self._output, color=self._color)
+            if self.failed:
+                console.error('{} failed. Log: {}'.format(self.label, self.path))
+                for line in self._tail:
+                    self._output.write('    {}\n'.format(line))
+            else:
+                console.info('{}: log is written to {}'.format(self.label, self.path))
+            self._output.flush()
+
+
+class OutputMultiplexer(object):
+    """
+    Give each task its own output stream by `task_output`.
+    """
+
+    def __init__(self, mode, output=None, log_dir='taskr-logs', spool_size=1024 * 1024, tail_lines=20, color=True):
+        """
+        :param mode: 'prefix', 'group' or 'file'
+        :param output: where output of tasks is written at last. default is `sys.stdout` when it's written
+        :param log_dir: directory of log files in file mode
+        :param spool_size: bytes of grouped output of a task kept in memory
+        :param tail_lines: last lines of a log file shown when the task failed
+        :type mode: str
+        :type output: io.TextIOBase
+        :type log_dir: str
+        :type spool_size: int
+        :type tail_lines: int
+        :type color: bool
+        """
+        if mode not in MODES:
+            raise ValueError('Unknown output mode: {}. Should be one of {}'.format(mode, ', '.join(MODES)))
+        self.mode = mode
+        self.output = output
+        self.log_dir = log_dir
+        self.spool_size = spool_size
+        self.tail_lines = tail_lines
+        self.color = color
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<OutputMultiplexer: {}>'.format(self.mode)
+
+    def __reduce__(self):
+        # It's passed to workers of process pools. Locks are not shared, but each line is still written at once.
+        if self.output is not None:
+            raise TypeError('OutputMultiplexer with an output stream cannot be pickled')
+        return (OutputMultiplexer,
+                (self.mode, None, self.log_dir, self.spool_size, self.tail_lines, self.color))
+
+    def _real_output(self):
+        """
+        :rtype: io.TextIOBase
+        """
+        output = self.output or sys.stdout
+        return output.stream if isinstance(output, ThreadRoutedStream) else output
+
+    def _open_log_file(self, label):
+        """
+        :type label: str
+        :return: a path which no other task is writing
+        :rtype: str
+        """
+        if not os.path.isdir(self.log_dir):
+            try:
+                os.makedirs(self.log_dir)
+            except OSError:
+                if not os.path.isdir(self.log_dir):
+                    raise
+        base_path = os.path.join(self.log_dir, log_file_name(label))
+        path, idx = base_path, 1
+        while True:
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return path
+            except OSError:
+                if not os.path.exists(path):
+                    raise
+                idx += 1
+                path = '{}-{}.log'.format(base_path[:-len('.log')], idx)
+
+    def stream(self, label):
+        """
+        :type label: str
+        :rtype: TaskStream
+        """
+        output = self._real_output()
+        if self.mode == 'prefix':
+            return PrefixedStream(label, output, self._lock, color=self.color)
+        elif self.mode == 'group':
+            return GroupedStream(label, output, self._lock, spool_size=self.spool_size, color=self.color)
+        return FileStream(label, self._open_log_file(label), output, self._lock, tail_lines=self.tail_lines,
+                          color=self.color)
+
+    @contextmanager
+    def task_output(self, label):
+        """
+        Redirect output of current thread to the stream of a task in the block. Set `failed` of the stream if the
+        task failed without raising an exception.
+
+        :type label: str
+        :rtype: TaskStream
+        """
+        stream = self.stream(label)
+        try:
+            with redirect_thread_output(stream):
+                yield stream
+        except BaseException:
+            stream.failed = True
+            raise
+        finally:
+            stream.close()
@@ -0,0 +1,226 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import cProfile
+import io
+import json
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from timeit import default_timer
+
+import six
+
+PROFILERS = ('cprofile', 'tracemalloc', 'trace')
+_output_suffixes = {
+    'cprofile': '.pstats',
+    'tracemalloc': '.tracemalloc.txt',
+    'trace': '.trace.json',
+}
+
+
+def default_output_path(profiler, name):
+    """
+    >>> default_output_path('cprofile', 'build')
+    'build.pstats'
+
+    :type profiler: str
+    :type name: str
+    :rtype: str
+    """
+    return name + _output_suffixes[profiler]
+
+
+class SpanTracer(object):
+    """
+    Record wall-clock spans of Python function calls on all threads, and write them as Chrome trace events. (Open
+    the file with chrome://tracing or Perfetto)
+    """
+
+    def __init__(self, name, max_events=1000000):
+        """
+        :param name: name of the root span
+        :param max_events: spans after this number are dropped to bound memory
+        :type name: str
+        :type max_events: int
+        """
+        self.name = name
+        self.max_events = max_events
+        self.events = []
+        """:type: list[dict]"""
+        self.dropped_events = 0
+        self._stacks = threading.local()
+        self._pid = os.getpid()
+        self._origin = default_timer()
+        self._start = None
+
+    def _timestamp(self):
+        """
+        :rtype: float
+        """
+        return (default_timer() - self._origin) * 1000000
+
+    def _profile(self, frame, event, arg):
+        if event == 'call':
+            stack = getattr(self._stacks, 'stack', None)
+            if stack is None:
+                stack = self._stacks.stack = []
+            stack.append((frame.f_code, self._timestamp()))
+        elif event == 'return':
+            stack = getattr(self._stacks, 'stack', None)
+            if not stack:
+                return
+            code, start = stack.pop()
+            if len(self.events) >= self.max_events:
+                self.dropped_events += 1
+                return
+            self.events.append({
+                'name': code.co_name,
+                'cat': 'python',
+                'ph': 'X',
+                'ts': start,
+                'dur': self._timestamp() - start,
+                'pid': self._pid,
+                'tid': threading.current_thread().ident,
+                'args': {'location': '{}:{}'.format(code.co_filename, code.co_firstlineno)},
+            })
+
+    def start(self):
+        self._start = self._timestamp()
+        threading.setprofile(self._profile)
+        sys.setprofile(self._profile)
+
+    def stop(self):
+        sys.setprofile(None)
+        threading.setprofile(None)
+        self.events.append({
+            'name': self.name,
+            'cat': 'task',
+            'ph': 'X',
+            'ts': self._start,
+            'dur': self._timestamp() - self._start,
+            'pid': self._pid,
+            'tid': threading.current_thread().ident,
+        })
+
+    def write(self, path):
+        """
+        :type path: str
+        """
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write(six.text_type(json.dumps({
+                'traceEvents': self.events,
+                'displayTimeUnit': 'ms',
+                'otherData': {'dropped_events': self.dropped_events},
+            })))
+
+
+class _PeakSnapshotSampler(threading.Thread):
+    """
+    Take a tracemalloc snapshot whenever traced memory grows by 10% since the last snapshot, so the report shows
+    what was allocated around the peak instead of what's left at the end.
+    """
+
+    def __init__(self, interval=0.05):
+        super(_PeakSnapshotSampler, self).__init__(name='taskr-tracemalloc-sampler')
+        self.daemon = True
+        self.interval = interval
+        self.snapshot = None
+        self.snapshot_size = 0
+        self._stopped = threading.Event()
+
+    def sample(self):
+        import tracemalloc
+        current, _ = tracemalloc.get_traced_memory()
+        # The first sample is always taken, so there's a snapshot even if nothing was traced.
+        if self.snapshot is None or current > self.snapshot_size * 1.1:
+            self.snapshot = tracemalloc.take_snapshot()
+            self.snapshot_size = current
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self.sample()
+
+
+def _write_tracemalloc_report(snapshot, snapshot_size, path, top):
+    """
+    :type snapshot: tracemalloc.Snapshot
+    :type snapshot_size: int
+    :type path: str
+    :type top: int
+    """
+    import tracemalloc
+    current, peak = tracemalloc.get_traced_memory()
+    lines = ['Current: {:.1f} KiB, Peak: {:.1f} KiB'.format(current / 1024, peak / 1024),
+             'Top {} allocations by line when {:.1f} KiB was traced:'.format(top, snapshot_size / 1024)]
+    for idx, statistic in enumerate(snapshot.statistics('lineno')[:top]):
+        frame = statistic.traceback[0]
+        lines.append('#{}: {}:{}: {:.1f} KiB in {} blocks'.format(
+            idx + 1, frame.filename, frame.lineno, statistic.size / 1024, statistic.count))
+    with io.open(path, 'w', encoding='utf-8') as f:
+        f.write(six.text_type('\n'.join(lines) + '\n'))
+
+
+@contextmanager
+def profile(profiler, output_path, name='task', top=25):
+    """
+    Run the block under a profiler and write the result to `output_path`.
+
+    * `cprofile`: pstats file of cProfile (read it by `python -m pstats`)
+    * `tracemalloc`: text report of the top N lines which allocate memory around the peak (Python 3 only)
+    * `trace`: Chrome trace events of wall-clock spans of Python function calls
+
+    :type profiler: str
+    :type output_path: str
+    :type name: str
+    :type top: int
+    """
+    if profiler == 'cprofile':
+        profile_obj = cProfile.Profile()
+        profile_obj.enable()
+        try:
+            yield
+        finally:
+            profile_obj.disable()
+            profile_obj.dump_stats(output_path)
+    elif profiler == 'tracemalloc':
+        import tracemalloc
+        tracemalloc.start()
+        sampler = _PeakSnapshotSampler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            _write_tracemalloc_report(sampler.snapshot, sampler.snapshot_size, output_path, top)
+            tracemalloc.stop()
+    elif profiler == 'trace':
+        tracer = SpanTracer(name)
+        tracer.start()
+        try:
+            yield
+        finally:
+            tracer.stop()
+            tracer.write(output_path)
+    else:
+        raise ValueError('Unknown profiler: {}. Should be one of {}'.format(profiler, ', '.join(PROFILERS)))
@@ -0,0 +1,151 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Split invocations of a batch or matrix into shards, so parallel CI nodes run each invocation exactly once.
+
+Every node computes the same assignment from the list of invocations and the recorded durations, so no coordination
+is needed, as long as all nodes read the same durations file. Invocations are balanced by their recorded durations
+(longest first, to the least loaded shard). Without any recorded duration, they're dealt round-robin in the order of
+their keys, so shards differ by at most one invocation.
+"""
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import heapq
+import json
+import threading
+
+from six.moves import shlex_quote
+
+from .cache import write_file_atomically
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def parse_shard(option):
+    """
+    >>> parse_shard('2/4')
+    (2, 4)
+
+    :param option: `I/N`. I starts from 1
+    :type option: str
+    :rtype: (int, int)
+    """
+    index, separator, count = option.partition('/')
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        separator = None
+    if not separator or not 1 <= index <= count:
+        raise ValueError('Shard should be I/N, and 1 <= I <= N: {}'.format(option))
+    return index, count
+
+
+def invocation_key(args):
+    """
+    >>> print(invocation_key(['lint', 'src/a b.py']))
+    lint 'src/a b.py'
+
+    :type args: list[str]
+    :rtype: str
+    """
+    return ' '.join(map(shlex_quote, args))
+
+
+def assign_shards(keys, count, durations=None):
+    """
+    Assign each invocation to a shard. Invocations without recorded durations are estimated by the mean of recorded
+    ones.
+
+    >>> assign_shards(['a', 'b', 'c', 'd'], 2, {'a': 4.0, 'b': 3.0, 'c': 2.0, 'd': 1.0})
+    [0, 1, 1, 0]
+    >>> assign_shards(['d', 'a', 'c', 'b', 'e'], 2)
+    [1, 0, 0, 1, 0]
+    >>> assign_shards(['a', 'b', 'c', 'd'], 2) == assign_shards(['a', 'b', 'c', 'd'], 2, {})
+    True
+
+    :param keys: `invocation_key` of each invocation
+    :param count: number of shards
+    :param durations: recorded seconds of invocations
+    :type keys: list[str]
+    :type count: int
+    :type durations: dict[str, float]
+    :return: shard (starts from 0) of each invocation
+    :rtype: list[int]
+    """
+    durations = durations or {}
+    recorded = [durations[key] for key in keys if key in durations]
+    if not recorded:
+        # The order of keys doesn't depend on the order of invocations, so every node deals them in the same way.
+        shards = [None] * len(keys)
+        for position, idx in enumerate(sorted(range(len(keys)), key=lambda _idx: (keys[_idx], _idx))):
+            shards[idx] = position % count
+        return shards
+
+    estimate = sum(recorded) / len(recorded)
+    seconds = [durations.get(key, estimate) for key in keys]
+    shards = [None] * len(keys)
+    loads = [(0.0, shard) for shard in range(count)]
+    # Longest first. Ties are broken by keys, so the order doesn't depend on the order of invocations.
+    for idx in sorted(range(len(keys)), key=lambda _idx: (-seconds[_idx], keys[_idx], _idx)):
+        load, shard = heapq.heappop(loads)
+        shards[idx] = shard
+        heapq.heappush(loads, (load + seconds[idx], shard))
+    return shards
+
+
+class DurationStore(object):
+    """
+    Recorded seconds of invocations in a JSON file, which is an object of `invocation_key` to seconds.
+    Commit it, or share it between CI nodes, so they balance shards in the same way.
+    """
+
+    def __init__(self, path):
+        """
+        :type path: str
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<DurationStore: {}>'.format(self.path)
+
+    def load(self):
+        """
+        :rtype: dict[str, float]
+        """
+        try:
+            with open(self.path, 'r') as f:
+                durations = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        return durations if isinstance(durations, dict) else {}
+
+    def record(self, durations):
+        """
+        Replace durations of these invocations, and keep the others. Processes writing the same file are serialized
+        by a lock file.
+
+        :type durations: dict[str, float]
+        """
+        with self._lock, open(self.path + '.lock', 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            recorded_durations = self.load()
+            recorded_durations.update(durations)
+            write_file_atomically(self.path, json.dumps(recorded_durations, indent=2, sort_keys=True).encode('utf-8'))
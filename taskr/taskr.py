@@ -16,19 +16,34 @@
 from __future__ import unicode_literals, print_function, absolute_import, division
 
 import argparse
-import functools
 import inspect
 import os
 import re
+import shlex
 import sys
+import threading
 import types
+import uuid
 import weakref
 from collections import OrderedDict
+from concurrent import futures
 from copy import deepcopy
+from timeit import default_timer
 
 import six
+from six.moves import shlex_quote
 
+from . import profiling, watchdog
 from .argparser import ArgumentParser, ArgumentParserError
+from .cache import TaskMetadataCache
+from .contrib.lang import import_string
+from .executor import GraphExecutor, create_pool, submit_dispatch
+from .fastparse import compile_parser
+from .matrix import expand_matrix, load_matrix_file, parse_matrix_options, render_arguments, template_keys
+from .memo import TaskMemo
+from .multiplex import MODES as OUTPUT_MODES, OutputMultiplexer
+from .sharding import DurationStore, assign_shards, invocation_key, parse_shard
+from .uptodate import FingerprintStore
 from .terminal import Color, Console
 
 whitespace_pattern = re.compile(r'\s+')
@@ -74,23 +89,116 @@ class TaskrHelpFormatter(argparse.ArgumentDefaultsHelpFormatter, argparse.RawDes
     pass
 
 
+class _InvocationState(threading.local):
+    """
+    State of the invocation running on current thread.
+    """
+
+    def __init__(self):
+        self.executing_task = None
+        """:type: Task"""
+        self.exit_code = 0
+        self.global_options = None
+        """:type: argparse.Namespace"""
+        self.arguments = {}
+        """:type: dict[Task, dict|argparse.Namespace]"""
+        self.run_id = None
+        """:type: str"""
+
+
 class TaskManager(object):
 
     def __init__(self):
         self._tasks = set()
         """:type: set[Task]"""
+        self._state = _InvocationState()
 
         # Argument parsers
-        self.parser = ArgumentParser(formatter_class=TaskrHelpFormatter)
-        self.action_subparser = self.parser.add_subparsers(title='Action')
+        self._global_arguments = []
+        """:type: list[(tuple, dict)]"""
+        self._build_parser()
+        self.global_parser = ArgumentParser(add_help=False)
+        self.add_global_argument('--jobs', type=int, default=int(os.environ.get('TASKR_JOBS', '1')),
+                                 help='Number of dependency tasks or batch invocations to run concurrently')
+        self.add_global_argument('--force', action='store_true',
+                                 default=int(os.environ.get('TASKR_FORCE', '0')) != 0,
+                                 help='Run tasks even if their outputs are up to date')
+        self.add_global_argument('--batch', metavar='FILE',
+                                 help='Run an invocation for each line of the file ("-" for stdin). Arguments of '
+                                      'each line are appended to the arguments after this option')
+        self.add_global_argument('--timeout', type=float, metavar='SECONDS',
+                                 default=float(os.environ.get('TASKR_TIMEOUT', '0')) or None,
+                                 help='Default timeout of tasks. A task which timed out exits with {}'.format(
+                                     watchdog.TIMEOUT_EXIT_CODE))
+        self.add_global_argument('--matrix', action='append', metavar='KEY=VALUES',
+                                 help='Run the action for each value of KEY (values are separated by ","). '
+                                      '"{KEY}" in arguments is replaced by the value. It can be repeated, and the '
+                                      'product of values is used. Values of a repeated KEY are merged')
+        self.add_global_argument('--matrix-file', metavar='FILE',
+                                 help='Like --matrix, but values come from a JSON file ("-" for stdin), which is an '
+                                      'object of value lists or a list of objects')
+        self.add_global_argument('--shard', metavar='I/N',
+                                 help='Run the I-th of N parts of --batch or --matrix invocations (I starts from 1). '
+                                      'Parts are balanced by --durations-file, or dealt round-robin without it')
+        self.add_global_argument('--durations-file', metavar='PATH',
+                                 default=os.environ.get('TASKR_DURATIONS_FILE', None) or '.taskr-durations.json',
+                                 help='Recorded durations of invocations to balance shards. '
+                                      'default is .taskr-durations.json')
+        self.add_global_argument('--store-durations', action='store_true', default=False,
+                                 help='Record durations of --batch or --matrix invocations to --durations-file')
+        self.add_global_argument('--process-pool', action='store_true', default=False,
+                                 help='Run concurrent tasks or invocations on forked processes instead of threads')
+        self.add_global_argument('--output-mode', choices=OUTPUT_MODES,
+                                 default=os.environ.get('TASKR_OUTPUT_MODE', None) or None,
+                                 help='Separate output of dependency tasks or batch invocations: prefix each line '
+                                      'with the task, group it until the task finished, or write it to a log file')
+        self.add_global_argument('--output-dir', metavar='DIR',
+                                 default=os.environ.get('TASKR_OUTPUT_DIR', None) or 'taskr-logs',
+                                 help='Directory of log files of --output-mode=file. default is taskr-logs')
+        self.add_global_argument('--serve', metavar='SOCKET',
+                                 help='Keep running and serve invocations from "python -m taskr.daemon SOCKET ..."')
+        self.add_global_argument('--fork-per-request', action='store_true', default=False,
+                                 help='Serve each invocation by a forked process')
+        self.add_global_argument('--profile', choices=profiling.PROFILERS,
+                                 default=os.environ.get('TASKR_PROFILE', None) or None,
+                                 help='Run the task under cProfile, tracemalloc, or a span tracer')
+        self.add_global_argument('--profile-output', metavar='PATH',
+                                 default=os.environ.get('TASKR_PROFILE_OUTPUT', None) or None,
+                                 help='Where to write the profile. default is named after the task')
+        self.profile_top = int(os.environ.get('TASKR_PROFILE_TOP', '25'))
+
+        # Functions called around each task. See `add_hook`
+        self.hooks = {'pre': [], 'post': [], 'error': []}
+        """:type: dict[str, list[callable]]"""
+        # Count, duration and failures of tasks
+        self.metrics = None
+        """:type: taskr.metrics.TaskMetrics"""
+        if os.environ.get('TASKR_METRICS_FILE', None) or os.environ.get('TASKR_METRICS_PORT', None):
+            from .metrics import TaskMetrics
+            self.metrics = TaskMetrics.from_environ().install(self)
+        # Runs of tasks in a SQLite database
+        self.history = None
+        """:type: taskr.history.TaskHistory"""
+        if os.environ.get('TASKR_HISTORY_FILE', None) or int(os.environ.get('TASKR_HISTORY', '0')) != 0:
+            from .history import TaskHistory
+            self.history = TaskHistory.from_environ().install(self)
+
+        # Fingerprints of tasks with inputs or outputs
+        self.fingerprints = FingerprintStore()
+
+        # Run dependencies on processes instead of threads
+        self.use_process_pool = int(os.environ.get('TASKR_PROCESS_POOL', '0')) != 0
 
         # Exception handling
         self.should_raise_exceptions = int(os.environ.get('TASKR_RAISE_EXCEPTION', '0')) != 0
-        self.exit_code = 0
+        # Build argparser of the selected task only
+        self.lazy_dispatch = int(os.environ.get('TASKR_LAZY_DISPATCH', '0')) != 0
+        # Cache parsed docstrings and argument specs on disk
+        self.metadata_cache = (TaskMetadataCache()
+                               if int(os.environ.get('TASKR_METADATA_CACHE', '0')) != 0 else None)
+        """:type: taskr.cache.TaskMetadataCache"""
 
         # Executing info
-        self._executing_task = None
-        """:type: Task"""
         self._main_task = None
 
         self.pool = {}
@@ -106,6 +214,70 @@ class TaskManager(object):
     def executing_task(self):
         return self._executing_task
 
+    @property
+    def _executing_task(self):
+        """
+        :rtype: Task
+        """
+        return self._state.executing_task
+
+    @_executing_task.setter
+    def _executing_task(self, task_object):
+        self._state.executing_task = task_object
+
+    @property
+    def exit_code(self):
+        """
+        Exit code after the executing task finished successfully. It's kept for each thread.
+
+        :rtype: int
+        """
+        return self._state.exit_code
+
+    @exit_code.setter
+    def exit_code(self, exit_code):
+        self._state.exit_code = exit_code
+
+    @property
+    def global_options(self):
+        """
+        Values of global arguments of the current invocation.
+
+        :rtype: argparse.Namespace
+        """
+        if self._state.global_options is None:
+            self._state.global_options = self.global_parser.parse_args([])
+        return self._state.global_options
+
+    @global_options.setter
+    def global_options(self, global_options):
+        self._state.global_options = global_options
+
+    @property
+    def run_id(self):
+        """
+        ID of the current invocation. A dispatched task and its dependencies share it, so each request of a daemon or
+        command of a shell has its own one.
+
+        :rtype: str
+        """
+        if self._state.run_id is None:
+            self._state.run_id = uuid.uuid4().hex
+        return self._state.run_id
+
+    @run_id.setter
+    def run_id(self, run_id):
+        self._state.run_id = run_id
+
+    def reset_invocation_state(self):
+        """
+        Forget the executing task, exit code, global options, run ID and arguments of tasks of the current thread.
+        Arguments of the last invocation, which other threads fall back to, are forgotten too.
+        """
+        self._state.__init__()
+        for task_object in list(self._tasks):
+            task_object._arguments = None
+
     @property
     def help_text(self):
         return self.parser.epilog
@@ -142,6 +314,189 @@ class TaskManager(object):
         else:
             raise ValueError('{} object is not callable'.format(callable_obj))
 
+    def register_lazy(self, name, import_path, help_text=None, aliases=()):
+        """
+        Register a task by the dotted path of its callable (or its task object). It's listed in help and completion,
+        but its module is imported only when the task is invoked.
+
+        :param name: action name of the task
+        :param import_path: e.g. 'deploy.tasks.build_image'
+        :param help_text: short help shown in the list of actions
+        :param aliases: other action names of the task
+        :type name: str
+        :type import_path: str
+        :type help_text: str
+        :type aliases: list[str]
+        :rtype: LazyTask
+        """
+        task_obj = LazyTask(name, import_path, self, help_text=help_text)
+        task_obj.aliases = list(aliases)
+        self._tasks.add(task_obj)
+        return task_obj
+
+    def _load_selected_task(self, args):
+        """
+        Import the selected task if it's registered lazily, so its argparser is built from the real callable.
+
+        :type args: list[str]
+        """
+        if len(args) > 0:
+            selected_task = self._task_index().get(args[0], None)
+            if selected_task:
+                selected_task.load()
+
+    def _task_index(self):
+        """
+        :rtype: dict[str, Task]
+        """
+        index = {}
+        for task in self.tasks:
+            index[task.name] = task
+            if six.PY3:
+                for alias in task.aliases:
+                    index[alias] = task
+        return index
+
+    def _parse_fast(self, args):
+        """
+        :type args: list[str]
+        :return: the namespace of the selected task, or `None` if argparse is needed
+        :rtype: argparse.Namespace
+        """
+        if len(args) > 0:
+            selected_task = self._task_index().get(args[0], None)
+            if selected_task:
+                return selected_task.load().parse_fast(args[1:])
+        return None
+
+    def _tasks_to_setup(self, args):
+        """
+        :type args: list[str]
+        :rtype: collections.Iterable[Task]
+        """
+        if len(args) > 0:
+            selected_task = self._task_index().get(args[0], None)
+            if selected_task:
+                return [selected_task]
+            elif self.main_task and args[0] not in ('-h', '--help'):
+                # Not an action name, so it would fall back to main task.
+                return [self.main_task]
+        # Top-level help or error. Every task should be listed.
+        return self.tasks
+
+    def _build_parser(self, epilog=None):
+        """
+        :type epilog: str
+        """
+        self.parser = ArgumentParser(formatter_class=TaskrHelpFormatter, epilog=epilog)
+        self.action_subparser = self.parser.add_subparsers(title='Action')
+        self._global_argument_group = self.parser.add_argument_group(title='Taskr')
+        for args, kwargs in self._global_arguments:
+            self._global_argument_group.add_argument(*args, **kwargs)
+
+    def release_parsers(self):
+        """
+        Drop argparsers of all tasks, so they can be garbage collected after dispatching. They are built again when
+        they're needed. Don't call it while another thread is dispatching.
+        """
+        for task in self.tasks:
+            task.parser = None
+            task.argument_groups = None
+        self._build_parser(self.parser.epilog)
+
+    def add_global_argument(self, *args, **kwargs):
+        """
+        Add an option which should be put before the action name. e.g. `taskfile.py --jobs 4 build`.
+        Its value is available by `global_options` after dispatching.
+        """
+        action = self.global_parser.add_argument(*args, **kwargs)
+        if action.nargs not in (None, 0):
+            raise ValueError('Global arguments should take zero or one value.')
+        if self._state.global_options is not None:
+            setattr(self._state.global_options, action.dest, action.default)
+        # Only for help. It's parsed by `global_parser`.
+        kwargs['default'] = argparse.SUPPRESS
+        self._global_arguments.append((args, kwargs))
+        self._global_argument_group.add_argument(*args, **kwargs)
+
+    def _split_global_arguments(self, args):
+        """
+        :type args: list[str]
+        :rtype: (list[str], list[str])
+        """
+        # noinspection PyProtectedMember
+        option_string_actions = self.global_parser._option_string_actions
+        idx = 0
+        while idx < len(args) and args[idx].startswith('-'):
+            option_string, has_value = args[idx].split('=', 1)[0], '=' in args[idx]
+            action = option_string_actions.get(option_string, None)
+            if not action:
+                break
+            idx += 1 if has_value or action.nargs == 0 else 2
+        global_args, action_args = list(args[:idx]), list(args[idx:])
+
+        if global_args and self.main_task and not (action_args and action_args[0] in self._task_index()):
+            # It falls back to the main task. Options of the main task win if they have the same names.
+            main_option_strings = self._main_task_option_strings()
+            if any(arg.split('=', 1)[0] in main_option_strings for arg in global_args):
+                return [], list(args)
+        return global_args, action_args
+
+    def _main_task_option_strings(self):
+        """
+        :rtype: set[str]
+        """
+        option_strings = set()
+        for _, arg_args, _ in self.main_task.load().metadata['arguments']:
+            option_strings.update(arg for arg in arg_args if arg.startswith('-'))
+        return option_strings
+
+    @staticmethod
+    def _setup_argparsers(tasks):
+        """
+        :type tasks: collections.Iterable[Task]
+        """
+        for task in tasks:
+            if task.parser is None:
+                task.setup_argparser()
+
+    def add_hook(self, event, hook):
+        """
+        Call a function around each task invoked by dispatching or as a dependency.
+
+        * `pre`: `hook(task, args, kwargs)` before the task is called
+        * `post`: `hook(task, result, seconds)` after the task returned (or exited with 0)
+        * `error`: `hook(task, exception, seconds)` after the task raised
+
+        Tasks skipped because they're up to date don't call hooks. An exception of a `pre` hook fails the task before
+        it's called. Exceptions of `post` and `error` hooks are printed to stderr, and don't change the result.
+
+        :type event: str
+        :type hook: callable
+        :return: the hook
+        :rtype: callable
+        """
+        if event not in self.hooks:
+            raise ValueError('Unknown event: {}. Should be one of {}'.format(event, ', '.join(sorted(self.hooks))))
+        self.hooks[event].append(hook)
+        return hook
+
+    def _run_hooks(self, event, task_object, *args):
+        """
+        :type event: str
+        :type task_object: Task
+        """
+        for hook in self.hooks[event]:
+            if event == 'pre':
+                hook(task_object, *args)
+                continue
+            try:
+                hook(task_object, *args)
+            except Exception as e:
+                # The task has finished already, so a broken hook shouldn't fail it.
+                Console(sys.stderr).warn('{} hook of {} failed: {}'.format(event, task_object.name,
+                                                                           str(e) or e.__class__.__name__))
+
     def _call_cleanup_func(self):
         if self._executing_task:
             self._executing_task.cleanup_function(self._executing_task)
@@ -180,6 +535,59 @@ class TaskManager(object):
     def alias(self, task_object, name):
         task_object.aliases.append(name)
 
+    @_task_manager_method_decorator(with_arguments=True)
+    def depends_on(self, task_object, *tasks):
+        """
+        Tasks to run before this task. They are invoked without any command line argument.
+
+        :type tasks: list[str|Task]
+        """
+        task_object.dependencies.extend(tasks)
+
+    @_task_manager_method_decorator(with_arguments=True)
+    def inputs(self, task_object, *patterns):
+        """
+        Files the task reads. Glob patterns are accepted. (`**` matches directories recursively)
+
+        :type patterns: list[str]
+        """
+        task_object.input_patterns.extend(patterns)
+
+    @_task_manager_method_decorator(with_arguments=True)
+    def outputs(self, task_object, *paths):
+        """
+        Files the task creates.
+
+        :type paths: list[str]
+        """
+        task_object.output_paths.extend(paths)
+
+    @_task_manager_method_decorator(with_arguments=True)
+    def memoize(self, task_object, maxsize=128, ttl=None, persistent=False, directory=None,
+                max_disk_size=64 * 1024 * 1024):
+        """
+        Reuse the return value of the task if it's called with the same arguments again.
+        Use `Task.memo.invalidate(*args, **kwargs)` or `Task.memo.clear()` to forget values.
+
+        :param maxsize: number of values kept in memory. `None` means no limit
+        :param ttl: seconds before a value expires. `None` means never
+        :param persistent: keep values on disk, so they can be used by later runs
+        :param directory: where to keep values on disk. default is under `$TASKR_CACHE_DIR`
+        :param max_disk_size: total bytes of values on disk. least recently used ones are removed
+        """
+        task_object.memo = TaskMemo(task_object, maxsize=maxsize, ttl=ttl, persistent=persistent,
+                                    directory=directory, max_disk_size=max_disk_size)
+
+    @_task_manager_method_decorator(with_arguments=True)
+    def timeout(self, task_object, seconds):
+        """
+        Interrupt the task if it runs longer than `seconds`. Processes it started by `taskr.contrib.system.run` are
+        terminated, its cleanup function is called, and the invocation exits with 124. It overrides `--timeout`.
+
+        :type seconds: float
+        """
+        task_object.timeout = seconds
+
     @_task_manager_method_decorator(with_arguments=True)
     def auto_create_short_arguments(self, task_object, auto_create_short_arguments):
         task_object.auto_create_short_arguments = auto_create_short_arguments
@@ -190,80 +598,127 @@ class TaskManager(object):
 
     # Dispatch ---------------------------------------------------------------------------------------------------------
 
-    def dispatch(self, args=None, keep_running_after_finished=False):
-        # Setup arg-parser
-        task_dict = {task.name: task for task in self.tasks}
-        for task in self.tasks:
-            task.setup_argparser()
+    def dispatch(self, args=None, keep_running_after_finished=False, lazy=None):
+        """
+        :param args: arguments to parse. default is sys.argv[1:]
+        :param keep_running_after_finished: don't exit after the task finished successfully
+        :param lazy: only build the argparser of the selected task. default is `lazy_dispatch` of this manager
+        :type args: list[str]
+        :type keep_running_after_finished: bool
+        :type lazy: bool
+        """
+        self._dispatch(args or sys.argv[1:], keep_running_after_finished, lazy)
+
+    def _dispatch(self, args, keep_running_after_finished=False, lazy=None):
+        """
+        :type args: list[str]
+        :type keep_running_after_finished: bool
+        :type lazy: bool
+        """
+        lazy = self.lazy_dispatch if lazy is None else lazy
+
+        # Split global options from action arguments
+        global_args, args = self._split_global_arguments(args)
+        error_msg = None
+        try:
+            self.global_options = self.global_parser.parse_args(global_args)
+        except ArgumentParserError as e:
+            error_msg = str(e)
+            self.global_options = self.global_parser.parse_args([])
+        else:
+            if self.global_options.serve:
+                self.serve(self.global_options.serve, fork_per_request=self.global_options.fork_per_request,
+                           lazy=lazy)
+                sys.exit(0)
+            elif self.global_options.batch:
+                self._dispatch_batch(self.global_options.batch, args, self.global_options.jobs, lazy)
+            elif self.global_options.matrix or self.global_options.matrix_file:
+                self._dispatch_matrix(args, lazy)
+            elif self.global_options.shard:
+                error_msg = '--shard only works with --batch, --matrix or --matrix-file'
 
         # Setup action name if manager has main task
-        args = args or sys.argv[1:]
         if len(args) == 0 and self.main_task:
             args = [self.main_task.name]
+        elif self.main_task and not global_args and args[0].startswith('-') and args[0] not in ('-h', '--help'):
+            # Options of the main task, which the top-level parser would take if they're named like global options
+            args = [self.main_task.name] + args
+
+        # Setup arg-parser
+        self._load_selected_task(args)
+        task_dict = {task.name: task for task in self.tasks}
+        # Only the selected task is set up in lazy mode, so its argparser isn't needed if it's parsed without one.
+        fast_namespace = self._parse_fast(args) if lazy and not error_msg else None
+        if fast_namespace is None:
+            self._setup_argparsers(self._tasks_to_setup(args) if lazy and not error_msg else self.tasks)
+        if self.metadata_cache:
+            self.metadata_cache.save()
+
         # Parse argument
-        error_msg = None
-        try:
-            args = self.parser.parse_args(args)
+        if fast_namespace is not None:
+            args = fast_namespace
+        elif error_msg:
             final_parser = self.parser
-        except ArgumentParserError as e:
-            error_msg = str(e)
-            if len(args) > 0 and args[0] in task_dict:
-                final_parser = task_dict[args[0]].parser
-                args = argparse.Namespace()
-            elif self.main_task:
-                # Append main task if necessary
-                if len(args) == 0 or args[0] != self.main_task.name:
-                    args = [self.main_task.name] + args
-                # Check for main task
-                try:
-                    args = self.parser.parse_args(args)
-                except ArgumentParserError as e:
-                    error_msg = str(e)
-                    args = argparse.Namespace()
-                finally:
-                    final_parser = self.main_task.parser
-            else:
+            args = argparse.Namespace()
+        else:
+            try:
+                args = self.parser.parse_args(args)
                 final_parser = self.parser
-                args = argparse.Namespace()
+            except ArgumentParserError as e:
+                error_msg = str(e)
+                if len(args) > 0 and args[0] in task_dict:
+                    final_parser = task_dict[args[0]].parser
+                    args = argparse.Namespace()
+                elif self.main_task:
+                    # Append main task if necessary
+                    if len(args) == 0 or args[0] != self.main_task.name:
+                        args = [self.main_task.name] + args
+                    # Check for main task
+                    try:
+                        args = self.parser.parse_args(args)
+                    except ArgumentParserError as e:
+                        error_msg = str(e)
+                        args = argparse.Namespace()
+                    finally:
+                        final_parser = self.main_task.parser
+                else:
+                    final_parser = self.parser
+                    args = argparse.Namespace()
         # dispatch or print help
         if hasattr(args, '__instance__'):
             # Call task object
             task_object = args.__instance__
             """:type: Task"""
             self._executing_task = task_object
+            self.run_id = uuid.uuid4().hex
+            call_args, call_kwargs = task_object.call_arguments(args)
 
-            if task_object.pass_argparse_namespace:
-                task_object.arguments = args
-                call_args = (args,)
-                call_kwargs = {}
-            else:
-                # noinspection PyTypeChecker
-                kwargs = dict(vars(args))
-                kwargs.pop('__instance__')
-                task_object.arguments = deepcopy(kwargs)  # copy it
-                if task_object.varargs in kwargs:
-                    _varargs = kwargs.pop(task_object.varargs)
-                    if not isinstance(_varargs, (list, tuple)):
-                        _varargs = [_varargs]
-                    call_args = _varargs
-                else:
-                    call_args = ()
-                call_kwargs = kwargs
-
+            # Dependencies are cleaned up after the selected task, which may use what they set up.
+            dependency_tasks = []
             try:
-                task_object(*call_args, **call_kwargs)
-            except BaseException as e:
-                self._call_cleanup_func()
-                if self.should_raise_exceptions:
-                    raise
-                elif not isinstance(e, SystemExit):
-                    self.exit(status=1, message='Error: {}\n'.format(str(e) or e.__class__.__name__))
-                else:
-                    exit(getattr(e, 'code', -1))
-            else:
-                if not keep_running_after_finished:
+                try:
+                    if task_object.dependencies:
+                        GraphExecutor(self, jobs=self.global_options.jobs, use_process_pool=self._use_process_pool,
+                                      output=self._output_multiplexer()).run(task_object.dependencies,
+                                                                             deferred_cleanups=dependency_tasks)
+                    self._execute_selected_task(task_object, call_args, call_kwargs)
+                except BaseException as e:
                     self._call_cleanup_func()
-                    sys.exit(self.exit_code)
+                    if self.should_raise_exceptions:
+                        raise
+                    elif isinstance(e, watchdog.TaskTimeout):
+                        self.exit(status=watchdog.TIMEOUT_EXIT_CODE, message='Error: {}\n'.format(e))
+                    elif not isinstance(e, SystemExit):
+                        self.exit(status=1, message='Error: {}\n'.format(str(e) or e.__class__.__name__))
+                    else:
+                        exit(getattr(e, 'code', -1))
+                else:
+                    if not keep_running_after_finished:
+                        self._call_cleanup_func()
+                        sys.exit(self.exit_code)
+            finally:
+                for dependency_task in reversed(dependency_tasks):
+                    dependency_task.cleanup_function(dependency_task)
         else:
             # Leave
             if error_msg:
@@ -271,6 +726,346 @@ class TaskManager(object):
             final_parser.print_help()
             self.exit(status=1)
 
+    def _dispatch_batch(self, batch_path, args_prefix, jobs, lazy):
+        """
+        :type batch_path: str
+        :type args_prefix: list[str]
+        :type jobs: int
+        :type lazy: bool
+        """
+        if batch_path == '-':
+            lines = sys.stdin.readlines()
+        else:
+            with open(batch_path, 'r') as f:
+                lines = f.readlines()
+        args_list = [args_prefix + shlex.split(line) for line in lines if line.strip() and
+                     not line.lstrip().startswith('#')]
+        try:
+            exit_codes = self.dispatch_many(args_list, jobs=jobs, lazy=lazy, use_process_pool=self._use_process_pool,
+                                            output=self._output_multiplexer(), **self._sharding_options())
+        except ValueError as e:
+            self.exit(status=1, message='Error: {}\n'.format(e))
+        else:
+            sys.exit(0 if not any(exit_codes) else 1)
+
+    def _dispatch_matrix(self, args, lazy):
+        """
+        :type args: list[str]
+        :type lazy: bool
+        """
+        matrices = []
+        try:
+            if self.global_options.matrix_file:
+                matrices.append(load_matrix_file(self.global_options.matrix_file))
+            if self.global_options.matrix:
+                matrices.append(parse_matrix_options(self.global_options.matrix))
+            results = self.dispatch_matrix(args, *matrices, jobs=self.global_options.jobs, lazy=lazy,
+                                           use_process_pool=self._use_process_pool, output=self._output_multiplexer(),
+                                           **self._sharding_options())
+        except (IOError, OSError, ValueError) as e:
+            self.exit(status=1, message='Error: {}\n'.format(e))
+        else:
+            sys.exit(0 if not any(exit_code for _, exit_code in results) else 1)
+
+    def _sharding_options(self):
+        """
+        Keyword arguments of `dispatch_many` from global options.
+
+        :rtype: dict
+        """
+        options = self.global_options
+        durations = DurationStore(options.durations_file) if options.shard or options.store_durations else None
+        return {
+            'shard': parse_shard(options.shard) if options.shard else None,
+            'durations': durations,
+            'store_durations': options.store_durations,
+        }
+
+    def _output_multiplexer(self):
+        """
+        :return: the multiplexer of `--output-mode`, or `None` if it's not set
+        :rtype: OutputMultiplexer
+        """
+        if not self.global_options.output_mode:
+            return None
+        return OutputMultiplexer(self.global_options.output_mode, log_dir=self.global_options.output_dir)
+
+    @property
+    def _use_process_pool(self):
+        """
+        :rtype: bool
+        """
+        return self.global_options.process_pool or self.use_process_pool
+
+    def _timed_dispatch(self, args, lazy, output=None):
+        """
+        :type args: list[str]
+        :type lazy: bool
+        :param output: write output of the invocation to its own stream of this multiplexer
+        :type output: OutputMultiplexer
+        :return: exit code and seconds
+        :rtype: (int, float)
+        """
+        start = default_timer()
+        if output is None:
+            exit_code = self._dispatch_for_exit_code(args, lazy)
+        else:
+            with output.task_output(invocation_key(args)) as stream:
+                exit_code = self._dispatch_for_exit_code(args, lazy)
+                stream.failed = exit_code != 0
+        return exit_code, default_timer() - start
+
+    def _dispatch_for_exit_code(self, args, lazy):
+        """
+        :type args: list[str]
+        :type lazy: bool
+        :rtype: int
+        """
+        self.reset_invocation_state()
+        try:
+            self._dispatch(args, lazy=lazy)
+        except SystemExit as e:
+            if e.code is None:
+                return 0
+            elif isinstance(e.code, int):
+                return e.code
+            print(e.code, file=sys.stderr)
+            return 1
+        finally:
+            self.reset_invocation_state()
+        return 0
+
+    def dispatch_many(self, args_list, jobs=1, lazy=None, show_summary=True, show_status=False,
+                      use_process_pool=False, shard=None, durations=None, store_durations=False, output=None):
+        """
+        Dispatch many invocations in this process. Argparsers are built once for all invocations.
+        With `shard`, only invocations of that shard are run. (See `taskr.sharding`)
+
+        :param args_list: arguments of each invocation
+        :param jobs: number of invocations to run concurrently
+        :param lazy: only build argparsers of the selected tasks. default is `lazy_dispatch` of this manager
+        :param show_summary: print exit codes of failed invocations and the number of succeeded ones
+        :param show_status: print the exit code and time of each invocation when it finished
+        :param use_process_pool: run invocations on forked processes instead of threads
+        :param shard: (I, N) to run the I-th of N shards. I starts from 1
+        :param durations: recorded durations to balance shards
+        :param store_durations: record durations of invocations to `durations`
+        :param output: give each invocation its own output stream. (See `taskr.multiplex`)
+        :type args_list: list[list[str]]
+        :type jobs: int
+        :type lazy: bool
+        :type show_summary: bool
+        :type show_status: bool
+        :type use_process_pool: bool
+        :type shard: (int, int)
+        :type durations: taskr.sharding.DurationStore
+        :type store_durations: bool
+        :type output: taskr.multiplex.OutputMultiplexer
+        :return: exit code of each invocation. It's `None` for invocations of other shards
+        :rtype: list[int]
+        """
+        args_list = [list(args) for args in args_list]
+        lazy = self.lazy_dispatch if lazy is None else lazy
+        keys = [invocation_key(args) for args in args_list]
+        selected_indices = list(range(len(args_list)))
+        if shard:
+            shard_index, shard_count = shard
+            if not 1 <= shard_index <= shard_count:
+                raise ValueError('Shard should be 1 <= I <= N: {}/{}'.format(shard_index, shard_count))
+            shards = assign_shards(keys, shard_count, durations.load() if durations else None)
+            selected_indices = [idx for idx in selected_indices if shards[idx] == shard_index - 1]
+
+        # Import lazy tasks and build parsers before running, so concurrent invocations won't do it.
+        for args in (args_list[idx] for idx in selected_indices):
+            action_args = self._split_global_arguments(args)[1]
+            if len(action_args) == 0 and self.main_task:
+                action_args = [self.main_task.name]
+            self._load_selected_task(action_args)
+            if lazy:
+                self._setup_argparsers(self._tasks_to_setup(action_args))
+        if not lazy:
+            self._setup_argparsers(self.tasks)
+        if self.metadata_cache:
+            self.metadata_cache.save()
+
+        console = Console(sys.stdout)
+        exit_codes = [None] * len(args_list)
+        seconds_list = [None] * len(args_list)
+        if shard and show_summary:
+            console.info('Shard {}/{}: {} of {} invocations'.format(shard_index, shard_count, len(selected_indices),
+                                                                     len(args_list)))
+
+        def finished(idx, result):
+            exit_codes[idx], seconds_list[idx] = result
+            if show_status:
+                finished_count = len([exit_code for exit_code in exit_codes if exit_code is not None])
+                message = '[{}/{}] {} ({:.2f} s)'.format(finished_count, len(selected_indices),
+                                                       keys[idx], seconds_list[idx])
+                if exit_codes[idx] == 0:
+                    console.success(message)
+                else:
+                    console.error('{}: exit code {}'.format(message, exit_codes[idx]))
+
+        if jobs > 1:
+            with create_pool(self, jobs, use_process_pool) as pool:
+                pending = {submit_dispatch(pool, self, args_list[idx], lazy, use_process_pool, output): idx
+                           for idx in selected_indices}
+                for future in futures.as_completed(pending):
+                    finished(pending[future], future.result())
+        else:
+            for idx in selected_indices:
+                finished(idx, self._timed_dispatch(args_list[idx], lazy, output))
+
+        if store_durations and durations:
+            durations.record({keys[idx]: seconds_list[idx] for idx in selected_indices})
+        if show_summary:
+            for idx in selected_indices:
+                if exit_codes[idx] != 0:
+                    console.error('Exit code {}: {}'.format(exit_codes[idx], keys[idx]))
+            failed_count = len([idx for idx in selected_indices if exit_codes[idx] != 0])
+            (console.error if failed_count else console.success)('{} invocations: {} succeeded, {} failed'.format(
+                len(selected_indices), len(selected_indices) - failed_count, failed_count))
+        return exit_codes
+
+    def dispatch_matrix(self, args, *matrices, **kwargs):
+        """
+        Dispatch an invocation for each set of values. `{key}` in arguments is replaced by the value of `key`.
+        e.g. `task.dispatch_matrix(['deploy', '{host}'], {'host': ['web-1', 'web-2']}, jobs=2)`
+
+        :param args: arguments with `{key}` templates
+        :param matrices: objects of value lists (their product is used) or iterables of value sets (e.g. generators).
+                         The product of all matrices is used
+        :param jobs: number of invocations to run concurrently. default is 1
+        :param lazy: only build argparsers of the selected tasks. default is `lazy_dispatch` of this manager
+        :param use_process_pool: run invocations on forked processes instead of threads. default is False
+        :param show_summary: print each invocation when it finished and a summary. default is True
+        :param shard: `shard`, `durations`, `store_durations` and `output` are the same as `dispatch_many`
+        :type args: list[str]
+        :type matrices: list[dict[str, list]|collections.Iterable[dict]]
+        :return: the value set and exit code of each invocation. The exit code is `None` for other shards
+        :rtype: list[(OrderedDict, int)]
+        :raise ValueError: if a key is not used by arguments, or arguments use a key which is not in a value set
+        """
+        rows = expand_matrix(*matrices)
+        used_keys = template_keys(args)
+        unused_keys = [key for key in rows[0] if key not in used_keys] if rows else []
+        if unused_keys:
+            raise ValueError('Matrix keys are not used by arguments: {}'.format(', '.join(unused_keys)))
+        missing_keys = sorted({key for row in rows for key in used_keys if key not in row})
+        if missing_keys:
+            raise ValueError('Arguments use keys which are not in the matrix: {}'.format(', '.join(missing_keys)))
+
+        show_summary = kwargs.get('show_summary', True)
+        exit_codes = self.dispatch_many([render_arguments(args, row) for row in rows],
+                                        jobs=kwargs.get('jobs', 1), lazy=kwargs.get('lazy', None),
+                                        show_summary=show_summary, show_status=show_summary,
+                                        use_process_pool=kwargs.get('use_process_pool', False),
+                                        shard=kwargs.get('shard', None), durations=kwargs.get('durations', None),
+                                        store_durations=kwargs.get('store_durations', False),
+                                        output=kwargs.get('output', None))
+        return list(zip(rows, exit_codes))
+
+    def serve(self, socket_path, fork_per_request=False, lazy=None):
+        """
+        Keep this manager resident and serve invocations from `python -m taskr.daemon SOCKET ...` until interrupted.
+        See `taskr.daemon` for details.
+
+        :type socket_path: str
+        :type fork_per_request: bool
+        :type lazy: bool
+        """
+        from .daemon import serve
+        serve(self, socket_path, fork_per_request=fork_per_request, lazy=lazy)
+
+    def _execute_selected_task(self, task_object, call_args, call_kwargs):
+        """
+        :type task_object: Task
+        :type call_args: tuple
+        :type call_kwargs: dict
+        """
+        profiler = self.global_options.profile
+        if not profiler:
+            return self.execute_task(task_object, call_args, call_kwargs)
+
+        output_path = self.global_options.profile_output or profiling.default_output_path(profiler, task_object.name)
+        try:
+            with profiling.profile(profiler, output_path, name=task_object.name, top=self.profile_top):
+                return self.execute_task(task_object, call_args, call_kwargs)
+        finally:
+            Console(sys.stderr).info('Profile of {} is written to {}'.format(task_object.name, output_path))
+
+    def execute_task(self, task_object, call_args, call_kwargs):
+        """
+        Invoke the task. A task with inputs or outputs is skipped if it's up to date, unless `--force` is set.
+
+        :type task_object: Task
+        :type call_args: tuple
+        :type call_kwargs: dict
+        """
+        fingerprint = None
+        if task_object.input_patterns or task_object.output_paths:
+            fingerprint = self.fingerprints.fingerprint(task_object)
+            if not self.global_options.force and self.fingerprints.is_up_to_date(task_object, fingerprint):
+                Console(sys.stdout).info('{}: up to date'.format(task_object.name))
+                return None
+
+        self._run_hooks('pre', task_object, call_args, call_kwargs)
+        start = default_timer()
+        seconds = task_object.timeout or self.global_options.timeout
+        try:
+            if seconds:
+                with watchdog.timeout(task_object.name, seconds):
+                    result = task_object(*call_args, **call_kwargs)
+            else:
+                result = task_object(*call_args, **call_kwargs)
+        except SystemExit as e:
+            if e.code in (None, 0):
+                self._run_hooks('post', task_object, None, default_timer() - start)
+            else:
+                self._run_hooks('error', task_object, e, default_timer() - start)
+            raise
+        except BaseException as e:
+            self._run_hooks('error', task_object, e, default_timer() - start)
+            raise
+        self._run_hooks('post', task_object, result, default_timer() - start)
+
+        if fingerprint:
+            self.fingerprints.record(task_object, fingerprint)
+            Console(sys.stdout).success('{}: rebuilt'.format(task_object.name))
+        return result
+
+    def run_concurrently(self, *invocations):
+        """
+        Run tasks concurrently on one event loop. Coroutine functions run on the loop and regular tasks run on its
+        default executor. If one of them failed or the run is interrupted by Ctrl-C, the others are cancelled and
+        `cleanup_function` of each failed or cancelled task is called. (Python 3 only)
+
+        :param invocations: task objects, or (task object, args, kwargs) tuples
+        :type invocations: list[Task|(Task, tuple, dict)]
+        :return: results of tasks
+        :rtype: list
+        """
+        from . import aio
+        return aio.run(aio.gather(invocations))
+
+    def run_tasks(self, *tasks, **kwargs):
+        """
+        Run tasks and their dependencies without command line arguments. Independent tasks run concurrently.
+
+        :param tasks: names or objects of tasks
+        :param jobs: number of tasks to run concurrently. default is 1
+        :param use_process_pool: run tasks on processes instead of threads. default is `use_process_pool`
+        :param output: give each task its own output stream. (See `taskr.multiplex`)
+        :type tasks: list[str|Task]
+        :type jobs: int
+        :type use_process_pool: bool
+        :type output: taskr.multiplex.OutputMultiplexer
+        """
+        GraphExecutor(self,
+                      jobs=kwargs.get('jobs', 1),
+                      use_process_pool=kwargs.get('use_process_pool', self.use_process_pool),
+                      output=kwargs.get('output', None)).run(tasks)
+
     # Error ------------------------------------------------------------------------------------------------------------
 
     def exit(self, status=0, message=None, no_color=False):
@@ -290,45 +1085,216 @@ class TaskManager(object):
         self.parser.error(message)
 
 
+def _no_cleanup(task_object):
+    pass
+
+
+def _is_coroutine_function(callable_obj):
+    """
+    Checked by `inspect`, so asyncio isn't imported until a coroutine task is called.
+
+    :type callable_obj: callable
+    :rtype: bool
+    """
+    iscoroutinefunction = getattr(inspect, 'iscoroutinefunction', None)
+    if iscoroutinefunction is None:  # Python 2
+        return False
+    if inspect.isfunction(callable_obj) or inspect.ismethod(callable_obj):
+        return iscoroutinefunction(callable_obj)
+    return iscoroutinefunction(getattr(callable_obj, '__call__', None))
+
+
 class Task(object):
 
+    # Tasks could be thousands and live as long as the process, so they are slotted. Attributes which are rarely set
+    # and not mutated share empty defaults, and parsers are created when they are needed.
+    # (See `TaskManager.release_parsers`)
+    __slots__ = (
+        'callable', 'callable_is_object', 'is_coroutine', 'name', '_arguments', 'manual_arguments',
+        'auto_create_short_arguments', 'pass_argparse_namespace', 'cleanup_function', 'manager', 'parser',
+        'argument_groups', 'aliases', 'dependencies', 'input_patterns', 'output_paths', 'memo', 'help_text',
+        'strip_arguments_in_docstring', 'args', 'kwargs', 'varargs', '_metadata', 'metadata_from_cache', 'timeout',
+        '_fast_parser', '__weakref__',
+    )
+    _no_manual_arguments = OrderedDict()
+
     def __init__(self, callable_obj, manager):
         """
         :type callable_obj: callable
         :type manager: TaskManager
         """
         self.callable = callable_obj
-        functools.update_wrapper(self, self.callable)
         self.callable_is_object = not isinstance(self.callable, types.FunctionType)
+        self.is_coroutine = _is_coroutine_function(self.callable)
         self.name = self.callable.__name__.replace('_', '-').lower()
-        self.arguments = {}
+        self._arguments = None
 
-        self.manual_arguments = OrderedDict()
+        self.manual_arguments = self._no_manual_arguments
+        """:type: OrderedDict[str, (str|(str, str), tuple, dict)]"""
         self.auto_create_short_arguments = True
         self.pass_argparse_namespace = False
-        self.cleanup_function = lambda x: None
+        self.cleanup_function = _no_cleanup
 
         self.manager = manager
         self.parser = None
         """:type: argparse.ArgumentParser"""
         self.argument_groups = None
+        # Lists, since taskfiles may append to them
         self.aliases = []
+        self.dependencies = []
+        self.input_patterns = []
+        self.output_paths = []
+        self.memo = None
+        """:type: taskr.memo.TaskMemo"""
+        self.timeout = None
+        """:type: float"""
         self.help_text = None
         self.strip_arguments_in_docstring = True
 
         self.args = ()
-        self.kwargs = {}
+        self.kwargs = None
+        """:type: dict"""
         self.varargs = None
         """:type: str"""
 
+        self._metadata = None
+        """:type: dict"""
+        self.metadata_from_cache = False
+        # `False` if arguments of the task cannot be parsed without argparse
+        self._fast_parser = None
+        """:type: taskr.fastparse.FastParser|bool"""
+
+    def __getattr__(self, name):
+        # Attributes of the callable, like what `functools.update_wrapper` copies to a wrapper
+        if name.startswith('__') and name not in ('__name__', '__qualname__'):
+            raise AttributeError("'{}' object has no attribute '{}'".format(self.__class__.__name__, name))
+        try:
+            callable_obj = object.__getattribute__(self, 'callable')
+        except AttributeError:
+            raise AttributeError("'{}' object has no attribute '{}'".format(self.__class__.__name__, name))
+        return getattr(callable_obj, name)
+
+    @property
+    def __doc__(self):
+        return self.callable.__doc__
+
+    @property
+    def __wrapped__(self):
+        return self.callable
+
     def __repr__(self):
         return '<Task: {}>'.format(self.name)
 
+    @property
+    def arguments(self):
+        """
+        Arguments of the invocation on current thread, or the last invocation if current thread has none.
+
+        :rtype: dict|argparse.Namespace
+        """
+        # noinspection PyProtectedMember
+        arguments = self.manager._state.arguments.get(self, self._arguments)
+        return {} if arguments is None else arguments
+
+    @arguments.setter
+    def arguments(self, arguments):
+        self._arguments = arguments
+        # noinspection PyProtectedMember
+        self.manager._state.arguments[self] = arguments
+
     def __str__(self):
         return repr(self)
 
     def __call__(self, *args, **kwargs):
-        self.callable(*args, **kwargs)
+        if self.is_coroutine:
+            from . import aio
+            if aio.running_loop():
+                # Let the caller await it
+                return self.callable(*args, **kwargs)
+        if self.memo:
+            return self.memo.call(args, kwargs)
+        return self.invoke_callable(args, kwargs)
+
+    def load(self):
+        """
+        The task to invoke. It's this task itself, unless this is a placeholder of a lazy task.
+
+        :rtype: Task
+        """
+        return self
+
+    def invoke_callable(self, args, kwargs):
+        """
+        Call the callable. A coroutine function is run on a new event loop.
+
+        :type args: tuple
+        :type kwargs: dict
+        """
+        result = self.callable(*args, **kwargs)
+        if self.is_coroutine:
+            from . import aio
+            result = aio.run(result)
+        return result
+
+    def call_arguments(self, namespace):
+        """
+        Convert the argparse namespace into arguments of the callable. `arguments` of this task is updated too.
+
+        :type namespace: argparse.Namespace
+        :rtype: (tuple, dict)
+        """
+        if self.pass_argparse_namespace:
+            self.arguments = namespace
+            return (namespace,), {}
+
+        # noinspection PyTypeChecker
+        kwargs = dict(vars(namespace))
+        kwargs.pop('__instance__', None)
+        self.arguments = deepcopy(kwargs)  # copy it
+        if self.varargs in kwargs:
+            _varargs = kwargs.pop(self.varargs)
+            if not isinstance(_varargs, (list, tuple)):
+                _varargs = [_varargs]
+            call_args = _varargs
+        else:
+            call_args = ()
+        return call_args, kwargs
+
+    def parse_fast(self, args):
+        """
+        Parse arguments without building the argparser if the signature of the task is simple enough.
+        (See `taskr.fastparse`)
+
+        :type args: list[str]
+        :return: the namespace which argparse would return, or `None` if argparse is needed
+        :rtype: argparse.Namespace
+        """
+        if self._fast_parser is None:
+            self._fast_parser = (not self.pass_argparse_namespace and compile_parser(self.metadata)) or False
+        values = self._fast_parser.parse_args(args) if self._fast_parser else None
+        if values is None:
+            return None
+
+        metadata = self.metadata
+        self.args = metadata['args']
+        self.kwargs = metadata['kwargs']
+        self.varargs = metadata['varargs']
+        namespace = argparse.Namespace(**values)
+        namespace.__instance__ = self
+        return namespace
+
+    def default_namespace(self):
+        """
+        Argparse namespace when the task is invoked without any command line argument.
+
+        :rtype: argparse.Namespace
+        """
+        # noinspection PyProtectedMember
+        self.manager._setup_argparsers([self])
+        try:
+            return self.parser.parse_args([])
+        except ArgumentParserError as e:
+            raise ValueError('{} cannot run without arguments: {}'.format(self, e))
 
     def parse_doc_str(self):
         if self.callable.__doc__ is None:
@@ -358,25 +1324,34 @@ class Task(object):
         final_docs = '\n'.join(final_docs).strip()
         return final_docs, arguments
 
-    def setup_argparser(self):
-        task_description, task_args_description = self.parse_doc_str()
+    @property
+    def metadata(self):
+        """
+        Parsed docstring and argument spec of the callable. It comes from the metadata cache of the manager if the
+        manager has one.
 
-        add_parser_kwargs = {}
-        if six.PY3:
-            add_parser_kwargs['aliases'] = self.aliases
-        if self.help_text:
-            add_parser_kwargs['help'] = self.help_text
-        add_parser_kwargs['formatter_class'] = TaskrHelpFormatter
-        add_parser_kwargs['description'] = task_description
-        self.parser = self.manager.action_subparser.add_parser(self.name, **add_parser_kwargs)
-        self.parser.set_defaults(__instance__=self)
-        self.argument_groups = {'*': self.parser}
+        :rtype: dict
+        """
+        if self._metadata is None:
+            metadata_cache = self.manager.metadata_cache
+            self._metadata = metadata_cache.metadata(self) if metadata_cache else self.build_metadata()
+        return self._metadata
+
+    def build_metadata(self):
+        """
+        :rtype: dict
+        """
+        task_description, task_args_description = self.parse_doc_str()
+        arguments = []
+        args = ()
+        kwargs = {}
+        varargs = None
 
         if self.pass_argparse_namespace:
             # Register arguments by decorator declaration
             for _ in reversed(self.manual_arguments):
                 group, arg_args, arg_kwargs = self.manual_arguments[_]
-                self._get_argument_group(group).add_argument(*arg_args, **arg_kwargs)
+                arguments.append((group, arg_args, dict(arg_kwargs)))
         else:
             # Register arguments by function spec
             # Get argument spec of function
@@ -399,9 +1374,10 @@ class Task(object):
             # Register
             for arg_name in args:
                 group, arg_args, arg_kwargs = self.manual_arguments.get(arg_name, ('*', (arg_name,), {}))
+                arg_kwargs = dict(arg_kwargs)
                 if 'help' not in arg_kwargs and arg_name in task_args_description:
                     arg_kwargs['help'] = task_args_description[arg_name]
-                self._get_argument_group(group).add_argument(*arg_args, **arg_kwargs)
+                arguments.append((group, arg_args, arg_kwargs))
 
             for kwarg_name, default_value in kwargs.items():
                 group, arg_args, arg_kwargs = self.manual_arguments.get(
@@ -416,6 +1392,7 @@ class Task(object):
                         {},
                     )
                 )
+                arg_kwargs = dict(arg_kwargs)
 
                 if 'help' not in arg_kwargs and kwarg_name in task_args_description:
                     arg_kwargs['help'] = task_args_description[kwarg_name]
@@ -426,18 +1403,46 @@ class Task(object):
                 if 'type' not in arg_kwargs and 'action' not in arg_kwargs and default_value is not None:
                     arg_kwargs['type'] = default_value.__class__
 
-                self._get_argument_group(group).add_argument(*arg_args, **arg_kwargs)
+                arguments.append((group, arg_args, arg_kwargs))
             if varargs:
                 group, arg_args, arg_kwargs = self.manual_arguments.get(varargs, ('*', (varargs,), {'nargs': '*'}))
+                arg_kwargs = dict(arg_kwargs)
                 if 'nargs' not in arg_kwargs:
                     arg_kwargs['nargs'] = '*'
                 if 'help' not in arg_kwargs and varargs in task_args_description:
                     arg_kwargs['help'] = task_args_description[varargs]
-                self._get_argument_group(group).add_argument(*arg_args, **arg_kwargs)
+                arguments.append((group, arg_args, arg_kwargs))
+
+        return {
+            'description': task_description,
+            'arguments_description': task_args_description,
+            'args': args,
+            'kwargs': kwargs,
+            'varargs': varargs,
+            'arguments': arguments,
+        }
 
-            self.args = args
-            self.kwargs = kwargs
-            self.varargs = varargs
+    def setup_argparser(self):
+        metadata = self.metadata
+
+        add_parser_kwargs = {}
+        if six.PY3:
+            add_parser_kwargs['aliases'] = self.aliases
+        if self.help_text:
+            add_parser_kwargs['help'] = self.help_text
+        add_parser_kwargs['formatter_class'] = TaskrHelpFormatter
+        add_parser_kwargs['description'] = metadata['description']
+        self.parser = self.manager.action_subparser.add_parser(self.name, **add_parser_kwargs)
+        self.parser.set_defaults(__instance__=self)
+        self.argument_groups = {'*': self.parser}
+
+        for group, arg_args, arg_kwargs in metadata['arguments']:
+            self._get_argument_group(group).add_argument(*arg_args, **arg_kwargs)
+
+        if not self.pass_argparse_namespace:
+            self.args = metadata['args']
+            self.kwargs = metadata['kwargs']
+            self.varargs = metadata['varargs']
 
     def _get_argument_group(self, group):
         """
@@ -456,6 +1461,8 @@ class Task(object):
         return self.argument_groups[group_title]
 
     def set_group_argument(self, group, *args, **kwargs):
+        if self.manual_arguments is self._no_manual_arguments:
+            self.manual_arguments = OrderedDict()
         if args[0].startswith('-'):
             # Optional
             dest = kwargs.get('dest', None)
@@ -477,3 +1484,82 @@ class Task(object):
 
     def set_argument(self, *args, **kwargs):
         self.set_group_argument('*', *args, **kwargs)
+
+
+class LazyTask(Task):
+    """
+    Placeholder of a task registered by `TaskManager.register_lazy`. The callable is imported when the task is loaded,
+    and then the placeholder is replaced by the real task.
+    """
+
+    __slots__ = ('import_path', 'loaded_task')
+    _load_lock = threading.Lock()
+
+    def __init__(self, name, import_path, manager, help_text=None):
+        """
+        :type name: str
+        :type import_path: str
+        :type manager: TaskManager
+        :type help_text: str
+        """
+        super(LazyTask, self).__init__(self._call_loaded_task, manager)
+        self.name = name
+        self.help_text = help_text
+        self.import_path = import_path
+        self.loaded_task = None
+        """:type: Task"""
+
+    def __repr__(self):
+        return '<LazyTask: {} ({})>'.format(self.name, self.import_path)
+
+    def _call_loaded_task(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    @property
+    def metadata(self):
+        """
+        :rtype: dict
+        """
+        # It's not worth caching and it must not import the callable.
+        if self._metadata is None:
+            self._metadata = self.build_metadata()
+        return self._metadata
+
+    def build_metadata(self):
+        """
+        :rtype: dict
+        """
+        return {
+            'description': self.help_text or '',
+            'arguments_description': {},
+            'args': (),
+            'kwargs': {},
+            'varargs': None,
+            'arguments': [],
+        }
+
+    def load(self):
+        """
+        Import the callable and register it to the manager in place of this placeholder.
+
+        :rtype: Task
+        """
+        with self._load_lock:
+            if self.loaded_task is None:
+                imported_obj = import_string(self.import_path)
+                if isinstance(imported_obj, Task) and imported_obj.manager is not self.manager:
+                    raise ValueError('{} is a task of another manager'.format(self.import_path))
+                # noinspection PyProtectedMember
+                task_obj = self.manager._get_or_create_task_object(imported_obj)
+                task_obj.name = self.name
+                task_obj.aliases.extend(self.aliases)
+                task_obj.help_text = task_obj.help_text or self.help_text
+                # noinspection PyProtectedMember
+                self.manager._tasks.discard(self)
+                if self.manager.main_task is self:
+                    self.manager.main_task = task_obj
+                if self.parser is not None:
+                    # The argparser of this placeholder cannot be replaced in place.
+                    self.manager.release_parsers()
+                self.loaded_task = task_obj
+        return self.loaded_task
@@ -14,24 +14,127 @@
 # limitations under the License.
 #
 from __future__ import unicode_literals, division, absolute_import, print_function
-import glob
+import atexit
+import bisect
+import json
 import os
-import readline
+import sys
+import threading
+import time
+import warnings
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from timeit import default_timer
 
 import six
 
 
-# Setup readline for path auto-complete
-def path_complete(text, state):
-    if '~' in text:
-        if text == '~':
-            text += '/'
-        text = os.path.expanduser(text)
-    return (glob.glob(text+'*')+[None])[state]
+class PathCompleter(object):
+    """
+    Readline completer of paths. Readline calls it with `state` 0, 1, 2, ... until it returns `None`, so matches are
+    computed once for each text. Sorted listings of directories are cached until their mtime changes, and matches of a
+    longer text in the same directory are narrowed from the last matches.
+    """
 
-readline.set_completer_delims(' \t\n;')
-readline.parse_and_bind("tab: complete")
-readline.set_completer(path_complete)
+    def __init__(self, max_directories=32):
+        """
+        :param max_directories: number of cached listings
+        :type max_directories: int
+        """
+        self.max_directories = max_directories
+        self._listings = OrderedDict()
+        """:type: OrderedDict[str, (float, list[str])]"""
+        self._completing = None
+        self._text = None
+        self._head = None
+        self._names = None
+        self._matches = []
+        """:type: list[str]"""
+
+    def __call__(self, text, state):
+        """
+        :type text: str
+        :type state: int
+        :rtype: str
+        """
+        if state == 0 or text != self._completing:
+            self._completing = text
+            self._matches = self.matches(text)
+        return self._matches[state] if state < len(self._matches) else None
+
+    def listing(self, directory):
+        """
+        :return: sorted names in the directory. It's empty if the directory cannot be read
+        :rtype: list[str]
+        """
+        try:
+            st = os.stat(directory)
+        except OSError:
+            return []
+        mtime = getattr(st, 'st_mtime_ns', st.st_mtime)
+        cached = self._listings.pop(directory, None)
+        if cached is None or cached[0] != mtime:
+            try:
+                cached = (mtime, sorted(os.listdir(directory)))
+            except OSError:
+                return []
+        self._listings[directory] = cached
+        while len(self._listings) > self.max_directories:
+            self._listings.popitem(last=False)
+        return cached[1]
+
+    def matches(self, text):
+        """
+        Paths starting with the text, like `glob.glob(text + '*')` but sorted. Hidden files only match if the name
+        starts with '.'.
+
+        :type text: str
+        :rtype: list[str]
+        """
+        if text.startswith('~'):
+            text = os.path.expanduser(text + '/' if text == '~' else text)
+        head, prefix = os.path.split(text)
+        names = self.listing(head or os.curdir)
+
+        if (names is self._names and head == self._head and text.startswith(self._text) and
+                prefix.startswith('.') == os.path.basename(self._text).startswith('.')):
+            # Typed more in the same directory, which is not changed
+            start = len(os.path.join(head, ''))
+            matches = [match for match in self._matches if match.startswith(prefix, start)]
+        else:
+            idx = bisect.bisect_left(names, prefix)
+            end = len(names)
+            if prefix:
+                # Names starting with the prefix are less than the prefix with its last character incremented.
+                end = bisect.bisect_left(names, prefix[:-1] + six.unichr(ord(prefix[-1]) + 1), idx)
+            start = os.path.join(head, '')
+            matches = [start + name for name in names[idx:end] if prefix.startswith('.') or not name.startswith('.')]
+        self._text, self._head, self._names = text, head, names
+        return matches
+
+
+path_complete = PathCompleter()
+_path_completer_installed = False
+
+
+def install_path_completer():
+    """
+    Complete paths by tab when reading input. It's installed when `Console.input` is called first.
+
+    :return: the readline module, or `None` if it's not available
+    """
+    global _path_completer_installed
+    try:
+        import readline
+    except ImportError:
+        return None
+    if not _path_completer_installed:
+        readline.set_completer_delims(' \t\n;')
+        readline.parse_and_bind('tab: complete')
+        readline.set_completer(path_complete)
+        _path_completer_installed = True
+    return readline
 
 
 class Color(object):
@@ -93,7 +196,237 @@ class Color(object):
         return '\033[{}m'.format(';'.join(map(str, codes)))
 
 
+# Consoles of a stream share a lock, so their messages don't interleave.
+_stream_locks = weakref.WeakKeyDictionary()
+_stream_locks_lock = threading.Lock()
+_buffered_consoles = weakref.WeakSet()
+""":type: weakref.WeakSet[Console]"""
+# Consoles which have resolved level methods, which are forgotten when colors or prefixes of their class change
+_resolved_consoles = weakref.WeakSet()
+""":type: weakref.WeakSet[Console]"""
+
+
+def _stream_lock(f):
+    """
+    :rtype: threading.RLock
+    """
+    if isinstance(f, ThreadRoutedStream):
+        f = f.stream
+    with _stream_locks_lock:
+        try:
+            lock = _stream_locks.get(f, None)
+            if lock is None:
+                lock = _stream_locks[f] = threading.RLock()
+        except TypeError:  # Not weakly referenceable
+            lock = threading.RLock()
+    return lock
+
+
+class _ThreadOutput(threading.local):
+
+    def __init__(self):
+        self.streams = None
+        """:type: dict[int, io.TextIOBase]"""
+        self.targets = None
+        """:type: (io.TextIOBase, io.TextIOBase)"""
+
+
+_thread_output = _ThreadOutput()
+
+
+class ThreadRoutedStream(object):
+    """
+    Replacement of `sys.stdout` or `sys.stderr`, which writes to the stream of current thread if it's redirected by
+    `redirect_thread_output`.
+    """
+
+    def __init__(self, stream):
+        """
+        :type stream: io.TextIOBase
+        """
+        self.stream = stream
+
+    def _target(self):
+        """
+        :rtype: io.TextIOBase
+        """
+        streams = _thread_output.streams
+        return streams.get(id(self.stream), self.stream) if streams else self.stream
+
+    def write(self, data):
+        return self._target().write(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        self._target().flush()
+
+    def isatty(self):
+        return self._target().isatty()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+# Number of `redirect_thread_output` blocks running on any thread. `sys.stdout` and `sys.stderr` are replaced while
+# one of them is running.
+_active_redirects = 0
+_active_redirects_lock = threading.Lock()
+# Streams installed by `_routed_stream` by name, which are restored by `_restore_stream`
+_installed_streams = {}
+""":type: dict[str, ThreadRoutedStream]"""
+
+
+def _routed_stream(name):
+    """
+    :param name: 'stdout' or 'stderr'
+    :type name: str
+    :rtype: ThreadRoutedStream
+    """
+    stream = getattr(sys, name)
+    if not isinstance(stream, ThreadRoutedStream):
+        stream = _installed_streams[name] = ThreadRoutedStream(stream)
+        setattr(sys, name, stream)
+    return stream
+
+
+def _restore_stream(name):
+    """
+    Restore the stream replaced by `_routed_stream`, unless it's replaced by others again.
+
+    :param name: 'stdout' or 'stderr'
+    :type name: str
+    """
+    stream = _installed_streams.pop(name, None)
+    if stream is not None and getattr(sys, name) is stream:
+        setattr(sys, name, stream.stream)
+
+
+def thread_output():
+    """
+    :return: streams which stdout and stderr of current thread are redirected to, or `None`
+    :rtype: (io.TextIOBase, io.TextIOBase)
+    """
+    return _thread_output.targets
+
+
+@contextmanager
+def redirect_thread_output(stdout, stderr=None):
+    """
+    Redirect `sys.stdout` and `sys.stderr` of current thread, including consoles writing them, in the block.
+    Other threads are not affected. Output of subprocesses which inherit file descriptors isn't redirected.
+    `sys.stdout` and `sys.stderr` are replaced by `ThreadRoutedStream` until the last running block exits.
+
+    :type stdout: io.TextIOBase
+    :param stderr: default is `stdout`
+    :type stderr: io.TextIOBase
+    """
+    global _active_redirects
+    stderr = stderr or stdout
+    streams = {}
+    with _active_redirects_lock:
+        _active_redirects += 1
+        for routed_stream, target in ((_routed_stream('stdout'), stdout), (_routed_stream('stderr'), stderr)):
+            streams[id(routed_stream)] = streams[id(routed_stream.stream)] = target
+    previous_streams, previous_targets = _thread_output.streams, _thread_output.targets
+    _thread_output.streams, _thread_output.targets = streams, (stdout, stderr)
+    try:
+        yield
+    finally:
+        _thread_output.streams, _thread_output.targets = previous_streams, previous_targets
+        with _active_redirects_lock:
+            _active_redirects -= 1
+            if _active_redirects == 0:
+                _restore_stream('stdout')
+                _restore_stream('stderr')
+
+
+@atexit.register
+def flush_consoles():
+    """
+    Write messages of all buffered consoles, e.g. before forking.
+    """
+    for console in list(_buffered_consoles):
+        console.flush()
+
+
+OUTPUT_FORMATS = ('text', 'json')
+
+
+def _output_format_from_environ():
+    """
+    :return: `TASKR_CONSOLE_FORMAT`, or 'text' if it's not set or unknown
+    :rtype: str
+    """
+    output_format = os.environ.get('TASKR_CONSOLE_FORMAT', None) or 'text'
+    if output_format not in OUTPUT_FORMATS:
+        # It's read when taskr is imported, so don't fail the import.
+        warnings.warn('Unknown TASKR_CONSOLE_FORMAT: {}. Should be one of {}. Use text instead'.format(
+            output_format, ', '.join(OUTPUT_FORMATS)), RuntimeWarning)
+        return 'text'
+    return output_format
+
+
+# The formatted second of the last timestamp, which is reused in the same second
+_timestamp_second = (None, '')
+
+
+def _timestamp():
+    """
+    :return: current UTC time in ISO 8601 with milliseconds
+    :rtype: str
+    """
+    global _timestamp_second
+    now = time.time()
+    second, formatted_second = _timestamp_second
+    if int(now) != second:
+        second = int(now)
+        formatted_second = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(second))
+        _timestamp_second = (second, formatted_second)
+    return '{}.{:03d}Z'.format(formatted_second, int((now - second) * 1000))
+
+
+def _ignore_message(message, bar_width=0, bar_character='='):
+    """
+    Level method of suppressed levels.
+    """
+
+
+class _ConsoleType(type):
+    """
+    Makes consoles resolve level methods again when colors, prefixes or severities of levels of their class change.
+    """
+
+    def __setattr__(cls, name, value):
+        type.__setattr__(cls, name, value)
+        if name.endswith('_color') or name.endswith('_prefix') or name == 'level_severities':
+            for console in list(_resolved_consoles):
+                if isinstance(console, cls):
+                    console.forget_levels()
+
+
+@six.add_metaclass(_ConsoleType)
 class Console(object):
+    """
+    Writes messages of levels (e.g. `console.info(message)`) as colored text, or as JSON lines for log shippers.
+
+    A JSON line is an object of `time`, `level`, `task` (name of `executing_task` of `task_manager`) and `message`.
+    Levels less severe than `min_level` are suppressed, and their methods return at once without formatting anything.
+    Defaults of new consoles are class attributes, which are read from `TASKR_CONSOLE_FORMAT` and
+    `TASKR_CONSOLE_LEVEL`.
+    """
+
+    default_output_format = _output_format_from_environ()
+    default_min_level = os.environ.get('TASKR_CONSOLE_LEVEL', None) or None
+    task_manager = None
+    """:type: taskr.taskr.TaskManager"""
+    # Levels which are not here are as severe as info
+    level_severities = {'debug': 10, 'info': 20, 'warn': 30, 'error': 40}
+
+    debug_prefix = '[.]  '
+    debug_color = (Color.LIGHT_BLACK, False)
 
     error_prefix = '[x]  '
     error_color = (Color.RED, False)
@@ -113,30 +446,251 @@ class Console(object):
     warn_prefix = '[!!] '
     warn_color = (Color.YELLOW, False)
 
-    def __init__(self, f, write_line=True, color=True):
+    def __init__(self, f, write_line=True, color=True, buffered=False, buffer_size=65536, flush_interval=1.0,
+                 line_buffered=None, output_format=None, min_level=None, task_manager=None):
+        """
+        :param f: the stream to write
+        :param buffered: batch messages, and write them when the buffer is full, after `flush_interval`, or by `flush`
+        :param buffer_size: characters kept in the buffer before writing them
+        :param flush_interval: seconds a message is kept in the buffer at most. `None` means no limit
+        :param line_buffered: write each message at once even if it's buffered. default is whether `f` is a TTY
+        :param output_format: 'text' or 'json'. default is `default_output_format`
+        :param min_level: suppress levels less severe than this one. default is `default_min_level`
+        :param task_manager: whose executing task is written in JSON lines. default is `task_manager` of the class
+        :type f: io.TextIOBase
+        :type write_line: bool
+        :type color: bool
+        :type buffered: bool
+        :type buffer_size: int
+        :type flush_interval: float
+        :type line_buffered: bool
+        :type output_format: str
+        :type min_level: str
+        :type task_manager: taskr.taskr.TaskManager
+        """
+        self._resolved_levels = []
+        self._output_format = 'text'
+        self._min_level = None
         self.output_color = color
+        self.output_format = output_format or self.default_output_format
+        self.min_level = min_level or self.default_min_level
+        if task_manager is not None:
+            self.task_manager = task_manager
         self._output = f
         self._write_line = write_line
+        self._lock = _stream_lock(f)
+
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        isatty = getattr(f, 'isatty', None)
+        self._isatty = bool(isatty and isatty())
+        self.line_buffered = self._isatty if line_buffered is None else line_buffered
+        self._buffer = [] if buffered else None
+        """:type: list[str]"""
+        self._buffered_length = 0
+        self._flush_timer = None
+        """:type: threading.Timer"""
+        if buffered:
+            _buffered_consoles.add(self)
+
+    @property
+    def output_color(self):
+        """
+        :rtype: bool
+        """
+        return self._output_color
+
+    @output_color.setter
+    def output_color(self, output_color):
+        self._output_color = output_color
+        self.forget_levels()
+
+    @property
+    def output_format(self):
+        """
+        :return: 'text' or 'json'
+        :rtype: str
+        """
+        return self._output_format
+
+    @output_format.setter
+    def output_format(self, output_format):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError('Unknown output format: {}. Should be one of {}'.format(output_format,
+                                                                                      ', '.join(OUTPUT_FORMATS)))
+        self._output_format = output_format
+        self.forget_levels()
+
+    @property
+    def min_level(self):
+        """
+        :return: the least severe level which is written, or `None` for all levels
+        :rtype: str
+        """
+        return self._min_level
+
+    @min_level.setter
+    def min_level(self, min_level):
+        self._min_level = min_level
+        self.forget_levels()
+
+    def is_enabled(self, level):
+        """
+        :type level: str
+        :rtype: bool
+        """
+        if self._min_level is None:
+            return True
+        severities = self.level_severities
+        return severities.get(level, severities['info']) >= severities.get(self._min_level, severities['info'])
+
+    def forget_levels(self):
+        """
+        Resolve level methods (e.g. `info`) again. Colors and prefixes of levels are read when a level is used first,
+        so call it after changing them on a console. Changes on the class are found without it.
+        """
+        for level in self._resolved_levels:
+            self.__dict__.pop(level, None)
+        del self._resolved_levels[:]
 
     def __getattr__(self, name):
-        if name.endswith('_color') or name.endswith('_prefix'):
+        if name.startswith('_') or name.endswith('_color') or name.endswith('_prefix'):
             raise AttributeError("'{0}' object has no attribute '{1}'".format(self.__class__.__name__, name))
 
+        if not self.is_enabled(name):
+            func = _ignore_message
+        elif self._output_format == 'json':
+            func = self._json_level_method(name)
+        else:
+            func = self._text_level_method(name)
+        # Resolve it once. Later calls find it in the instance dict without calling `__getattr__`.
+        self.__dict__[name] = func
+        self._resolved_levels.append(name)
+        _resolved_consoles.add(self)
+        return func
+
+    def _text_level_method(self, name):
+        """
+        :type name: str
+        :rtype: callable
+        """
         color, light = getattr(self, '{0}_color'.format(name), (Color.CLEAR, False))
         prefix = getattr(self, '{0}_prefix'.format(name), '')
+        # What `show` writes, with a placeholder of the message
+        template = prefix.replace('{', '{{').replace('}', '}}') + '{0}'
+        if self.output_color:
+            template = Color.str(template, color, light=light)
+        if self._write_line:
+            template += '\n'
 
         def func(message, bar_width=0, bar_character='='):
-            self.show('{0}{1}'.format(prefix, message),
-                      foreground=color, light=light, bar_width=bar_width, bar_character=bar_character)
+            if bar_width != 0:
+                self.show('{0}{1}'.format(prefix, message),
+                          foreground=color, light=light, bar_width=bar_width, bar_character=bar_character)
+            else:
+                self._write(template.format(message))
         return func
 
+    def _json_level_method(self, name):
+        """
+        :type name: str
+        :rtype: callable
+        """
+        template = '{{{{"time": "{{}}", "level": {}, "task": {{}}, "message": {{}}}}}}\n'.format(json.dumps(name))
+
+        # noinspection PyUnusedLocal
+        def func(message, bar_width=0, bar_character='='):
+            self._write(template.format(_timestamp(), json.dumps(self._task_name()),
+                                        json.dumps(six.text_type(message))))
+        return func
+
+    def _task_name(self):
+        """
+        :return: name of the executing task of current thread
+        :rtype: str
+        """
+        task_object = self.task_manager.executing_task if self.task_manager is not None else None
+        return task_object.name if task_object is not None else None
+
     def show(self, message, foreground=-1, background=-1, light=False, bar_width=0, bar_character='='):
+        if self._output_format == 'json':
+            # It has no level
+            self._json_level_method(None)(message)
+            return
         if bar_width != 0:
             message = self.bar(message, bar_width, bar_character)
         output_str = Color.str(message, foreground, background, light) if self.output_color else message
         if self._write_line:
             output_str += '\n'
-        self._output.write(output_str)
+        self._write(output_str)
+
+    def _write(self, output_str):
+        """
+        :type output_str: str
+        """
+        streams = _thread_output.streams
+        if streams and id(self._output) in streams:
+            # Redirected by `redirect_thread_output`. The stream of the thread is not shared, so it's not buffered here.
+            streams[id(self._output)].write(output_str)
+            return
+        with self._lock:
+            if self._buffer is None:
+                self._write_output(output_str)
+                return
+            self._buffer.append(output_str)
+            self._buffered_length += len(output_str)
+            if self.line_buffered or self._buffered_length >= self.buffer_size:
+                self._flush()
+            elif self.flush_interval is not None and self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def _write_output(self, output_str):
+        """
+        Write to the stream. Messages on a terminal are written above progress bars. The lock should be held.
+
+        :type output_str: str
+        """
+        display = _progress_display
+        if display is not None and self._isatty:
+            display.write_above(self._output, output_str)
+        else:
+            self._output.write(output_str)
+
+    def _flush(self):
+        """
+        Write buffered messages. The lock should be held.
+        """
+        if self._buffer:
+            output_str = ''.join(self._buffer)
+            del self._buffer[:]
+            self._buffered_length = 0
+            self._write_output(output_str)
+            flush = getattr(self._output, 'flush', None)
+            if flush:
+                flush()
+        if self._flush_timer is not None:
+            if self._flush_timer is not threading.current_thread():
+                self._flush_timer.cancel()
+            self._flush_timer = None
+
+    def flush(self):
+        """
+        Write buffered messages now.
+        """
+        with self._lock:
+            self._flush()
+
+    def progress(self, label='', total=None, **kwargs):
+        """
+        A progress bar on the stream of this console. See `Progress`.
+
+        :type label: str
+        :type total: int
+        :rtype: Progress
+        """
+        return Progress(label, total, output=self._output, **kwargs)
 
     @staticmethod
     def bar(message, width=120, character='='):
@@ -157,6 +711,8 @@ class Console(object):
         if has_default:
             message_components.append('[{0}]'.format(default))
         message = ''.join(message_components).strip() + ': '
+        self.flush()
+        install_path_completer()
 
         while True:
             has_result = True
@@ -187,3 +743,395 @@ class Console(object):
                 # Return rt repeat
                 if not repeat_until_valid or has_result:
                     return result
+
+
+# Progress -------------------------------------------------------------------------------------------------------------
+
+def format_duration(seconds):
+    """
+    >>> print(format_duration(75.2))
+    1:15
+    >>> print(format_duration(3725))
+    1:02:05
+
+    :type seconds: float
+    :rtype: str
+    """
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+    return '{}:{:02d}'.format(minutes, seconds)
+
+
+def _format_number(value):
+    """
+    >>> print(_format_number(950), _format_number(12345), _format_number(3.2e7), _format_number(0.25))
+    950 12.3k 32.0M 0.25
+
+    :type value: int|float
+    :rtype: str
+    """
+    for suffix in ('', 'k', 'M', 'G'):
+        if abs(value) < 999.5:
+            break
+        value /= 1000
+    if suffix:
+        return '{:.1f}{}'.format(value, suffix)
+    return '{}'.format(value) if isinstance(value, six.integer_types) else '{:.3g}'.format(value)
+
+
+def _terminal_width(output):
+    """
+    :type output: io.TextIOBase
+    :rtype: int
+    """
+    try:
+        import fcntl
+        import struct
+        import termios
+        return struct.unpack(str('hh'), fcntl.ioctl(output.fileno(), termios.TIOCGWINSZ, b'\0' * 4))[1] or 80
+    except Exception:
+        return 80
+
+
+class _ProgressDisplay(object):
+    """
+    Live lines of progress bars at the bottom of the terminal. Lines are redrawn in place, and messages of consoles
+    are written above them.
+    """
+
+    interval = 0.1
+
+    def __init__(self, output):
+        """
+        :type output: io.TextIOBase
+        """
+        self.output = output
+        self.bars = []
+        """:type: list[Progress]"""
+        self._line_count = 0
+        self._drawn_at = 0.0
+
+    def add(self, bar):
+        """
+        Nested bars are drawn below their parents.
+
+        :type bar: Progress
+        """
+        with _progress_lock:
+            idx = len(self.bars)
+            if bar.parent in self.bars:
+                idx = self.bars.index(bar.parent) + 1
+                while idx < len(self.bars) and bar.parent in self.bars[idx].ancestors():
+                    idx += 1
+            self.bars.insert(idx, bar)
+            self._draw()
+
+    def remove(self, bar):
+        """
+        :type bar: Progress
+        """
+        global _progress_display
+        with _progress_lock:
+            self.bars.remove(bar)
+            self._draw(bar.line(_terminal_width(self.output) - 1) + '\n' if bar.leave else '')
+            if not self.bars and _progress_display is self:
+                _progress_display = None
+
+    def refresh(self, now):
+        """
+        Redraw if it's not drawn in `interval` seconds.
+
+        :type now: float
+        """
+        if now - self._drawn_at >= self.interval:
+            with _progress_lock:
+                if now - self._drawn_at >= self.interval:
+                    self._draw()
+
+    def write_above(self, output, output_str):
+        """
+        :type output: io.TextIOBase
+        :type output_str: str
+        """
+        with _progress_lock:
+            self._erase()
+            output.write(output_str)
+            output.flush()
+            self._line_count = 0
+            self._draw()
+
+    def _erase(self):
+        if self._line_count:
+            self.output.write('\r\033[{}A\033[J'.format(self._line_count))
+            self.output.flush()
+
+    def _draw(self, above=''):
+        """
+        :param above: finished lines written above bars
+        :type above: str
+        """
+        width = _terminal_width(self.output) - 1
+        erase = '\r\033[{}A\033[J'.format(self._line_count) if self._line_count else ''
+        lines = ''.join(bar.line(width) + '\n' for bar in self.bars)
+        self.output.write(erase + above + lines)
+        self.output.flush()
+        self._line_count = len(self.bars)
+        self._drawn_at = default_timer()
+
+
+# Bars of all terminal streams are drawn by one display, since stdout and stderr are usually the same terminal.
+_progress_display = None
+""":type: _ProgressDisplay"""
+_progress_lock = threading.RLock()
+
+
+class _ProgressStack(threading.local):
+
+    def __init__(self):
+        self.bars = []
+        """:type: list[Progress]"""
+
+
+_progress_stack = _ProgressStack()
+
+# Running bars, which the ticker makes read the clock when they haven't for an interval
+_running_progress = set()
+""":type: set[Progress]"""
+_progress_ticker = None
+""":type: threading.Thread"""
+
+
+def _tick_progress():
+    """
+    Bars read the clock after as many updates as their recent rate takes for half an interval. When a loop slows down,
+    that count would take much longer, so a bar which hasn't read the clock for an interval checks on its next update.
+    """
+    global _progress_ticker
+    while True:
+        time.sleep(Progress.interval)
+        with _progress_lock:
+            if not _running_progress:
+                _progress_ticker = None
+                return
+            now = default_timer()
+            for bar in _running_progress:
+                if now - bar._checked_at >= bar.interval:
+                    bar._next_count = 0
+
+
+class Progress(object):
+    """
+    Count, rate and ETA of a loop. `update` is cheap enough to call on every iteration: the clock is only read every
+    few updates, as many as it takes about `interval / 2`, and the bar is redrawn `interval` seconds apart at most.
+    If the loop slows down, the clock is read on the first update after `interval` seconds.
+
+    On a terminal, bars are redrawn in place. A bar created while another one of the same thread is running is nested
+    below it, and bars of other threads have their own lines. Otherwise a summary line is written every
+    `summary_interval` seconds and when it's closed.
+
+    >>> import io
+    >>> output = io.StringIO()
+    >>> with Progress('Copy', total=3, output=output) as progress:
+    ...     for _ in range(3):
+    ...         progress.update()
+    >>> print(output.getvalue().split(' ', 4)[:4])
+    ['Copy', '100%', '3/3', 'in']
+
+    Update a bar from one thread, or give each thread its own bar.
+    """
+
+    interval = 0.1
+    summary_interval = 10.0
+    bar_width = 20
+
+    def __init__(self, label='', total=None, output=None, unit='', leave=None, interval=None):
+        """
+        :param label: shown before the count
+        :param total: expected count, for the percentage and ETA
+        :param output: default is `sys.stderr`
+        :param unit: name of what's counted, e.g. 'files' or 'B'
+        :param leave: keep the last line of the bar on a terminal. default is True unless it's nested
+        :param interval: seconds between redraws, or between summary lines if it's not a terminal
+        :type label: str
+        :type total: int
+        :type output: io.TextIOBase
+        :type unit: str
+        :type leave: bool
+        :type interval: float
+        """
+        output = output or sys.stderr
+        if isinstance(output, ThreadRoutedStream):
+            output = output._target()
+        isatty = getattr(output, 'isatty', None)
+        self.isatty = bool(isatty and isatty())
+        self.output = output
+        self.label = label
+        self.total = total
+        self.unit = unit
+        self.count = 0
+        self.closed = False
+
+        self._stack = _progress_stack.bars
+        self.parent = self._stack[-1] if self._stack else None
+        """:type: Progress"""
+        self.leave = self.parent is None if leave is None else leave
+        self.interval = interval or (self.interval if self.isatty else self.summary_interval)
+
+        self.started_at = default_timer()
+        self.finished_at = None
+        self._checked_at = self.started_at
+        self._checked_count = 0
+        self._next_count = 1
+        self._rate = None
+        self._reported_at = self.started_at
+        self._display = None
+        """:type: _ProgressDisplay"""
+
+        self._stack.append(self)
+        global _progress_ticker
+        with _progress_lock:
+            _running_progress.add(self)
+            # A ticker of the parent process isn't running in forked children
+            if _progress_ticker is None or not _progress_ticker.is_alive():
+                _progress_ticker = threading.Thread(target=_tick_progress, name='taskr-progress')
+                _progress_ticker.daemon = True
+                _progress_ticker.start()
+        if self.isatty:
+            global _progress_display
+            with _progress_lock:
+                if _progress_display is None:
+                    _progress_display = _ProgressDisplay(output)
+                self._display = _progress_display
+                self._display.interval = min(self._display.interval, self.interval)
+                self._display.add(self)
+
+    def __repr__(self):
+        return '<Progress: {}>'.format(self.line())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def ancestors(self):
+        """
+        :rtype: list[Progress]
+        """
+        ancestors = []
+        parent = self.parent
+        while parent is not None:
+            ancestors.append(parent)
+            parent = parent.parent
+        return ancestors
+
+    @property
+    def rate(self):
+        """
+        :return: count per second, smoothed over recent updates while it's running
+        :rtype: float
+        """
+        if self.finished_at is None and self._rate is not None:
+            return self._rate
+        elapsed = (self.finished_at or default_timer()) - self.started_at
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def update(self, count=1):
+        """
+        :type count: int
+        """
+        self.count += count
+        if self.count >= self._next_count:
+            self._check()
+
+    def _check(self):
+        now = default_timer()
+        elapsed = now - self._checked_at
+        if elapsed <= 0:
+            self._next_count = self.count + 1
+            return
+        rate = (self.count - self._checked_count) / elapsed
+        self._rate = rate if self._rate is None else self._rate * 0.7 + rate * 0.3
+        self._checked_at, self._checked_count = now, self.count
+        # Read the clock again after about half an interval
+        self._next_count = self.count + max(int(rate * min(self.interval, 1.0) / 2), 1)
+
+        if self._display is not None:
+            self._display.refresh(now)
+        elif now - self._reported_at >= self.interval:
+            self._reported_at = now
+            self._write_summary()
+
+    def _write_summary(self):
+        with _stream_lock(self.output):
+            self.output.write(self.line() + '\n')
+            self.output.flush()
+
+    def line(self, width=None):
+        """
+        :param width: characters of the line at most
+        :type width: int
+        :rtype: str
+        """
+        unit = ' ' + self.unit if self.unit else ''
+        parts = ['  ' * len(self.ancestors()) + self.label] if self.label else []
+        if self.total:
+            fraction = min(self.count / self.total, 1.0)
+            if self.isatty:
+                filled = int(fraction * self.bar_width)
+                parts.append('[{}{}]'.format('#' * filled, '.' * (self.bar_width - filled)))
+            parts.append('{:3.0f}%'.format(fraction * 100))
+            parts.append('{}/{}{}'.format(_format_number(self.count), _format_number(self.total), unit))
+        else:
+            parts.append('{}{}'.format(_format_number(self.count), unit))
+
+        rate = self.rate
+        if self.finished_at is not None:
+            parts.append('in {}'.format(format_duration(self.finished_at - self.started_at)))
+        parts.append('{}{}/s'.format(_format_number(rate), unit))
+        if self.finished_at is None and self.total and rate > 0:
+            parts.append('ETA {}'.format(format_duration(max(self.total - self.count, 0) / rate)))
+        line = ' '.join(parts)
+        return line[:width] if width else line
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.finished_at = default_timer()
+        if self in self._stack:
+            self._stack.remove(self)
+        with _progress_lock:
+            _running_progress.discard(self)
+        if self._display is not None:
+            self._display.remove(self)
+        elif self.leave or self.finished_at - self._reported_at >= self.interval:
+            self._write_summary()
+
+
+def progress(iterable, label='', total=None, **kwargs):
+    """
+    Yield items of the iterable and count them by a `Progress`.
+
+    >>> import io
+    >>> output = io.StringIO()
+    >>> sum(progress(range(1000), 'Sum', output=output))
+    499500
+    >>> print(output.getvalue().split(' ', 3)[:3])
+    ['Sum', '100%', '1.0k/1.0k']
+
+    :param total: default is `len(iterable)` if it has
+    :type iterable: collections.Iterable
+    :type label: str
+    :type total: int
+    :param kwargs: other arguments of `Progress`
+    """
+    if total is None and hasattr(iterable, '__len__'):
+        total = len(iterable)
+    with Progress(label, total, **kwargs) as bar:
+        update = bar.update
+        for item in iterable:
+            yield item
+            update()
@@ -0,0 +1,157 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import threading
+
+from .cache import cache_dir, write_file_atomically
+from .contrib.filetools import md5
+
+
+def _walk_glob(pattern):
+    """
+    `glob.glob(pattern, recursive=True)` for Pythons whose `glob` doesn't support `**`. Like `glob`, hidden
+    directories are not matched by `**`.
+
+    :type pattern: str
+    :rtype: list[str]
+    """
+    head, separator, tail = pattern.partition('**')
+    if not separator:
+        return glob.glob(pattern)
+    tail = tail.lstrip('/' + os.sep)
+    matches = []
+    for directory in glob.glob(head) if glob.has_magic(head) else [head]:
+        for root, dir_names, file_names in os.walk(directory or os.curdir):
+            dir_names[:] = sorted(name for name in dir_names if not name.startswith('.'))
+            if not directory:
+                root = os.path.relpath(root)
+                root = '' if root == os.curdir else root
+            if tail:
+                matches.extend(_walk_glob(os.path.join(root, tail)))
+            else:
+                matches.extend(os.path.join(root, name) for name in file_names if not name.startswith('.'))
+    return matches
+
+
+def _glob(pattern):
+    """
+    :type pattern: str
+    :rtype: list[str]
+    """
+    try:
+        return glob.glob(pattern, recursive=True)
+    except TypeError:  # Python 2 and Python 3 before 3.5
+        return _walk_glob(pattern)
+
+
+def expand_input_patterns(patterns):
+    """
+    :param patterns: glob patterns. `**` matches directories recursively
+    :type patterns: list[str]
+    :rtype: list[str]
+    """
+    paths = set()
+    for pattern in patterns:
+        paths.update(path for path in _glob(os.path.expanduser(pattern)) if os.path.isfile(path))
+    return sorted(paths)
+
+
+class FingerprintStore(object):
+    """
+    Fingerprints of tasks which declared `Task.input_patterns` or `Task.output_paths`. A fingerprint covers the paths
+    and content of input files and the arguments of the task. A task is up to date if its fingerprint is the same as
+    the recorded one and all its outputs exist.
+    """
+
+    def __init__(self, path=None):
+        """
+        :type path: str
+        """
+        self.path = path or cache_dir('fingerprints.json')
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(task):
+        """
+        :type task: taskr.taskr.Task
+        :rtype: str
+        """
+        # Patterns are relative to the working directory
+        return '{}:{}'.format(os.getcwd(), task.name)
+
+    @staticmethod
+    def fingerprint(task):
+        """
+        :type task: taskr.taskr.Task
+        :rtype: str
+        """
+        hash_obj = hashlib.md5()
+        input_paths = expand_input_patterns(task.input_patterns)
+        for input_path in input_paths:
+            hash_obj.update(input_path.encode('utf-8'))
+            md5(input_path, hash_obj)
+
+        arguments = task.arguments
+        if isinstance(arguments, argparse.Namespace):
+            arguments = {key: value for key, value in vars(arguments).items() if key != '__instance__'}
+        hash_obj.update(json.dumps(arguments, sort_keys=True, default=repr).encode('utf-8'))
+        return hash_obj.hexdigest()
+
+    def _load(self):
+        """
+        :rtype: dict[str, str]
+        """
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def is_up_to_date(self, task, fingerprint):
+        """
+        :type task: taskr.taskr.Task
+        :type fingerprint: str
+        :rtype: bool
+        """
+        if not all(os.path.exists(os.path.expanduser(path)) for path in task.output_paths):
+            return False
+        with self._lock:
+            return self._load().get(self._key(task), None) == fingerprint
+
+    def record(self, task, fingerprint):
+        """
+        :type task: taskr.taskr.Task
+        :type fingerprint: str
+        """
+        with self._lock:
+            fingerprints = self._load()
+            fingerprints[self._key(task)] = fingerprint
+            write_file_atomically(self.path, json.dumps(fingerprints, indent=2, sort_keys=True).encode('utf-8'))
+
+    def invalidate(self, task):
+        """
+        :type task: taskr.taskr.Task
+        """
+        with self._lock:
+            fingerprints = self._load()
+            if fingerprints.pop(self._key(task), None) is not None:
+                write_file_atomically(self.path, json.dumps(fingerprints, indent=2, sort_keys=True).encode('utf-8'))
@@ -0,0 +1,130 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Interrupt a task which runs longer than its timeout.
+
+On the main thread (e.g. a dispatched task, or a task in a process pool), the task is interrupted by SIGALRM, so even
+blocking system calls are interrupted. On other threads, `TaskTimeout` is raised asynchronously in the thread, which
+happens when the thread runs Python code again. In both cases, processes started by `taskr.contrib.system.run` on
+that thread are terminated first, so a task waiting for a stuck command is woken up. They're started in their own
+sessions while a timeout is armed, so commands started by a shell are terminated too.
+"""
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import signal
+import threading
+from contextlib import contextmanager
+
+from .contrib.system import own_sessions, terminate_processes
+
+# Same as timeout(1) of coreutils
+TIMEOUT_EXIT_CODE = 124
+
+
+class TaskTimeout(BaseException):
+    """
+    Raised in a task which runs longer than its timeout. It's not an `Exception`, so `except Exception` in tasks
+    won't swallow it.
+    """
+
+    def __init__(self, task_name, seconds):
+        """
+        :type task_name: str
+        :type seconds: float
+        """
+        super(TaskTimeout, self).__init__(task_name, seconds)
+        self.task_name = task_name
+        self.seconds = seconds
+
+    def __str__(self):
+        return '{} timed out after {:g} seconds'.format(self.task_name, self.seconds)
+
+
+def _can_use_alarm():
+    """
+    :rtype: bool
+    """
+    return (hasattr(signal, 'setitimer') and isinstance(threading.current_thread(), threading._MainThread) and
+            signal.getitimer(signal.ITIMER_REAL)[0] == 0)
+
+
+@contextmanager
+def _alarm_timeout(task_name, seconds, grace_period):
+    thread_ident = threading.current_thread().ident
+
+    def handle_alarm(signum, frame):
+        terminate_processes(thread_ident, grace_period)
+        raise TaskTimeout(task_name, seconds)
+
+    previous_handler = signal.signal(signal.SIGALRM, handle_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        with own_sessions():
+            yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+@contextmanager
+def _thread_timeout(task_name, seconds, grace_period):
+    import ctypes
+    thread_ident = threading.current_thread().ident
+    lock = threading.Lock()
+    state = {'finished': False, 'expired': False}
+
+    def expire():
+        with lock:
+            if state['finished']:
+                return
+            state['expired'] = True
+            # It's raised when the thread runs Python code again, so set it before waking the thread up.
+            exception_type = type(str('TaskTimeout'), (TaskTimeout,), {
+                '__init__': lambda self: TaskTimeout.__init__(self, task_name, seconds),
+            })
+            ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_ident), ctypes.py_object(exception_type))
+        terminate_processes(thread_ident, grace_period)
+
+    timer = threading.Timer(seconds, expire)
+    timer.daemon = True
+    timer.start()
+    try:
+        with own_sessions():
+            yield
+    finally:
+        with lock:
+            state['finished'] = True
+            if state['expired']:
+                # The block may have finished before the thread ran Python code again, so the exception can be
+                # still pending. Clear it, or it would be raised later outside of the block.
+                ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_ident), None)
+        timer.cancel()
+
+
+def timeout(task_name, seconds, grace_period=5):
+    """
+    Raise `TaskTimeout` in the block if it runs longer than `seconds`.
+
+    :param task_name: name shown in the error
+    :param seconds: timeout of the block
+    :param grace_period: seconds to wait for terminated processes before killing them
+    :type task_name: str
+    :type seconds: float
+    :type grace_period: float
+    """
+    if _can_use_alarm():
+        return _alarm_timeout(task_name, seconds, grace_period)
+    return _thread_timeout(task_name, seconds, grace_period)
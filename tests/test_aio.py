@@ -0,0 +1,64 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import asyncio
+import time
+
+import pytest
+
+from taskr.taskr import TaskManager
+
+
+def test_cleanup_waits_for_running_regular_tasks():
+    manager = TaskManager()
+    events = []
+
+    @manager
+    @manager.set_exit_cleanup(lambda task: events.append('cleanup ' + task.name))
+    def blocking():
+        time.sleep(0.3)
+        events.append('blocking done')
+
+    @manager
+    @manager.set_exit_cleanup(lambda task: events.append('cleanup ' + task.name))
+    async def failing():
+        await asyncio.sleep(0.05)
+        raise ValueError('failed')
+
+    with pytest.raises(ValueError):
+        manager.run_concurrently(blocking, failing)
+    # The regular task finished normally, so only the failed task is cleaned up, after it.
+    assert events == ['blocking done', 'cleanup failing']
+
+
+def test_cleanup_of_cancelled_coroutines():
+    manager = TaskManager()
+    events = []
+
+    @manager
+    @manager.set_exit_cleanup(lambda task: events.append('cleanup ' + task.name))
+    async def sleeping():
+        await asyncio.sleep(10)
+
+    @manager
+    @manager.set_exit_cleanup(lambda task: events.append('cleanup ' + task.name))
+    def failing():
+        raise ValueError('failed')
+
+    with pytest.raises(ValueError):
+        manager.run_concurrently(sleeping, failing)
+    assert sorted(events) == ['cleanup failing', 'cleanup sleeping']
@@ -0,0 +1,85 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import importlib
+import os
+import sys
+
+from taskr.cache import TaskMetadataCache
+from taskr.taskr import TaskManager
+
+TASK_MODULE = '''
+def deploy(host, port=80):
+    """
+    :param host: where to deploy
+    """
+'''
+
+
+def _load_module(path, name):
+    if path.dirname not in sys.path:
+        sys.path.insert(0, path.dirname)
+    sys.modules.pop(name, None)
+    return importlib.import_module(name)
+
+
+def _metadata(module, cache_dir, help_text='Port'):
+    manager = TaskManager()
+    manager.metadata_cache = TaskMetadataCache(str(cache_dir))
+    task_object = manager.set_argument('--port', help=help_text, type=int, dest='port')(manager(module.deploy))
+    metadata = task_object.metadata
+    manager.metadata_cache.save()
+    return task_object, metadata
+
+
+def test_metadata_is_cached(tmpdir):
+    path = tmpdir.join('cached_tasks.py')
+    path.write(TASK_MODULE)
+    module = _load_module(path, 'cached_tasks')
+
+    task_object, metadata = _metadata(module, tmpdir.join('cache'))
+    assert not task_object.metadata_from_cache
+    task_object, cached_metadata = _metadata(module, tmpdir.join('cache'))
+    assert task_object.metadata_from_cache
+    assert cached_metadata == metadata
+
+
+def test_changed_argument_declarations_invalidate_metadata(tmpdir):
+    path = tmpdir.join('declared_tasks.py')
+    path.write(TASK_MODULE)
+    module = _load_module(path, 'declared_tasks')
+
+    _metadata(module, tmpdir.join('cache'), help_text='Port')
+    task_object, metadata = _metadata(module, tmpdir.join('cache'), help_text='Port to listen')
+    assert not task_object.metadata_from_cache
+    assert ('*', ('--port',), {'help': 'Port to listen', 'type': int, 'dest': 'port', 'default': 80}) in \
+        metadata['arguments']
+
+
+def test_changed_module_invalidates_metadata(tmpdir):
+    path = tmpdir.join('changed_tasks.py')
+    path.write(TASK_MODULE)
+    module = _load_module(path, 'changed_tasks')
+    _metadata(module, tmpdir.join('cache'))
+
+    path.write(TASK_MODULE.replace('where to deploy', 'host to deploy to'))
+    stat = os.stat(str(path))
+    os.utime(str(path), (stat.st_atime, stat.st_mtime + 10))
+    module = _load_module(path, 'changed_tasks')
+    task_object, metadata = _metadata(module, tmpdir.join('cache'))
+    assert not task_object.metadata_from_cache
+    assert metadata['arguments_description'] == {'host': 'host to deploy to'}
@@ -0,0 +1,83 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import io
+
+import six
+
+from taskr.contrib.cli import shell
+from taskr.taskr import TaskManager
+from taskr.terminal import Console
+
+
+def _run_shell(manager, commands, tmpdir, monkeypatch, lazy=False):
+    lines = iter(commands)
+
+    def fake_input(prompt):
+        try:
+            return next(lines)
+        except StopIteration:
+            raise EOFError
+
+    monkeypatch.setattr(six.moves, 'input', fake_input)
+    output = io.StringIO()
+    shell(manager, history_path=str(tmpdir.join('history')), lazy=lazy, console=Console(output, color=False))
+    return output.getvalue()
+
+
+def test_state_is_isolated_between_commands(tmpdir, monkeypatch):
+    manager = TaskManager()
+    seen = []
+
+    @manager
+    def first(value='default'):
+        manager.exit_code = 3
+        seen.append(('first', value, manager.global_options.force))
+
+    @manager
+    def second():
+        seen.append(('second', manager.exit_code, manager.global_options.force, first.arguments))
+
+    parser = manager.parser
+    output = _run_shell(manager, ['--force first --value 1', 'second', 'first', 'unknown', 'second'],
+                        tmpdir, monkeypatch)
+    assert seen == [('first', '1', True), ('second', 0, False, {}), ('first', 'default', False),
+                    ('second', 0, False, {})]
+    assert [line.split('exit code ')[1] for line in output.splitlines()] == ['3', '0', '3', '1', '0']
+    # Argparsers are built once, so subparsers aren't added again
+    assert manager.parser is parser
+    assert sorted(manager.action_subparser.choices) == ['first', 'second']
+    assert manager.executing_task is None
+
+
+def test_failing_command_does_not_stop_shell(tmpdir, monkeypatch):
+    manager = TaskManager()
+    calls = []
+
+    @manager
+    def fail():
+        calls.append('fail')
+        raise ValueError('failed')
+
+    @manager
+    def work():
+        calls.append('work')
+
+    output = _run_shell(manager, ['fail', '"unclosed', 'work'], tmpdir, monkeypatch, lazy=True)
+    assert calls == ['fail', 'work']
+    assert 'No closing quotation' in output
+    assert output.splitlines()[-1].endswith('exit code 0')
@@ -0,0 +1,60 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import textwrap
+
+from taskr import completion
+
+_taskfile = textwrap.dedent('''
+    import os
+
+    from taskr.taskr import TaskManager
+
+    manager = TaskManager()
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'loads.log'), 'a') as f:
+        f.write('loaded\\n')
+
+
+    @manager
+    def build(target='all'):
+        pass
+''')
+
+
+def test_script_is_regenerated_for_another_shell_or_prog(tmpdir):
+    taskfile = str(tmpdir.join('taskfile.py'))
+    tmpdir.join('taskfile.py').write(_taskfile)
+    output = str(tmpdir.join('completion.sh'))
+    manager = completion.load_task_manager(taskfile)
+
+    assert completion.write_completion_script(manager, 'bash', output, ['taskfile.py'], taskfile)
+    assert not completion.write_completion_script(manager, 'bash', output, ['taskfile.py'], taskfile)
+    assert completion.write_completion_script(manager, 'zsh', output, ['taskfile.py'], taskfile)
+    assert 'bashcompinit' in tmpdir.join('completion.sh').read()
+    assert completion.write_completion_script(manager, 'zsh', output, ['tf'], taskfile)
+    assert 'complete -o default -F _taskr_complete_tf tf' in tmpdir.join('completion.sh').read()
+
+
+def test_current_script_does_not_load_taskfile(tmpdir):
+    taskfile = str(tmpdir.join('taskfile.py'))
+    tmpdir.join('taskfile.py').write(_taskfile)
+    args = ['bash', taskfile, '--output', str(tmpdir.join('completion.sh'))]
+
+    assert completion.main(args) == 0
+    assert completion.main(args) == 0
+    assert tmpdir.join('loads.log').read() == 'loaded\n'
+    assert '--target' in tmpdir.join('completion.sh').read()
@@ -0,0 +1,115 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+from taskr import daemon
+from taskr.taskr import TaskManager
+
+pytestmark = pytest.mark.skipif(not hasattr(socket.socket, 'sendmsg'), reason='sendmsg is not available')
+
+_taskfile = textwrap.dedent('''
+    from taskr import task
+
+
+    @task
+    def hello(name='world'):
+        print('hello', name)
+
+
+    if __name__ == '__main__':
+        task.dispatch()
+''')
+
+
+def _environ():
+    environ = dict(os.environ)
+    environ['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.dirname(os.path.dirname(daemon.__file__)),
+                                                          environ.get('PYTHONPATH', None)]))
+    return environ
+
+
+def test_round_trip(tmpdir):
+    tmpdir.join('taskfile.py').write(_taskfile)
+    socket_path = str(tmpdir.join('taskfile.sock'))
+    server = subprocess.Popen([sys.executable, 'taskfile.py', '--serve', socket_path], cwd=str(tmpdir),
+                              env=_environ(), stderr=subprocess.PIPE)
+    try:
+        deadline = time.time() + 10
+        while not os.path.exists(socket_path) and time.time() < deadline:
+            time.sleep(0.05)
+        assert oct(os.stat(socket_path).st_mode & 0o777) == oct(0o600)
+
+        client = subprocess.Popen([sys.executable, '-m', 'taskr.daemon', socket_path, 'hello', '--name', 'daemon'],
+                                  cwd=str(tmpdir), env=_environ(), stdout=subprocess.PIPE)
+        stdout, _ = client.communicate()
+        assert client.returncode == 0
+        assert stdout.decode('utf-8') == 'hello daemon\n'
+    finally:
+        server.send_signal(signal.SIGINT)
+        server.communicate()
+    assert not os.path.exists(socket_path)
+
+
+def test_refuse_to_replace_other_files(tmpdir):
+    path = tmpdir.join('taskfile.sock')
+    path.write('data')
+    with pytest.raises(OSError):
+        daemon.serve(TaskManager(), str(path))
+    assert path.read() == 'data'
+
+
+class _GoneClient(object):
+
+    def recv(self, size):
+        return b''
+
+
+def test_no_interrupt_after_finished():
+    invocation = daemon._Invocation(TaskManager(), _GoneClient(), lazy=False)
+    invocation.finished = True
+    invocation._watch_client()
+    # An interrupt would be raised by the next Python code of the main thread
+    time.sleep(0.01)
+
+
+def test_arguments_are_not_left_for_later_requests():
+    manager = TaskManager()
+    seen = []
+
+    @manager
+    def hello(name='world'):
+        seen.append(dict(hello.arguments))
+
+    @manager
+    def check():
+        seen.append(dict(hello.arguments))
+
+    assert manager._dispatch_for_exit_code(['hello', '--name', 'a'], False) == 0
+    thread = threading.Thread(target=manager._dispatch_for_exit_code, args=(['check'], False))
+    thread.start()
+    thread.join()
+    assert seen == [{'name': 'a'}, {}]
@@ -0,0 +1,212 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import pytest
+
+from taskr.taskr import TaskManager
+
+
+def _manager_with_main_task(calls):
+    manager = TaskManager()
+
+    @manager
+    @manager.main
+    def build(force=False, jobs=1):
+        calls.append(('build', force, jobs))
+
+    @manager
+    def clean():
+        calls.append(('clean', manager.global_options.force, manager.global_options.jobs))
+
+    return manager
+
+
+def test_options_of_main_task_are_not_taken_by_global_options():
+    calls = []
+    manager = _manager_with_main_task(calls)
+    manager.dispatch(['--force'], keep_running_after_finished=True)
+    manager.dispatch(['--jobs', '3'], keep_running_after_finished=True)
+    manager.dispatch(['--force', '--jobs=3'], keep_running_after_finished=True)
+    assert calls == [('build', True, 1), ('build', False, 3), ('build', True, 3)]
+    assert not manager.global_options.force
+
+
+def test_global_options_before_action_name():
+    calls = []
+    manager = _manager_with_main_task(calls)
+    manager.dispatch(['--force', '--jobs', '3', 'clean'], keep_running_after_finished=True)
+    manager.dispatch(['--jobs', '3', 'build'], keep_running_after_finished=True)
+    assert calls == [('clean', True, 3), ('build', False, 1)]
+
+
+def test_global_options_without_main_task():
+    calls = []
+    manager = TaskManager()
+
+    @manager
+    def clean():
+        calls.append(manager.global_options.jobs)
+
+    manager.dispatch(['--jobs', '3', 'clean'], keep_running_after_finished=True)
+    assert calls == [3]
+
+
+def test_split_global_arguments():
+    calls = []
+    manager = TaskManager()
+
+    @manager
+    def clean(force=False):
+        calls.append(force)
+
+    split = manager._split_global_arguments
+    assert split(['--jobs', '3', '--force', 'clean', '--force']) == (['--jobs', '3', '--force'], ['clean', '--force'])
+    assert split(['--jobs=3', 'clean']) == (['--jobs=3'], ['clean'])
+    # Global options are only taken before the action name
+    assert split(['clean', '--jobs', '3']) == ([], ['clean', '--jobs', '3'])
+    # An unknown option ends global options
+    assert split(['--force', '--unknown', 'clean']) == (['--force'], ['--unknown', 'clean'])
+    assert split([]) == ([], [])
+
+    manager.dispatch(['--force', 'clean'], keep_running_after_finished=True)
+    assert calls == [False]
+    assert manager.global_options.force
+
+
+def test_split_global_arguments_with_main_task():
+    manager = _manager_with_main_task([])
+    split = manager._split_global_arguments
+    # They would be taken by the main task
+    assert split(['--force']) == ([], ['--force'])
+    assert split(['--force', '--jobs=2']) == ([], ['--force', '--jobs=2'])
+    # An action name is given, so they're global options
+    assert split(['--force', 'clean']) == (['--force'], ['clean'])
+
+
+@pytest.mark.parametrize('args', [['--jobs', '2', 'first', '1'], ['--jobs=2', 'first', '1', '--option=x']])
+def test_lazy_dispatch_builds_selected_parser_only(args):
+    manager = TaskManager()
+    values = []
+
+    @manager
+    def first(value, option=None):
+        values.append((value, manager.global_options.jobs))
+
+    @manager
+    def second():
+        pass
+
+    manager.dispatch(args, keep_running_after_finished=True, lazy=True)
+    assert values == [('1', 2)]
+    assert second.parser is None
+
+
+def test_lazy_dispatch_help_lists_all_tasks(capsys):
+    manager = TaskManager()
+
+    @manager
+    def first():
+        pass
+
+    @manager
+    def second():
+        pass
+
+    with pytest.raises(SystemExit):
+        manager.dispatch(['--help'], lazy=True)
+    out = capsys.readouterr()[0]
+    assert 'first' in out and 'second' in out
+
+    with pytest.raises(SystemExit) as e:
+        manager.dispatch(['--jobs', 'many', 'first'], lazy=True)
+    assert e.value.code == 1
+    assert 'error' in capsys.readouterr()[0]
+
+
+def test_aliases_can_be_appended():
+    manager = TaskManager()
+    calls = []
+
+    @manager
+    @manager.alias('b')
+    def build():
+        calls.append('build')
+
+    build.aliases.append('make')
+    assert build.aliases == ['b', 'make']
+    manager.dispatch(['make'], keep_running_after_finished=True)
+    assert calls == ['build']
+
+
+def test_repeated_matrix_keys_are_merged():
+    manager = TaskManager()
+    hosts = []
+
+    @manager
+    def deploy(host):
+        hosts.append(host)
+
+    with pytest.raises(SystemExit) as e:
+        manager.dispatch(['--matrix', 'host=a,b', '--matrix', 'host=c', 'deploy', '{host}'])
+    assert e.value.code == 0
+    assert sorted(hosts) == ['a', 'b', 'c']
+
+
+def test_matrix_keys_should_match_templates():
+    manager = TaskManager()
+    hosts = []
+
+    @manager
+    def deploy(host, region='us'):
+        hosts.append(host)
+
+    with pytest.raises(ValueError) as e:
+        manager.dispatch_matrix(['deploy', '{host}'], {'host': ['a'], 'port': ['80']})
+    assert 'port' in str(e.value)
+    with pytest.raises(ValueError) as e:
+        manager.dispatch_matrix(['deploy', '{host}', '--region', '{region}'], {'host': ['a', 'b']})
+    assert 'region' in str(e.value)
+    # Each value set should have the keys
+    with pytest.raises(ValueError) as e:
+        manager.dispatch_matrix(['deploy', '{host}'], [{'host': 'a'}, {'name': 'b'}])
+    assert 'host' in str(e.value)
+    assert hosts == []
+
+    with pytest.raises(SystemExit) as e:
+        manager.dispatch(['--matrix', 'host=a', 'deploy', '{host}', '--region', '{region}'])
+    assert e.value.code == 1
+    assert hosts == []
+
+
+@pytest.mark.parametrize('jobs', [1, 3])
+def test_dispatch_many(jobs):
+    manager = TaskManager()
+    seen = []
+
+    @manager
+    def deploy(host, fail=False):
+        # Arguments are kept for each thread
+        seen.append((host, deploy.arguments['host']))
+        if fail:
+            raise ValueError('failed')
+
+    exit_codes = manager.dispatch_many([['deploy', 'a'], ['deploy', 'b', '--fail'], ['deploy', 'c'], ['unknown']],
+                                       jobs=jobs, show_summary=False)
+    assert exit_codes[:3] == [0, 1, 0]
+    assert exit_codes[3] != 0
+    assert sorted(seen) == [('a', 'a'), ('b', 'b'), ('c', 'c')]
+    assert manager.exit_code == 0
@@ -0,0 +1,209 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import io
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from taskr.contrib.system import own_sessions, run
+from taskr.taskr import TaskManager
+from taskr.terminal import Console
+from taskr.uptodate import FingerprintStore
+from taskr.watchdog import TIMEOUT_EXIT_CODE
+
+
+def _build_manager(tmpdir, calls):
+    manager = TaskManager()
+    manager.fingerprints = FingerprintStore(str(tmpdir.join('fingerprints.json')))
+    tmpdir.join('a.txt').write('a')
+    tmpdir.join('b.txt').write('b')
+
+    def make_task(name):
+        def build():
+            calls.append((name, threading.current_thread().name))
+            tmpdir.join(name + '.out').write(name)
+        build.__name__ = str(name)
+        return manager(manager.outputs(str(tmpdir.join(name + '.out')))(
+            manager.inputs(str(tmpdir.join(name + '.txt')))(build)))
+
+    make_task('a')
+    make_task('b')
+
+    @manager
+    @manager.depends_on('a', 'b')
+    def c():
+        calls.append(('c', threading.current_thread().name))
+
+    return manager
+
+
+def _dispatch(manager, args):
+    with pytest.raises(SystemExit) as e:
+        manager.dispatch(args)
+    return e.value.code
+
+
+@pytest.mark.parametrize('jobs', ['1', '2'])
+def test_force_reaches_dependencies(tmpdir, jobs):
+    calls = []
+    manager = _build_manager(tmpdir, calls)
+    assert _dispatch(manager, ['--jobs', jobs, 'c']) == 0
+    assert sorted(name for name, _ in calls) == ['a', 'b', 'c']
+
+    del calls[:]
+    assert _dispatch(manager, ['--jobs', jobs, 'c']) == 0
+    assert [name for name, _ in calls] == ['c']
+
+    del calls[:]
+    assert _dispatch(manager, ['--force', '--jobs', jobs, 'c']) == 0
+    assert sorted(name for name, _ in calls) == ['a', 'b', 'c']
+    if jobs != '1':
+        # Dependencies really ran on worker threads
+        assert {thread for name, thread in calls if name != 'c'} != {threading.current_thread().name}
+
+
+def test_arguments_reach_worker_threads():
+    manager = TaskManager()
+    seen = []
+
+    @manager
+    def setup():
+        seen.append(main.arguments)
+
+    @manager
+    def other():
+        seen.append(main.arguments)
+
+    @manager
+    @manager.depends_on('setup', 'other')
+    def main(target='x'):
+        pass
+
+    assert _dispatch(manager, ['--jobs', '2', 'main', '--target', 'y']) == 0
+    assert seen == [{'target': 'y'}, {'target': 'y'}]
+
+
+def test_timeout_reaches_worker_threads():
+    manager = TaskManager()
+    finished = []
+
+    def make_task(name):
+        def sleep():
+            for _ in range(100):
+                time.sleep(0.05)
+            finished.append(name)
+        sleep.__name__ = str(name)
+        return manager(sleep)
+
+    make_task('a')
+    make_task('b')
+
+    @manager
+    @manager.depends_on('a', 'b')
+    def d():
+        finished.append('d')
+
+    started = time.time()
+    assert _dispatch(manager, ['--timeout', '1', '--jobs', '2', 'd']) == TIMEOUT_EXIT_CODE
+    assert time.time() - started < 4
+    assert finished == []
+
+
+def test_timeout_terminates_process_group():
+    manager = TaskManager()
+
+    @manager
+    def a():
+        # The shell forks sleep, which keeps the pipe open unless the whole process group is terminated
+        run('sh -c "sleep 30; true"')
+
+    @manager
+    def b():
+        run('sleep 30', capture_output=False)
+
+    @manager
+    @manager.depends_on('a', 'b')
+    def d():
+        pass
+
+    started = time.time()
+    assert _dispatch(manager, ['--timeout', '1', '--jobs', '2', 'd']) == TIMEOUT_EXIT_CODE
+    assert time.time() - started < 4
+
+
+def test_own_sessions_only_with_timeout():
+    # Without a timeout, commands stay in the process group of the terminal
+    assert run('ps -o pgid= -p $$ | cat')[0].strip() == str(os.getpgrp())
+    with own_sessions():
+        assert run('ps -o pgid= -p $$ | cat')[0].strip() != str(os.getpgrp())
+
+
+@pytest.mark.parametrize('jobs', ['1', '2'])
+def test_console_lines_of_dependencies(jobs):
+    manager = TaskManager()
+    stream = io.StringIO()
+    console = Console(stream, output_format='json', task_manager=manager)
+
+    @manager
+    def setup():
+        console.info('setting up')
+
+    @manager
+    def other():
+        console.info('other')
+
+    @manager
+    @manager.depends_on('setup', 'other')
+    def main():
+        console.info('main')
+
+    assert _dispatch(manager, ['--jobs', jobs, 'main']) == 0
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert sorted((line['task'], line['message']) for line in lines) == [
+        ('main', 'main'), ('other', 'other'), ('setup', 'setting up')]
+    assert manager.executing_task is main
+
+
+@pytest.mark.parametrize('jobs', ['1', '2'])
+@pytest.mark.parametrize('fail', [False, True])
+def test_dependencies_are_cleaned_up_after_selected_task(jobs, fail):
+    manager = TaskManager()
+    events = []
+
+    def cleanup(task):
+        events.append('cleanup ' + task.name)
+
+    @manager
+    @manager.set_exit_cleanup(cleanup)
+    def database():
+        events.append('database')
+
+    @manager
+    @manager.depends_on('database')
+    @manager.set_exit_cleanup(cleanup)
+    def migrate(fail=fail):
+        events.append('migrate')
+        if fail:
+            raise ValueError('failed')
+
+    assert _dispatch(manager, ['--jobs', jobs, 'migrate']) == (1 if fail else 0)
+    assert events[:3] == ['database', 'migrate', 'cleanup migrate']
+    assert events[-1] == 'cleanup database' and events.count('cleanup database') == 1
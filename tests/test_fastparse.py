@@ -0,0 +1,73 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import pytest
+
+from taskr.taskr import TaskManager
+
+_manager = TaskManager()
+
+
+@_manager
+def deploy(host, port=80, ratio=0.5, verbose=False, dry_run=True, label=None, mode='fast'):
+    """
+    :param host: host to deploy
+    :param port: port of the host
+    """
+
+
+_cases = [
+    ['web-1'],
+    ['web-1', '--port', '8080'],
+    ['web-1', '--port=8080', '--ratio', '0.25'],
+    ['--verbose', 'web-1'],
+    ['web-1', '--dry-run', '--verbose'],
+    ['web-1', '-l', 'blue'],
+    ['web-1', '--label=green', '--mode', 'slow'],
+    ['web-1', '--mode='],
+    ['web-1', '--port', '80', '--port', '443'],
+]
+
+
+def _argparse_values(task, args):
+    # noinspection PyProtectedMember
+    _manager._setup_argparsers([task])
+    values = vars(task.parser.parse_args(args))
+    values.pop('__instance__', None)
+    return values
+
+
+@pytest.mark.parametrize('args', _cases, ids=[' '.join(args) for args in _cases])
+def test_same_values_as_argparse(args):
+    namespace = deploy.parse_fast(args)
+    assert namespace is not None
+    values = vars(namespace)
+    values.pop('__instance__', None)
+    assert values == _argparse_values(deploy, args)
+
+
+@pytest.mark.parametrize('args', [
+    ['web-1', '--port', 'many'],
+    ['web-1', '--po', '80'],
+    ['web-1', '--', '--port'],
+    ['web-1', '--label', '-x'],
+    ['web-1', 'web-2'],
+    [],
+    ['--help'],
+])
+def test_left_to_argparse(args):
+    assert deploy.parse_fast(args) is None
@@ -0,0 +1,82 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+from contextlib import closing
+
+from taskr.history import TaskHistory, main
+from taskr.taskr import TaskManager
+
+
+def test_peak_rss_only_for_single_task_processes(tmpdir):
+    manager = TaskManager()
+    history = TaskHistory(str(tmpdir.join('history.sqlite3')), show_eta=False).install(manager)
+
+    @manager
+    def first():
+        pass
+
+    @manager
+    def second():
+        pass
+
+    manager.dispatch(['first'], keep_running_after_finished=True)
+    manager.dispatch(['second'], keep_running_after_finished=True)
+    with closing(history.connect()) as connection:
+        rows = connection.execute('SELECT task, peak_rss FROM task_runs ORDER BY id').fetchall()
+    assert [name for name, _ in rows] == ['first', 'second']
+    assert rows[0][1] > 0
+    assert rows[1][1] is None
+
+
+def test_run_id_per_dispatch(tmpdir):
+    manager = TaskManager()
+    history = TaskHistory(str(tmpdir.join('history.sqlite3')), show_eta=False).install(manager)
+
+    @manager
+    def first():
+        pass
+
+    @manager
+    def second():
+        pass
+
+    @manager
+    @manager.depends_on(first, second)
+    def both():
+        pass
+
+    manager.dispatch(['--jobs', '2', 'both'], keep_running_after_finished=True)
+    manager.reset_invocation_state()
+    manager.dispatch(['first'], keep_running_after_finished=True)
+    with closing(history.connect()) as connection:
+        rows = connection.execute('SELECT task, run_id FROM task_runs ORDER BY id').fetchall()
+    run_ids = {}
+    for name, run_id in rows:
+        run_ids.setdefault(run_id, set()).add(name)
+    assert sorted(run_ids.values(), key=len) == [{'first'}, {'first', 'second', 'both'}]
+    assert history.critical_path(history.latest_run_id())[-1][0] == 'both'
+
+
+def test_report_main(tmpdir, capsys):
+    path = str(tmpdir.join('history.sqlite3'))
+    assert main(['--file', path]) == 1
+
+    TaskHistory(path).record('run', 'build', {}, [], 10.0, 12.5, 0)
+    assert main(['--file', path]) == 0
+    out = capsys.readouterr()[0]
+    assert 'build' in out
+    assert '2.5s' in out
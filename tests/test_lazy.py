@@ -0,0 +1,85 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import sys
+
+import pytest
+
+from taskr.completion import completion_index
+from taskr.taskr import TaskManager
+
+_MODULE = '''
+calls = []
+
+
+def build(target, verbose=False):
+    calls.append((target, verbose))
+
+
+def prepare():
+    calls.append('prepare')
+'''
+
+
+@pytest.fixture
+def lazy_module(tmpdir, monkeypatch, request):
+    name = 'taskr_lazy_{}'.format(request.node.name.replace('[', '_').replace(']', ''))
+    tmpdir.join(name + '.py').write(_MODULE)
+    monkeypatch.syspath_prepend(str(tmpdir))
+    yield name
+    sys.modules.pop(name, None)
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_module_is_imported_when_invoked(lazy_module, lazy, capsys):
+    manager = TaskManager()
+    manager.register_lazy('build', lazy_module + '.build', help_text='Build a target', aliases=['b'])
+
+    with pytest.raises(SystemExit):
+        manager.dispatch(['--help'], lazy=lazy)
+    out = capsys.readouterr()[0]
+    assert 'build' in out and 'Build a target' in out
+    assert lazy_module not in sys.modules
+
+    manager.dispatch(['b', 'web', '--verbose'], keep_running_after_finished=True, lazy=lazy)
+    assert sys.modules[lazy_module].calls == [('web', True)]
+    build = manager._task_index()['build']
+    assert build.name == 'build'
+    assert build.aliases == ['b']
+    assert manager._task_index()['b'] is build
+
+
+def test_completion_lists_lazy_tasks_without_importing(lazy_module):
+    manager = TaskManager()
+    manager.register_lazy('build', lazy_module + '.build', aliases=['b'])
+    names = [task_names for task_names, _, _ in completion_index(manager)]
+    assert names == [['build', 'b']]
+    assert lazy_module not in sys.modules
+
+
+def test_dependency_on_lazy_task(lazy_module):
+    manager = TaskManager()
+    prepare = manager.register_lazy('prepare', lazy_module + '.prepare')
+    deployed = []
+
+    @manager
+    @manager.depends_on(prepare)
+    def deploy():
+        deployed.append(sys.modules[lazy_module].calls[:])
+
+    manager.dispatch(['deploy'], keep_running_after_finished=True)
+    assert deployed == [['prepare']]
@@ -0,0 +1,96 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import os
+
+from taskr import memo as memo_module
+from taskr.taskr import TaskManager
+
+
+def _memoized_task(calls, **kwargs):
+    manager = TaskManager()
+
+    @manager
+    @manager.memoize(**kwargs)
+    def square(x):
+        calls.append(x)
+        return x * x
+
+    return square
+
+
+def test_least_recently_used_values_are_evicted():
+    calls = []
+    square = _memoized_task(calls, maxsize=2)
+    assert [square(1), square(2), square(1), square(3)] == [1, 4, 1, 9]
+    # 2 is the least recently used one
+    square(1)
+    square(2)
+    assert calls == [1, 2, 3, 2]
+    assert (square.memo.hits, square.memo.misses) == (2, 4)
+
+
+def test_values_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(memo_module.time, 'time', lambda: now[0])
+    calls = []
+    square = _memoized_task(calls, ttl=10)
+    square(2)
+    now[0] += 5
+    square(2)
+    now[0] += 6
+    square(2)
+    assert calls == [2, 2]
+
+
+def test_invalidate(tmpdir):
+    calls = []
+    square = _memoized_task(calls, persistent=True, directory=str(tmpdir))
+    square(2)
+    square(3)
+    square.memo.invalidate(x=2)
+    square(2)
+    square(3)
+    assert calls == [2, 3, 2]
+
+
+def test_persistent_values_are_shared_and_limited(tmpdir):
+    calls = []
+    square = _memoized_task(calls, persistent=True, directory=str(tmpdir), max_disk_size=1024)
+    square(2)
+    assert _memoized_task(calls, persistent=True, directory=str(tmpdir))(2) == 4
+    assert calls == [2]
+
+    for x in range(3, 100):
+        square(x)
+    sizes = [os.path.getsize(str(path)) for path in tmpdir.listdir() if path.ext == '.pickle']
+    assert sum(sizes) <= 1024
+    # Only the least recently used ones are removed
+    assert len(sizes) >= 1024 // max(sizes) - 1
+    assert os.path.exists(square.memo._path(square.memo.key((99,), {})))
+
+
+def test_value_removed_while_reading_is_a_miss(tmpdir, monkeypatch):
+    calls = []
+    square = _memoized_task(calls, maxsize=0, persistent=True, directory=str(tmpdir))
+    square(2)
+
+    def utime(path, times):
+        raise OSError('removed')
+    monkeypatch.setattr(memo_module.os, 'utime', utime)
+    assert square(2) == 4
+    assert calls == [2, 2]
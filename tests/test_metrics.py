@@ -0,0 +1,118 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import socket
+
+import pytest
+from six.moves.urllib.request import urlopen
+
+from taskr.metrics import TaskMetrics
+from taskr.taskr import TaskManager
+from taskr.uptodate import FingerprintStore
+
+
+def _free_port():
+    sock = socket.socket()
+    try:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+    finally:
+        sock.close()
+
+
+def test_managers_share_http_server(monkeypatch):
+    monkeypatch.setenv('TASKR_METRICS_PORT', str(_free_port()))
+    managers = [TaskManager(), TaskManager()]
+    assert managers[0].metrics.server is managers[1].metrics.server
+
+    for name, manager in zip(('first', 'second'), managers):
+        def work():
+            pass
+        work.__name__ = str(name)
+        manager(work)
+        manager.dispatch([name], keep_running_after_finished=True)
+
+    url = 'http://127.0.0.1:{}/metrics'.format(managers[0].metrics.server.server_address[1])
+    body = urlopen(url).read().decode('utf-8')
+    assert 'taskr_task_runs_total{task="first"} 1' in body
+    assert 'taskr_task_runs_total{task="second"} 1' in body
+
+
+def _dispatch(manager, args):
+    with pytest.raises(SystemExit) as e:
+        manager.dispatch(args)
+    return e.value.code
+
+
+def test_failed_metrics_write_does_not_fail_task(tmpdir):
+    calls = []
+    manager = TaskManager()
+    manager.fingerprints = FingerprintStore(str(tmpdir.join('fingerprints.json')))
+    metrics = TaskMetrics(path=str(tmpdir.join('missing', 'metrics.prom'))).install(manager)
+
+    @manager
+    @manager.inputs(str(tmpdir.join('in.txt')))
+    @manager.outputs(str(tmpdir.join('out.txt')))
+    def build():
+        calls.append(True)
+        tmpdir.join('out.txt').write('out')
+
+    tmpdir.join('in.txt').write('in')
+    assert _dispatch(manager, ['build']) == 0
+    # The fingerprint was recorded, so the task is skipped now
+    assert _dispatch(manager, ['build']) == 0
+    assert calls == [True]
+
+    # Observations which couldn't be written are written later
+    tmpdir.join('missing').ensure(dir=True)
+    metrics.write()
+    assert 'taskr_task_runs_total{task="build"} 1' in tmpdir.join('missing', 'metrics.prom').read()
+
+
+def test_failed_post_hook_does_not_fail_task():
+    manager = TaskManager()
+    errors = []
+
+    def broken_hook(task, result, seconds):
+        raise RuntimeError('broken')
+
+    manager.add_hook('post', broken_hook)
+    manager.add_hook('error', lambda task, exception, seconds: errors.append(exception))
+
+    @manager
+    def work():
+        pass
+
+    assert _dispatch(manager, ['work']) == 0
+    assert errors == []
+
+
+def test_failed_pre_hook_fails_task():
+    manager = TaskManager()
+    calls = []
+
+    def broken_hook(task, args, kwargs):
+        raise RuntimeError('broken')
+
+    manager.add_hook('pre', broken_hook)
+
+    @manager
+    def work():
+        calls.append(True)
+
+    assert _dispatch(manager, ['work']) != 0
+    assert calls == []
@@ -0,0 +1,33 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import sys
+
+import pytest
+
+from taskr.profiling import profile
+
+
+@pytest.mark.skipif(sys.version_info < (3, 4), reason='tracemalloc is not available')
+def test_tracemalloc_report_of_block_without_allocations(tmpdir, monkeypatch):
+    import tracemalloc
+    # Nothing is traced when samples are taken
+    monkeypatch.setattr(tracemalloc, 'get_traced_memory', lambda: (0, 0))
+    path = tmpdir.join('task.tracemalloc.txt')
+    with profile('tracemalloc', str(path)):
+        pass
+    assert path.read().startswith('Current: ')
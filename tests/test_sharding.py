@@ -0,0 +1,70 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import os
+import subprocess
+import sys
+import textwrap
+
+from taskr import sharding
+
+_taskfile = textwrap.dedent('''
+    import os
+
+    from taskr import task
+
+
+    @task
+    def mark(item):
+        with open(os.path.join('marks', '{}.{}'.format(item, os.getpid())), 'w'):
+            pass
+
+
+    if __name__ == '__main__':
+        task.dispatch()
+''')
+
+
+def test_shards_in_processes_cover_each_item_once(tmpdir):
+    tmpdir.join('taskfile.py').write(_taskfile)
+    tmpdir.mkdir('marks')
+    items = ['item-{}'.format(idx) for idx in range(23)]
+    environ = dict(os.environ)
+    environ['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.dirname(os.path.dirname(sharding.__file__)),
+                                                          environ.get('PYTHONPATH', None)]))
+    count = 4
+    processes = [subprocess.Popen([sys.executable, 'taskfile.py', '--shard', '{}/{}'.format(index, count),
+                                   '--matrix', 'item=' + ','.join(items), 'mark', '{item}'],
+                                  cwd=str(tmpdir), env=environ, stdout=subprocess.PIPE)
+                 for index in range(1, count + 1)]
+    for process in processes:
+        process.communicate()
+        assert process.returncode == 0
+
+    marks = [name.rsplit('.', 1) for name in os.listdir(str(tmpdir.join('marks')))]
+    assert sorted(item for item, _ in marks) == sorted(items)
+    items_by_process = {}
+    for item, pid in marks:
+        items_by_process.setdefault(pid, []).append(item)
+    assert sorted(len(process_items) for process_items in items_by_process.values()) == [5, 6, 6, 6]
+
+
+def test_round_robin_without_durations():
+    keys = ['check {}'.format(idx) for idx in range(10)]
+    shards = sharding.assign_shards(keys, 3)
+    assert sorted(shards.count(shard) for shard in range(3)) == [3, 3, 4]
+    assert sharding.assign_shards(list(reversed(keys)), 3) == list(reversed(shards))
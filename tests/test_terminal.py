@@ -0,0 +1,215 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import glob
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from taskr.terminal import (Console, PathCompleter, Progress, ThreadRoutedStream, _output_format_from_environ,
+                            redirect_thread_output)
+
+
+def test_streams_are_restored_after_last_redirect():
+    stdout, stderr = sys.stdout, sys.stderr
+    outer, inner, other = io.StringIO(), io.StringIO(), io.StringIO()
+    with redirect_thread_output(outer):
+        assert isinstance(sys.stdout, ThreadRoutedStream)
+        with redirect_thread_output(inner):
+            print('inner')
+        print('outer')
+
+        def write_other():
+            with redirect_thread_output(other):
+                print('other')
+        thread = threading.Thread(target=write_other)
+        thread.start()
+        thread.join()
+        # Still redirected on this thread after another thread finished its block
+        assert isinstance(sys.stdout, ThreadRoutedStream)
+        print('outer again')
+    assert sys.stdout is stdout and sys.stderr is stderr
+    assert (outer.getvalue(), inner.getvalue(), other.getvalue()) == ('outer\nouter again\n', 'inner\n', 'other\n')
+
+
+def test_unknown_console_format_falls_back_to_text(monkeypatch):
+    monkeypatch.setenv('TASKR_CONSOLE_FORMAT', 'xml')
+    with pytest.warns(RuntimeWarning):
+        assert _output_format_from_environ() == 'text'
+    monkeypatch.setenv('TASKR_CONSOLE_FORMAT', 'json')
+    assert _output_format_from_environ() == 'json'
+
+
+def test_progress_reads_clock_after_loop_slowed_down():
+    output = io.StringIO()
+    with Progress('Slow', total=10, output=output, interval=0.05) as bar:
+        bar.update()
+        # As if the rate of a fast start estimated many more updates before reading the clock
+        bar._next_count = 10 ** 9
+        time.sleep(0.5)
+        bar.update()
+        assert bar._checked_count == 2
+
+
+def test_progress_summary_lines():
+    output = io.StringIO()
+    with Progress('Copy', total=4, output=output, unit='files', interval=0.05) as bar:
+        bar.update(2)
+        time.sleep(0.2)
+        bar.update(2)
+    lines = output.getvalue().splitlines()
+    assert lines[0].startswith('Copy 100% 4/4 files')
+    assert lines[-1].startswith('Copy 100% 4/4 files in ')
+    assert len(lines) == 2
+
+
+def test_nested_progress():
+    output = io.StringIO()
+    with Progress('Outer', output=output) as outer:
+        with Progress('Inner', total=2, output=output) as inner:
+            assert inner.parent is outer
+            assert not inner.leave
+            inner.update(2)
+            assert inner.line().startswith('  Inner 100% 2/2')
+        outer.update()
+    # Only the outer bar leaves a line
+    assert output.getvalue().startswith('Outer 1 ')
+    assert len(output.getvalue().splitlines()) == 1
+
+
+def test_console_level_filtering():
+    output = io.StringIO()
+    console = Console(output, color=False, min_level='warn')
+    console.debug('debug')
+    console.info('info')
+    console.warn('warn')
+    console.error('error')
+    # Levels which aren't known are as severe as info
+    console.success('success')
+    assert output.getvalue() == '[!!] warn\n[x]  error\n'
+
+    console.min_level = None
+    console.debug('debug')
+    assert output.getvalue().endswith('[.]  debug\n')
+
+
+def test_console_buffering():
+    output = io.StringIO()
+    console = Console(output, color=False, buffered=True, buffer_size=20, flush_interval=None, line_buffered=False)
+    console.info('one')
+    assert output.getvalue() == ''
+    console.info('two')
+    console.info('three')
+    # The buffer is full
+    assert output.getvalue() == '[i]  one\n[i]  two\n[i]  three\n'
+    console.info('four')
+    console.flush()
+    assert output.getvalue().endswith('[i]  four\n')
+
+
+def test_console_flush_interval():
+    output = io.StringIO()
+    console = Console(output, color=False, buffered=True, flush_interval=0.05, line_buffered=False)
+    console.info('later')
+    assert output.getvalue() == ''
+    deadline = time.time() + 5
+    while not output.getvalue() and time.time() < deadline:
+        time.sleep(0.01)
+    assert output.getvalue() == '[i]  later\n'
+
+
+def test_console_finds_class_level_changes(monkeypatch):
+    output = io.StringIO()
+    console = Console(output, color=False)
+    console.info('before')
+    monkeypatch.setattr(Console, 'info_prefix', '[info] ')
+    console.info('after')
+    assert output.getvalue() == '[i]  before\n[info] after\n'
+
+    class TestConsole(Console):
+        pass
+
+    test_console = TestConsole(output, color=False)
+    test_console.warn('before')
+    TestConsole.warn_prefix = '[warn] '
+    test_console.warn('after')
+    console.warn('base')
+    assert output.getvalue().endswith('[!!] before\n[warn] after\n[!!] base\n')
+
+
+def _complete_all(completer, text):
+    matches = []
+    while True:
+        match = completer(text, len(matches))
+        if match is None:
+            return matches
+        matches.append(match)
+
+
+def test_path_completer_matches_like_glob(tmpdir):
+    for name in ('alpha.txt', 'alpine', 'beta', '.hidden', 'al'):
+        tmpdir.join(name).write('', ensure=True)
+    tmpdir.join('alps', 'inner').write('', ensure=True)
+    completer = PathCompleter()
+    for text in ('', 'al', 'alp', 'alps/', 'alps/i', 'z', '.h'):
+        prefix = str(tmpdir.join(text)) if text else str(tmpdir) + os.sep
+        expected = sorted(glob.glob(prefix + '*'))
+        if text.startswith('.'):
+            expected = [str(tmpdir.join('.hidden'))]
+        assert _complete_all(completer, prefix) == expected
+    assert _complete_all(completer, str(tmpdir.join('missing', 'a'))) == []
+
+
+def test_path_completer_lists_directory_once(tmpdir, monkeypatch):
+    for idx in range(20):
+        tmpdir.join('file{:02d}'.format(idx)).write('')
+    listed = []
+    listdir = os.listdir
+    monkeypatch.setattr(os, 'listdir', lambda path: listed.append(path) or listdir(path))
+    completer = PathCompleter()
+
+    prefix = str(tmpdir.join('file'))
+    assert len(_complete_all(completer, prefix)) == 20
+    # Typed more in the same directory
+    assert _complete_all(completer, prefix + '1') == [prefix + '1{}'.format(idx) for idx in range(10)]
+    assert _complete_all(completer, prefix + '15') == [prefix + '15']
+    assert len(listed) == 1
+
+    # A changed directory is listed again
+    tmpdir.join('file15b').write('')
+    os.utime(str(tmpdir), (time.time() + 10, time.time() + 10))
+    assert _complete_all(completer, prefix + '15') == [prefix + '15', prefix + '15b']
+    assert len(listed) == 2
+
+
+def test_path_completer_keeps_recent_listings(tmpdir):
+    completer = PathCompleter(max_directories=2)
+    for name in ('a', 'b', 'c'):
+        tmpdir.join(name).ensure(dir=True)
+        completer.listing(str(tmpdir.join(name)))
+    assert list(completer._listings) == [str(tmpdir.join('b')), str(tmpdir.join('c'))]
+
+
+def test_path_completer_is_installed_lazily():
+    pytest.importorskip('readline')
+    code = 'import readline, taskr.terminal; print(readline.get_completer() is None)'
+    assert subprocess.check_output([sys.executable, '-c', code]).decode().strip() == 'True'
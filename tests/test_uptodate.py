@@ -0,0 +1,95 @@
+#
+# Copyright 2014-2015 sodastsai
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import unicode_literals, print_function, absolute_import, division
+
+import glob
+import os
+import sys
+
+import pytest
+
+from taskr.taskr import TaskManager
+from taskr.uptodate import FingerprintStore, _walk_glob, expand_input_patterns
+
+
+def _build_manager(tmpdir, calls):
+    manager = TaskManager()
+    manager.fingerprints = FingerprintStore(str(tmpdir.join('fingerprints.json')))
+
+    @manager
+    @manager.inputs(str(tmpdir.join('src', '**', '*.txt')))
+    @manager.outputs(str(tmpdir.join('out.txt')))
+    def build(mode='debug'):
+        calls.append(mode)
+        tmpdir.join('out.txt').write(mode)
+
+    return manager
+
+
+def _dispatch(manager, args):
+    with pytest.raises(SystemExit) as e:
+        manager.dispatch(args)
+    return e.value.code
+
+
+def test_skip_force_and_rebuild(tmpdir):
+    tmpdir.join('src', 'a.txt').write('a', ensure=True)
+    tmpdir.join('src', 'lib', 'b.txt').write('b', ensure=True)
+    calls = []
+    manager = _build_manager(tmpdir, calls)
+
+    assert _dispatch(manager, ['build']) == 0
+    assert _dispatch(manager, ['build']) == 0
+    assert calls == ['debug']
+
+    assert _dispatch(manager, ['--force', 'build']) == 0
+    assert calls == ['debug', 'debug']
+
+    # A changed input in a subdirectory
+    tmpdir.join('src', 'lib', 'b.txt').write('changed')
+    assert _dispatch(manager, ['build']) == 0
+    assert len(calls) == 3
+
+    # A missing output
+    tmpdir.join('out.txt').remove()
+    assert _dispatch(manager, ['build']) == 0
+    assert len(calls) == 4
+
+    # A new input
+    tmpdir.join('src', 'c.txt').write('c')
+    assert _dispatch(manager, ['build']) == 0
+    assert len(calls) == 5
+
+
+def test_fingerprints_depend_on_arguments(tmpdir):
+    tmpdir.join('src', 'a.txt').write('a', ensure=True)
+    calls = []
+    manager = _build_manager(tmpdir, calls)
+
+    assert _dispatch(manager, ['build', '--mode', 'release']) == 0
+    assert _dispatch(manager, ['build', '--mode', 'release']) == 0
+    assert _dispatch(manager, ['build', '--mode', 'debug']) == 0
+    assert calls == ['release', 'debug']
+
+
+def test_walk_glob_is_same_as_recursive_glob(tmpdir, monkeypatch):
+    for path in ('a.py', 'b.txt', 'pkg/c.py', 'pkg/sub/d.py', 'pkg/.hidden/e.py', '.f.py'):
+        tmpdir.join(*path.split('/')).write('', ensure=True)
+    monkeypatch.chdir(tmpdir)
+    for pattern in ('**/*.py', 'pkg/**/*.py', 'pkg/**', '*.py', str(tmpdir.join('**', '*.py'))):
+        expected = [path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)]
+        assert sorted(path for path in _walk_glob(pattern) if os.path.isfile(path)) == sorted(expected), pattern
+    assert expand_input_patterns(['pkg/**/*.py']) == [os.path.join('pkg', 'c.py'), os.path.join('pkg', 'sub', 'd.py')]